@@ -16,6 +16,7 @@ from app.models.school import School
 from app.models.student import Student
 from app.models.invoice import Invoice
 from app.models.payment import Payment
+from app.models.balance import SchoolBalance, StudentBalance
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,185 @@
+"""add_balance_tables
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Agrega los balances de colegios y estudiantes mantenidos por triggers.
+    
+    1. Tablas school_balances y student_balances (una fila por entidad)
+    2. Funciones y triggers sobre schools, students, invoices y payments
+    3. Carga de los balances de los datos existentes
+    """
+    
+    # ===== TABLAS =====
+    
+    op.create_table(
+        'school_balances',
+        sa.Column('school_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('schools.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('total_invoiced', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('total_paid', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('total_invoices', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_students', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'student_balances',
+        sa.Column('student_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('total_invoiced', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('total_paid', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('total_invoices', sa.Integer(), nullable=False, server_default='0'),
+    )
+    
+    # ===== FUNCIONES Y TRIGGERS =====
+    # (mismo SQL que app/models/balance.py al momento de esta migración)
+    
+    op.execute("""
+        CREATE OR REPLACE FUNCTION balances_on_school_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO school_balances (school_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION balances_on_student_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO student_balances (student_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active THEN
+                UPDATE school_balances SET active_students = active_students - 1 WHERE school_id = OLD.school_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active THEN
+                UPDATE school_balances SET active_students = active_students + 1 WHERE school_id = NEW.school_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION balances_on_invoice_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE student_balances
+                SET total_invoiced = total_invoiced - OLD.total_amount, total_invoices = total_invoices - 1
+                WHERE student_id = OLD.student_id;
+                UPDATE school_balances
+                SET total_invoiced = total_invoiced - OLD.total_amount, total_invoices = total_invoices - 1
+                WHERE school_id = OLD.school_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE student_balances
+                SET total_invoiced = total_invoiced + NEW.total_amount, total_invoices = total_invoices + 1
+                WHERE student_id = NEW.student_id;
+                UPDATE school_balances
+                SET total_invoiced = total_invoiced + NEW.total_amount, total_invoices = total_invoices + 1
+                WHERE school_id = NEW.school_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION balances_on_payment_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE student_balances SET total_paid = total_paid - OLD.amount WHERE student_id = OLD.student_id;
+                UPDATE school_balances SET total_paid = total_paid - OLD.amount WHERE school_id = OLD.school_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE student_balances SET total_paid = total_paid + NEW.amount WHERE student_id = NEW.student_id;
+                UPDATE school_balances SET total_paid = total_paid + NEW.amount WHERE school_id = NEW.school_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    
+    # Bloquear escrituras hasta el commit: la carga inicial y los triggers no se solapan
+    op.execute("LOCK TABLE schools, students, invoices, payments IN SHARE ROW EXCLUSIVE MODE")
+    
+    op.execute("""
+        CREATE TRIGGER trg_school_balances AFTER INSERT ON schools
+        FOR EACH ROW EXECUTE FUNCTION balances_on_school_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_student_balances AFTER INSERT OR DELETE OR UPDATE OF is_active, school_id ON students
+        FOR EACH ROW EXECUTE FUNCTION balances_on_student_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_invoice_balances AFTER INSERT OR DELETE OR UPDATE OF total_amount, student_id, school_id ON invoices
+        FOR EACH ROW EXECUTE FUNCTION balances_on_invoice_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_payment_balances AFTER INSERT OR DELETE OR UPDATE OF amount, student_id, school_id ON payments
+        FOR EACH ROW EXECUTE FUNCTION balances_on_payment_change()
+    """)
+    
+    # ===== CARGA INICIAL =====
+    
+    op.execute("""
+        INSERT INTO school_balances (school_id, total_invoiced, total_paid, total_invoices, active_students)
+        SELECT
+            s.id,
+            COALESCE(i.total_invoiced, 0),
+            COALESCE(p.total_paid, 0),
+            COALESCE(i.total_invoices, 0),
+            COALESCE(st.active_students, 0)
+        FROM schools s
+        LEFT JOIN (
+            SELECT school_id, SUM(total_amount) AS total_invoiced, COUNT(*) AS total_invoices
+            FROM invoices GROUP BY school_id
+        ) i ON i.school_id = s.id
+        LEFT JOIN (
+            SELECT school_id, SUM(amount) AS total_paid FROM payments GROUP BY school_id
+        ) p ON p.school_id = s.id
+        LEFT JOIN (
+            SELECT school_id, COUNT(*) AS active_students FROM students WHERE is_active GROUP BY school_id
+        ) st ON st.school_id = s.id
+    """)
+    op.execute("""
+        INSERT INTO student_balances (student_id, total_invoiced, total_paid, total_invoices)
+        SELECT
+            s.id,
+            COALESCE(i.total_invoiced, 0),
+            COALESCE(p.total_paid, 0),
+            COALESCE(i.total_invoices, 0)
+        FROM students s
+        LEFT JOIN (
+            SELECT student_id, SUM(total_amount) AS total_invoiced, COUNT(*) AS total_invoices
+            FROM invoices GROUP BY student_id
+        ) i ON i.student_id = s.id
+        LEFT JOIN (
+            SELECT student_id, SUM(amount) AS total_paid FROM payments GROUP BY student_id
+        ) p ON p.student_id = s.id
+    """)
+
+
+def downgrade() -> None:
+    """
+    Elimina los triggers, las funciones y las tablas de balances.
+    """
+    op.execute("DROP TRIGGER IF EXISTS trg_payment_balances ON payments")
+    op.execute("DROP TRIGGER IF EXISTS trg_invoice_balances ON invoices")
+    op.execute("DROP TRIGGER IF EXISTS trg_student_balances ON students")
+    op.execute("DROP TRIGGER IF EXISTS trg_school_balances ON schools")
+    op.execute("DROP FUNCTION IF EXISTS balances_on_payment_change()")
+    op.execute("DROP FUNCTION IF EXISTS balances_on_invoice_change()")
+    op.execute("DROP FUNCTION IF EXISTS balances_on_student_change()")
+    op.execute("DROP FUNCTION IF EXISTS balances_on_school_change()")
+    op.drop_table('student_balances')
+    op.drop_table('school_balances')
@@ -0,0 +1,79 @@
+"""add_invoice_paid_amount
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+# Facturas por lote del backfill (cada lote es una transacción corta)
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    """
+    Agrega invoices.paid_amount (suma de los pagos de cada factura).
+    
+    1. Columna con server_default 0 (sin reescribir la tabla en PostgreSQL 11+)
+    2. Backfill por lotes de facturas ordenadas por id, con commit por lote
+       para no mantener locks sobre toda la tabla
+    3. Check constraint paid_amount >= 0
+    """
+    op.add_column(
+        'invoices',
+        sa.Column('paid_amount', sa.Numeric(12, 2), nullable=False, server_default='0')
+    )
+    
+    # ===== BACKFILL =====
+    
+    backfill = sa.text("""
+        WITH batch AS (
+            SELECT id FROM invoices
+            WHERE id > :last_id
+            ORDER BY id
+            LIMIT :batch_size
+        ), paid AS (
+            SELECT batch.id, COALESCE(SUM(payments.amount), 0) AS paid_amount
+            FROM batch
+            LEFT JOIN payments ON payments.invoice_id = batch.id
+            GROUP BY batch.id
+        )
+        UPDATE invoices
+        SET paid_amount = paid.paid_amount
+        FROM paid
+        WHERE invoices.id = paid.id
+        RETURNING invoices.id
+    """)
+    
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id = '00000000-0000-0000-0000-000000000000'
+        while True:
+            ids = connection.execute(
+                backfill, {"last_id": last_id, "batch_size": BATCH_SIZE}
+            ).scalars().all()
+            if not ids:
+                break
+            last_id = max(ids)
+    
+    op.create_check_constraint(
+        'ck_invoice_paid_amount_non_negative',
+        'invoices',
+        'paid_amount >= 0'
+    )
+
+
+def downgrade() -> None:
+    """
+    Elimina invoices.paid_amount y su constraint.
+    """
+    op.drop_constraint('ck_invoice_paid_amount_non_negative', 'invoices', type_='check')
+    op.drop_column('invoices', 'paid_amount')
@@ -0,0 +1,59 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+# (nombre, tabla, columnas): mismo orden que los Keyset de los servicios, con id como
+# desempate, para que WHERE (a, b, id) < (...) ORDER BY a DESC, b DESC, id DESC sea
+# un recorrido del índice sin importar la profundidad de la página
+KEYSET_INDEXES = [
+    ('idx_school_created', 'schools', ['created_at', 'id']),
+    ('idx_student_created', 'students', ['created_at', 'id']),
+    ('idx_student_school_created', 'students', ['school_id', 'created_at', 'id']),
+    ('idx_invoice_created', 'invoices', ['created_at', 'id']),
+    ('idx_invoice_school_due_created', 'invoices', ['school_id', 'due_date', 'created_at', 'id']),
+    ('idx_invoice_student_due_created', 'invoices', ['student_id', 'due_date', 'created_at', 'id']),
+    ('idx_payment_invoice_date', 'payments', ['invoice_id', 'payment_date', 'id']),
+]
+
+# Reemplazados por los índices de los statements (son prefijos de ellos)
+REPLACED_INDEXES = [
+    ('idx_invoice_school_due', 'invoices'),
+    ('idx_invoice_student_due', 'invoices'),
+]
+
+
+def upgrade() -> None:
+    """
+    Agrega los índices compuestos de la paginación por cursor.
+    
+    Se crean con CONCURRENTLY (fuera de la transacción de la migración) para no
+    bloquear las escrituras sobre tablas grandes; después se eliminan los índices
+    de statements que quedaron cubiertos por los nuevos.
+    """
+    with op.get_context().autocommit_block():
+        for name, table, columns in KEYSET_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+        for name, table in REPLACED_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """
+    Restaura los índices de statements anteriores y elimina los de paginación por cursor.
+    """
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_invoice_school_due ON invoices(school_id, due_date DESC)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_invoice_student_due ON invoices(student_id, due_date DESC)")
+        for name, table, _ in reversed(KEYSET_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,48 @@
+"""add_invoice_listing_indexes
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+# (nombre, columnas) de los índices del listado de facturas: el filtro (school_id,
+# student_id, status) primero y las columnas del Keyset de cada orden al final, para
+# que cada combinación de filtros y orden sea un recorrido del índice sin JOIN ni Sort.
+# El filtro por estudiante con status usa idx_invoice_student_created (pocas filas por
+# estudiante); por vencimiento con school_id/student_id sirven los índices de 008.
+INVOICE_LISTING_INDEXES = [
+    ('idx_invoice_school_created', ['school_id', 'created_at', 'id']),
+    ('idx_invoice_school_status_created', ['school_id', 'status', 'created_at', 'id']),
+    ('idx_invoice_student_created', ['student_id', 'created_at', 'id']),
+    ('idx_invoice_status_created', ['status', 'created_at', 'id']),
+    ('idx_invoice_due_created', ['due_date', 'created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    """
+    Agrega los índices del listado de facturas por colegio, estudiante y estado.
+    
+    Se crean con CONCURRENTLY (fuera de la transacción de la migración) para no
+    bloquear las escrituras sobre invoices.
+    """
+    with op.get_context().autocommit_block():
+        for name, columns in INVOICE_LISTING_INDEXES:
+            op.create_index(name, 'invoices', columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """
+    Elimina los índices del listado de facturas.
+    """
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INVOICE_LISTING_INDEXES):
+            op.drop_index(name, table_name='invoices', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,42 @@
+"""add_payment_reference_index
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Agrega el índice de referencias bancarias por colegio, con el que la importación de
+    pagos detecta en una consulta por chunk las transacciones ya importadas.
+    
+    Parcial (solo pagos con referencia) y con CONCURRENTLY para no bloquear las
+    escrituras sobre payments.
+    """
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_payment_school_reference',
+            'payments',
+            ['school_id', 'payment_reference'],
+            postgresql_where=sa.text('payment_reference IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    """
+    Elimina el índice de referencias bancarias.
+    """
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_payment_school_reference', table_name='payments', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,89 @@
+"""add_billing_runs
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Soporte de las corridas de facturación recurrente:
+    
+    1. invoices.billing_period (nullable, sin default: no reescribe la tabla)
+    2. Los INSERT de facturas suman a los balances por sentencia en lugar de por fila:
+       una corrida de 100k facturas actualiza el balance del colegio una vez, no 100k
+    3. Índice único parcial (school_id, billing_period, student_id), con CONCURRENTLY
+    """
+    op.add_column('invoices', sa.Column('billing_period', sa.String(7), nullable=True))
+    
+    op.execute("""
+        CREATE OR REPLACE FUNCTION balances_on_invoice_insert() RETURNS trigger AS $$
+        BEGIN
+            UPDATE student_balances
+            SET total_invoiced = student_balances.total_invoiced + inserted_totals.total_invoiced,
+                total_invoices = student_balances.total_invoices + inserted_totals.total_invoices
+            FROM (
+                SELECT student_id, SUM(total_amount) AS total_invoiced, COUNT(*) AS total_invoices
+                FROM inserted GROUP BY student_id
+            ) AS inserted_totals
+            WHERE student_balances.student_id = inserted_totals.student_id;
+            UPDATE school_balances
+            SET total_invoiced = school_balances.total_invoiced + inserted_totals.total_invoiced,
+                total_invoices = school_balances.total_invoices + inserted_totals.total_invoices
+            FROM (
+                SELECT school_id, SUM(total_amount) AS total_invoiced, COUNT(*) AS total_invoices
+                FROM inserted GROUP BY school_id
+            ) AS inserted_totals
+            WHERE school_balances.school_id = inserted_totals.school_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS trg_invoice_balances ON invoices")
+    op.execute("""
+        CREATE TRIGGER trg_invoice_balances AFTER DELETE OR UPDATE OF total_amount, student_id, school_id ON invoices
+        FOR EACH ROW EXECUTE FUNCTION balances_on_invoice_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_invoice_balances_insert AFTER INSERT ON invoices
+        REFERENCING NEW TABLE AS inserted
+        FOR EACH STATEMENT EXECUTE FUNCTION balances_on_invoice_insert()
+    """)
+    
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_invoice_school_period_student',
+            'invoices',
+            ['school_id', 'billing_period', 'student_id'],
+            unique=True,
+            postgresql_where=sa.text('billing_period IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    """
+    Restaura el trigger de facturas por fila y elimina billing_period.
+    """
+    with op.get_context().autocommit_block():
+        op.drop_index('uq_invoice_school_period_student', table_name='invoices', postgresql_concurrently=True, if_exists=True)
+    
+    op.execute("DROP TRIGGER IF EXISTS trg_invoice_balances_insert ON invoices")
+    op.execute("DROP TRIGGER IF EXISTS trg_invoice_balances ON invoices")
+    op.execute("""
+        CREATE TRIGGER trg_invoice_balances AFTER INSERT OR DELETE OR UPDATE OF total_amount, student_id, school_id ON invoices
+        FOR EACH ROW EXECUTE FUNCTION balances_on_invoice_change()
+    """)
+    op.execute("DROP FUNCTION IF EXISTS balances_on_invoice_insert()")
+    op.drop_column('invoices', 'billing_period')
@@ -1,9 +1,20 @@
 from fastapi import APIRouter
 from app.api.routes import schools, students, invoices
+from app.core.config import settings
+
+# Versiones async de las rutas (mismas rutas y métodos, AsyncSession y redis.asyncio)
+async_api_router = APIRouter()
+async_api_router.include_router(schools.async_router, prefix="/schools", tags=["schools"])
+async_api_router.include_router(students.async_router, prefix="/students", tags=["students"])
+async_api_router.include_router(invoices.async_router, prefix="/invoices", tags=["invoices"])
 
 api_router = APIRouter()
 
+# Con ASYNC_DB_ENABLED las rutas se atienden primero por las versiones async;
+# sin la bandera se usan los routers síncronos
+if settings.ASYNC_DB_ENABLED:
+    api_router.include_router(async_api_router)
+
 api_router.include_router(schools.router, prefix="/schools", tags=["schools"])
 api_router.include_router(students.router, prefix="/students", tags=["students"])
 api_router.include_router(invoices.router, prefix="/invoices", tags=["invoices"])
-
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import json
 from uuid import UUID
-from app.core.database import get_db
-from app.schemas.invoice import Invoice, InvoiceCreate, InvoiceUpdate
-from app.schemas.payment import Payment, PaymentCreate
+from app.core.database import get_db, get_async_db, get_read_db, get_async_read_db
+from app.schemas.invoice import (
+    Invoice, InvoiceCreate, InvoiceUpdate, InvoiceInclude, InvoiceSort, InvoiceBulkError, InvoiceBulkResult
+)
+from app.schemas.payment import Payment, PaymentCreate, PaymentImportRow, PaymentImportError, PaymentImportResult
 from app.schemas.pagination import PaginatedResponse
-from app.services.invoice_service import InvoiceService
+from app.services.invoice_service import InvoiceService, AsyncInvoiceService, INVOICE_KEYSETS, PAYMENT_KEYSET
+from app.services.school_service import SchoolService, AsyncSchoolService
 from app.models.invoice import InvoiceStatus
-from app.core.cache import invalidate_statements_for_invoice, invalidate_statements_for_payment
 from app.core.config import settings
+from app.core.pagination import InvalidCursorError, TotalMode
+from app.core import async_cache
+from app.core.cache import get_entity_etag
+from app.core.etag import etag_matches
+from app.core.exceptions import format_validation_error
+from app.core.streaming import iter_records
 
 router = APIRouter()
 
@@ -23,16 +35,169 @@ def create_invoice(
     Crea una nueva factura.
     """
     try:
-        result = InvoiceService.create_invoice(db, invoice)
-        # Invalidar cache de statements relacionados
-        invalidate_statements_for_invoice(result.id, db)
-        return result
+        # El servicio actualiza los totales cacheados de los statements relacionados
+        return InvoiceService.create_invoice(db, invoice)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/bulk", response_model=InvoiceBulkResult)
+async def create_invoices_bulk(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Crea facturas en bloque (hasta BULK_INVOICE_MAX_ROWS por request).
+    
+    El cuerpo es un array JSON de facturas o NDJSON (Content-Type: application/x-ndjson,
+    una factura por línea), que se lee a medida que llega. Cada fila se valida por
+    separado: las inválidas se informan en errors con su posición y el resto se crea.
+    """
+    try:
+        rows, errors = await _read_bulk_invoices(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        created, insert_errors = await run_in_threadpool(InvoiceService.create_invoices_bulk, db, rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    errors = sorted(errors + insert_errors, key=lambda error: error.index)
+    return InvoiceBulkResult(created=created, failed=len(errors), errors=errors)
+
+
+async def _read_bulk_invoices(request: Request) -> Tuple[List[Tuple[int, InvoiceCreate]], List[InvoiceBulkError]]:
+    """
+    Lee las filas de la carga masiva y valida cada una con InvoiceCreate.
+    
+    Returns:
+        Tupla (filas válidas con su posición, errores de las filas mal formadas)
+    
+    Raises:
+        ValueError: Si el cuerpo no es un array JSON ni NDJSON, o supera BULK_INVOICE_MAX_ROWS
+    """
+    rows = []
+    errors = []
+    
+    def add(index: int, raw: Any):
+        if index >= settings.BULK_INVOICE_MAX_ROWS:
+            raise ValueError(f"Too many invoices: the maximum per request is {settings.BULK_INVOICE_MAX_ROWS}")
+        try:
+            rows.append((index, InvoiceCreate.model_validate(raw)))
+        except ValidationError as e:
+            errors.append(InvoiceBulkError(
+                index=index,
+                invoice_number=raw.get("invoice_number") if isinstance(raw, dict) else None,
+                detail="; ".join(format_validation_error(error) for error in e.errors())
+            ))
+    
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        index = 0
+        try:
+            async for raw, error in iter_records(request.stream()):
+                if error is not None:
+                    errors.append(InvoiceBulkError(index=index, detail=error))
+                else:
+                    add(index, raw)
+                index += 1
+        except UnicodeDecodeError:
+            raise ValueError("Body must be UTF-8 encoded")
+        return rows, errors
+    
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ValueError("Body must be a JSON array of invoices or NDJSON (application/x-ndjson)")
+    if not isinstance(body, list):
+        raise ValueError("Body must be a JSON array of invoices or NDJSON (application/x-ndjson)")
+    for index, raw in enumerate(body):
+        add(index, raw)
+    return rows, errors
+
+
+@router.post("/payments/import", response_model=PaymentImportResult)
+async def import_payments(
+    request: Request,
+    school_id: UUID = Query(..., description="Colegio al que pertenecen las facturas del archivo"),
+    db: Session = Depends(get_db)
+):
+    """
+    Importa un archivo de conciliación bancaria con los pagos de un colegio.
+    
+    El cuerpo es CSV (Content-Type: text/csv, con encabezado) o NDJSON
+    (application/x-ndjson), con las columnas de PaymentImportRow. Se lee a medida que
+    llega y se aplica en chunks de PAYMENT_IMPORT_CHUNK_SIZE filas, cada uno en su
+    transacción (ver InvoiceService.import_payments); las filas que no se pudieron
+    conciliar se informan en unmatched_rows.
+    """
+    csv_format = _import_csv_format(request)
+    if await run_in_threadpool(SchoolService.get_school, db, school_id) is None:
+        raise HTTPException(status_code=404, detail="School not found")
+    
+    return await _import_payment_rows(
+        request, csv_format, lambda chunk: run_in_threadpool(InvoiceService.import_payments, db, school_id, chunk)
+    )
+
+
+def _import_csv_format(request: Request) -> bool:
+    """Indica si el archivo de pagos es CSV (si no, NDJSON); otro Content-Type responde 400."""
+    content_type = request.headers.get("content-type", "")
+    csv_format = "csv" in content_type
+    if not csv_format and "ndjson" not in content_type and "jsonl" not in content_type:
+        raise HTTPException(status_code=400, detail="Content-Type must be text/csv or application/x-ndjson")
+    return csv_format
+
+
+async def _import_payment_rows(
+    request: Request,
+    csv_format: bool,
+    import_chunk: Callable[[List[Tuple[int, PaymentImportRow]]], Awaitable[Any]]
+) -> PaymentImportResult:
+    """
+    Lee el archivo de pagos a medida que llega y aplica cada chunk de
+    PAYMENT_IMPORT_CHUNK_SIZE filas con import_chunk (ver InvoiceService.import_payments).
+    """
+    result = PaymentImportResult()
+    chunk = []
+    
+    async def apply_chunk():
+        matched, amount, errors = await import_chunk(chunk)
+        result.matched += matched
+        result.total_amount += amount
+        result.unmatched_rows.extend(errors)
+        chunk.clear()
+    
+    try:
+        async for raw, error in iter_records(request.stream(), csv_format=csv_format):
+            index = result.rows
+            result.rows += 1
+            if error is None:
+                try:
+                    chunk.append((index, PaymentImportRow.model_validate(raw)))
+                except ValidationError as e:
+                    error = "; ".join(format_validation_error(detail) for detail in e.errors())
+            if error is not None:
+                invoice_number = raw.get("invoice_number") if isinstance(raw, dict) else None
+                result.unmatched_rows.append(PaymentImportError(index=index, invoice_number=invoice_number, detail=error))
+            if len(chunk) >= settings.PAYMENT_IMPORT_CHUNK_SIZE:
+                await apply_chunk()
+        if chunk:
+            await apply_chunk()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8 encoded")
+    except Exception as e:
+        # Los chunks anteriores ya quedaron aplicados
+        raise HTTPException(status_code=500, detail=f"Import stopped after {result.rows} rows: {e}")
+    
+    result.unmatched_rows.sort(key=lambda error: error.index)
+    result.unmatched = len(result.unmatched_rows)
+    return result
+
+
 @router.get("/", response_model=PaginatedResponse[Invoice])
 def get_invoices(
     skip: int = Query(0, ge=0, description="Número de registros a saltar"),
@@ -40,47 +205,88 @@ def get_invoices(
     student_id: Optional[UUID] = Query(None, description="Filtrar por ID de estudiante"),
     school_id: Optional[UUID] = Query(None, description="Filtrar por ID de colegio"),
     status: Optional[InvoiceStatus] = Query(None, description="Filtrar por estado"),
-    db: Session = Depends(get_db)
+    sort: InvoiceSort = Query(InvoiceSort.CREATED_AT, description="Orden descendente: created_at (creación) o due_date (vencimiento); el cursor solo sirve para el mismo orden"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    include: Optional[InvoiceInclude] = Query(None, description="include=payments agrega la lista completa de pagos de cada factura (por defecto solo el resumen)"),
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene una lista de facturas con paginación y filtros.
     
     Retorna información de paginación incluyendo:
-    - items: Lista de facturas de la página actual
-    - total: Total de facturas disponibles
+    - items: Lista de facturas de la página actual, con el resumen de sus pagos
+      (y la lista completa con include=payments)
+    - total: Total de facturas disponibles (según total_mode; null con none)
     - skip: Número de registros saltados
     - limit: Límite de registros por página
     - has_next: Indica si hay más páginas
     - has_previous: Indica si hay páginas anteriores
+    - next_cursor: Cursor de la página siguiente
+    
+    Para recorrer listados grandes usar cursor en lugar de skip: la página continúa
+    después de la última fila de la anterior (con índice), así que su costo no
+    depende de la profundidad y no se corre si se insertan filas.
+    
+    school_id filtra por el colegio que emitió la factura. Cada combinación de
+    filtros y orden se resuelve con un índice, sin JOIN ni ordenamiento.
     """
-    items = InvoiceService.get_invoices(
-        db,
-        skip=skip,
-        limit=limit,
-        student_id=student_id,
-        school_id=school_id,
-        status=status
-    )
+    try:
+        # Una fila extra indica si hay página siguiente
+        items = InvoiceService.get_invoices(
+            db,
+            skip=skip,
+            limit=limit + 1,
+            student_id=student_id,
+            school_id=school_id,
+            status=status,
+            cursor=cursor,
+            include_payments=include == InvoiceInclude.PAYMENTS,
+            sort=sort
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     total = InvoiceService.count_invoices(
         db,
         student_id=student_id,
         school_id=school_id,
-        status=status
+        status=status,
+        total_mode=total_mode
+    )
+    return PaginatedResponse.create(
+        items=items, total=total, skip=skip, limit=limit, keyset=INVOICE_KEYSETS[sort], cursor=cursor,
+        total_mode=total_mode
     )
-    return PaginatedResponse.create(items=items, total=total, skip=skip, limit=limit)
 
 
 @router.get("/{invoice_id}", response_model=Invoice)
 def get_invoice(
     invoice_id: UUID,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
     Obtiene una factura por ID.
+    
+    Retorna un ETag con la versión de la factura (cambia al editarla o registrar un pago):
+    con If-None-Match vigente se responde 304 sin consultar la base de datos.
     """
+    # La versión se lee antes que la factura: el ETag nunca es más nuevo que el cuerpo
+    etag = get_entity_etag("invoice", invoice_id)
+    matched = etag_matches(request.headers.get("if-none-match"), etag)
+    if matched:
+        return Response(status_code=304, headers={"ETag": matched})
+    
     invoice = InvoiceService.get_invoice(db, invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    if etag:
+        response.headers["ETag"] = etag
+    else:
+        # La versión se crea solo para facturas que existen; esta respuesta va sin ETag
+        # porque una escritura posterior a la lectura podría haberla creado ya
+        get_entity_etag("invoice", invoice_id, create=True)
     return invoice
 
 
@@ -97,8 +303,6 @@ def update_invoice(
         invoice = InvoiceService.update_invoice(db, invoice_id, invoice_update)
         if not invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
-        # Invalidar cache de statements relacionados
-        invalidate_statements_for_invoice(invoice_id, db)
         return invoice
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -114,9 +318,6 @@ def delete_invoice(
     """
     Elimina una factura.
     """
-    # Invalidar cache antes de eliminar (necesitamos los datos de la factura)
-    invalidate_statements_for_invoice(invoice_id, db)
-    
     success = InvoiceService.delete_invoice(db, invoice_id)
     if not success:
         raise HTTPException(status_code=404, detail="Invoice not found")
@@ -128,25 +329,33 @@ def get_invoice_payments(
     invoice_id: UUID,
     skip: int = Query(0, ge=0, description="Número de pagos a saltar"),
     limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de pagos a retornar"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene la lista de pagos asociados a una factura con paginación.
     
     Retorna información de paginación incluyendo:
     - items: Lista de pagos de la página actual
-    - total: Total de pagos disponibles
+    - total: Total de pagos disponibles (según total_mode; null con none)
     - skip: Número de pagos saltados
     - limit: Límite de pagos por página
     - has_next: Indica si hay más páginas
     - has_previous: Indica si hay páginas anteriores
+    - next_cursor: Cursor de la página siguiente (enviarlo como cursor en lugar de skip)
     
     Los pagos están ordenados por fecha de pago descendente (más recientes primero).
     """
     try:
-        items = InvoiceService.get_payments(db, invoice_id, skip=skip, limit=limit)
-        total = InvoiceService.count_payments(db, invoice_id)
-        return PaginatedResponse.create(items=items, total=total, skip=skip, limit=limit)
+        items = InvoiceService.get_payments(db, invoice_id, skip=skip, limit=limit + 1, cursor=cursor)
+        total = InvoiceService.count_payments(db, invoice_id, total_mode=total_mode)
+        return PaginatedResponse.create(
+            items=items, total=total, skip=skip, limit=limit, keyset=PAYMENT_KEYSET, cursor=cursor,
+            total_mode=total_mode
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -165,18 +374,206 @@ def create_payment(
     El invoice_id se obtiene del path. Los campos school_id y student_id
     se obtienen automáticamente de la factura. No deben ser proporcionados en el body.
     """
-    # Obtener la factura para extraer school_id y student_id
-    invoice = InvoiceService.get_invoice(db, invoice_id)
+    try:
+        # El servicio suma el pago a los totales cacheados de los statements relacionados
+        db_payment = InvoiceService.create_payment(db, invoice_id, payment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not db_payment:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return db_payment
+
+# Camino async (ASYNC_DB_ENABLED): se registra antes que router y atiende las lecturas
+# y las escrituras con AsyncSession y redis.asyncio.
+# Mismo contrato que las versiones síncronas, por eso no se duplican en el schema.
+async_router = APIRouter(include_in_schema=False)
+
+
+@async_router.get("/", response_model=PaginatedResponse[Invoice])
+async def get_invoices_async(
+    skip: int = Query(0, ge=0, description="Número de registros a saltar"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de registros a retornar"),
+    student_id: Optional[UUID] = Query(None, description="Filtrar por ID de estudiante"),
+    school_id: Optional[UUID] = Query(None, description="Filtrar por ID de colegio"),
+    status: Optional[InvoiceStatus] = Query(None, description="Filtrar por estado"),
+    sort: InvoiceSort = Query(InvoiceSort.CREATED_AT, description="Orden descendente: created_at (creación) o due_date (vencimiento); el cursor solo sirve para el mismo orden"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    include: Optional[InvoiceInclude] = Query(None, description="include=payments agrega la lista completa de pagos de cada factura (por defecto solo el resumen)"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Versión async de get_invoices."""
+    try:
+        items = await AsyncInvoiceService.get_invoices(
+            db,
+            skip=skip,
+            limit=limit + 1,
+            student_id=student_id,
+            school_id=school_id,
+            status=status,
+            cursor=cursor,
+            include_payments=include == InvoiceInclude.PAYMENTS,
+            sort=sort
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = await AsyncInvoiceService.count_invoices(
+        db,
+        student_id=student_id,
+        school_id=school_id,
+        status=status,
+        total_mode=total_mode
+    )
+    return PaginatedResponse.create(
+        items=items, total=total, skip=skip, limit=limit, keyset=INVOICE_KEYSETS[sort], cursor=cursor,
+        total_mode=total_mode
+    )
+
+
+@async_router.get("/{invoice_id}", response_model=Invoice)
+async def get_invoice_async(
+    invoice_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de get_invoice."""
+    # La versión se lee antes que la factura: el ETag nunca es más nuevo que el cuerpo
+    etag = await async_cache.get_entity_etag("invoice", invoice_id)
+    matched = etag_matches(request.headers.get("if-none-match"), etag)
+    if matched:
+        return Response(status_code=304, headers={"ETag": matched})
+    
+    invoice = await AsyncInvoiceService.get_invoice(db, invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    if etag:
+        response.headers["ETag"] = etag
+    else:
+        await async_cache.get_entity_etag("invoice", invoice_id, create=True)
+    return invoice
+
+
+@async_router.get("/{invoice_id}/payments", response_model=PaginatedResponse[Payment])
+async def get_invoice_payments_async(
+    invoice_id: UUID,
+    skip: int = Query(0, ge=0, description="Número de pagos a saltar"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de pagos a retornar"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Versión async de get_invoice_payments."""
+    try:
+        items = await AsyncInvoiceService.get_payments(db, invoice_id, skip=skip, limit=limit + 1, cursor=cursor)
+        total = await AsyncInvoiceService.count_payments(db, invoice_id, total_mode=total_mode)
+        return PaginatedResponse.create(
+            items=items, total=total, skip=skip, limit=limit, keyset=PAYMENT_KEYSET, cursor=cursor,
+            total_mode=total_mode
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@async_router.post("/", response_model=Invoice, status_code=201)
+async def create_invoice_async(
+    invoice: InvoiceCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de create_invoice."""
+    try:
+        return await AsyncInvoiceService.create_invoice(db, invoice)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@async_router.post("/bulk", response_model=InvoiceBulkResult)
+async def create_invoices_bulk_async(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de create_invoices_bulk."""
+    try:
+        rows, errors = await _read_bulk_invoices(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        result = InvoiceService.create_payment(db, invoice_id, payment, invoice)
-        # Invalidar cache de statements relacionados
-        invalidate_statements_for_payment(result.id, db)
-        return result
+        created, insert_errors = await AsyncInvoiceService.create_invoices_bulk(db, rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    errors = sorted(errors + insert_errors, key=lambda error: error.index)
+    return InvoiceBulkResult(created=created, failed=len(errors), errors=errors)
+
+
+@async_router.post("/payments/import", response_model=PaymentImportResult)
+async def import_payments_async(
+    request: Request,
+    school_id: UUID = Query(..., description="Colegio al que pertenecen las facturas del archivo"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de import_payments."""
+    csv_format = _import_csv_format(request)
+    if await AsyncSchoolService.get_school(db, school_id) is None:
+        raise HTTPException(status_code=404, detail="School not found")
+    
+    return await _import_payment_rows(
+        request, csv_format, lambda chunk: AsyncInvoiceService.import_payments(db, school_id, chunk)
+    )
+
+
+@async_router.put("/{invoice_id}", response_model=Invoice)
+async def update_invoice_async(
+    invoice_id: UUID,
+    invoice_update: InvoiceUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de update_invoice."""
+    try:
+        invoice = await AsyncInvoiceService.update_invoice(db, invoice_id, invoice_update)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return invoice
+
+
+@async_router.delete("/{invoice_id}", status_code=204)
+async def delete_invoice_async(
+    invoice_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de delete_invoice."""
+    success = await AsyncInvoiceService.delete_invoice(db, invoice_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return None
+
 
+@async_router.post("/{invoice_id}/payments", response_model=Payment, status_code=201)
+async def create_payment_async(
+    invoice_id: UUID,
+    payment: PaymentCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de create_payment."""
+    try:
+        db_payment = await AsyncInvoiceService.create_payment(db, invoice_id, payment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not db_payment:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return db_payment
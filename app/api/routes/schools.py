@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
-from app.core.database import get_db
+from app.core.database import (
+    get_db, get_async_db, get_read_db, get_async_read_db, get_statement_db, get_async_statement_db
+)
 from app.schemas.school import School, SchoolCreate, SchoolUpdate
 from app.schemas.account import SchoolAccountStatus
+from app.schemas.billing import BillingRunCreate, BillingRunResult
+from app.schemas.invoice import InvoiceInclude
 from app.schemas.pagination import PaginatedResponse
-from app.services.school_service import SchoolService
-from app.services.account_service import AccountService
-from app.core.cache import get_cached_statement, set_cached_statement
+from app.services.school_service import SchoolService, AsyncSchoolService, SCHOOL_KEYSET
+from app.services.account_service import AccountService, AsyncAccountService, STATEMENT_KEYSET
+from app.services.billing_service import BillingService, AsyncBillingService
+from app.core.cache import (
+    get_or_compute_statement_page, get_or_compute_statement_cursor_page, get_statement_etag, get_entity_etag
+)
+from app.core import async_cache
+from app.core.etag import check_not_modified, check_not_modified_async, make_etag
 from app.core.config import settings
+from app.core.pagination import InvalidCursorError, TotalMode
 
 router = APIRouter()
 
@@ -33,35 +44,60 @@ def get_schools(
     skip: int = Query(0, ge=0, description="Número de registros a saltar"),
     limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de registros a retornar"),
     is_active: Optional[bool] = Query(None, description="Filtrar por estado activo"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene una lista de colegios con paginación.
     
     Retorna información de paginación incluyendo:
     - items: Lista de colegios de la página actual
-    - total: Total de colegios disponibles
+    - total: Total de colegios disponibles (según total_mode; null con none)
     - skip: Número de registros saltados
     - limit: Límite de registros por página
     - has_next: Indica si hay más páginas
     - has_previous: Indica si hay páginas anteriores
+    - next_cursor: Cursor de la página siguiente
+    
+    Para recorrer listados grandes usar cursor en lugar de skip: la página continúa
+    después de la última fila de la anterior (con índice), así que su costo no
+    depende de la profundidad y no se corre si se insertan filas.
     """
-    items = SchoolService.get_schools(db, skip=skip, limit=limit, is_active=is_active)
-    total = SchoolService.count_schools(db, is_active=is_active)
-    return PaginatedResponse.create(items=items, total=total, skip=skip, limit=limit)
+    try:
+        # Una fila extra indica si hay página siguiente
+        items = SchoolService.get_schools(db, skip=skip, limit=limit + 1, is_active=is_active, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = SchoolService.count_schools(db, is_active=is_active, total_mode=total_mode)
+    return PaginatedResponse.create(
+        items=items, total=total, skip=skip, limit=limit, keyset=SCHOOL_KEYSET, cursor=cursor,
+        total_mode=total_mode
+    )
 
 
 @router.get("/{school_id}", response_model=School)
 def get_school(
     school_id: UUID,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
-    Obtiene un colegio por ID.
+    Obtiene un colegio por ID (desde el cache de snapshots).
+    
+    Retorna un ETag con la versión del colegio: con If-None-Match vigente se
+    responde 304 sin consultar la base de datos.
     """
-    school = SchoolService.get_school(db, school_id)
+    not_modified = check_not_modified(request, lambda: get_entity_etag("school", school_id))
+    if not_modified:
+        return not_modified
+    
+    school, version = SchoolService.get_versioned_school_snapshot(db, school_id)
     if not school:
         raise HTTPException(status_code=404, detail="School not found")
+    if version is not None:
+        response.headers["ETag"] = make_etag(version)
     return school
 
 
@@ -94,12 +130,36 @@ def delete_school(
     return None
 
 
+@router.post("/{school_id}/billing-runs", response_model=BillingRunResult)
+def run_school_billing(
+    school_id: UUID,
+    run: BillingRunCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Genera las facturas del período para todos los estudiantes activos del colegio.
+    
+    Repetir la corrida del mismo período solo factura a los estudiantes que falten
+    (ver BillingService.run_billing).
+    """
+    if SchoolService.get_school(db, school_id) is None:
+        raise HTTPException(status_code=404, detail="School not found")
+    try:
+        return BillingService.run_billing(db, school_id, run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{school_id}/statement", response_model=SchoolAccountStatus)
 def get_school_statement(
     school_id: UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
     skip: int = Query(0, ge=0, description="Número de facturas a saltar"),
     limit: int = Query(10, ge=1, le=100, description="Número de facturas a retornar (máximo 100)"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor de facturas (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    include: Optional[InvoiceInclude] = Query(None, description="include=payments agrega la lista completa de pagos de cada factura (por defecto solo el resumen)"),
+    db: Session = Depends(get_statement_db)
 ):
     """
     Obtiene el estado de cuenta de un colegio.
@@ -111,24 +171,218 @@ def get_school_statement(
     - Número de estudiantes
     - Listado de facturas paginado (ordenado por fecha de creación descendente)
     
-    Los resultados se cachean por 60 segundos para mejorar el rendimiento.
+    Los resultados se cachean por 60 segundos para mejorar el rendimiento: los totales
+    se cachean una vez y las facturas en bloques fijos que se recortan según skip/limit.
+    Al vencer se sirve el valor anterior mientras se recalcula en background, y
+    si el recálculo falla se sirve el último valor conocido (hasta 10 minutos).
+    Si varios requests piden el mismo statement sin cache, solo uno lo recalcula.
     La paginación permite manejar grandes volúmenes de facturas eficientemente.
+    
+    Retorna un ETag que cambia con cada escritura sobre el statement: con If-None-Match
+    vigente se responde 304 sin consultar la base de datos ni armar el cuerpo.
+    
+    Para recorrer muchas facturas usar cursor (el next_cursor de la página anterior):
+    los totales salen del mismo cache y las facturas se leen desde el cursor por
+    índice, sin OFFSET. Esas páginas no se cachean ni llevan ETag.
+    
+    Cada factura trae el resumen de sus pagos (cantidad, suma y último pago); con
+    include=payments trae también la lista completa, leída de la base sin cache.
     """
-    cache_key = f"school:{str(school_id)}:statement:skip:{skip}:limit:{limit}"
+    if cursor is None and include is None:
+        not_modified = check_not_modified(request, lambda: get_statement_etag("school", school_id, skip, limit))
+        if not_modified:
+            return not_modified
     
-    # Intentar obtener de cache
-    cached = get_cached_statement(cache_key)
-    if cached:
-        return SchoolAccountStatus(**cached)
+    try:
+        if include == InvoiceInclude.PAYMENTS:
+            # Pagos completos: se leen de la base sin cache (los bloques cacheados llevan solo el resumen)
+            return AccountService.get_school_account_status(
+                db, school_id, skip=skip, limit=limit, cursor=cursor, include_payments=True
+            )
+        if cursor is not None:
+            body = get_or_compute_statement_cursor_page(
+                "school",
+                school_id,
+                cursor,
+                limit,
+                lambda: AccountService.get_school_account_summary(db, school_id),
+                lambda after, size: AccountService.get_school_invoices(db, school_id, limit=size, cursor=after),
+                STATEMENT_KEYSET,
+                background_tasks=background_tasks
+            )
+        else:
+            # Totales y bloques de facturas se cachean por separado; ante un miss solo un request recalcula
+            body = get_or_compute_statement_page(
+                "school",
+                school_id,
+                skip,
+                limit,
+                lambda: AccountService.get_school_account_summary(db, school_id),
+                lambda offset, size: AccountService.get_school_invoices(db, school_id, skip=offset, limit=size),
+                background_tasks=background_tasks,
+                keyset=STATEMENT_KEYSET
+            )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
     
-    # Si no está en cache, obtener de la base de datos
+    # El cuerpo ya está serializado: se retorna tal cual, sin revalidar con response_model
+    return body.as_response(request.headers.get("accept-encoding", ""))
+
+# Camino async (ASYNC_DB_ENABLED): se registra antes que router y atiende las lecturas
+# y las escrituras con AsyncSession y redis.asyncio.
+# Mismo contrato que las versiones síncronas, por eso no se duplican en el schema.
+async_router = APIRouter(include_in_schema=False)
+
+
+@async_router.get("/", response_model=PaginatedResponse[School])
+async def get_schools_async(
+    skip: int = Query(0, ge=0, description="Número de registros a saltar"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de registros a retornar"),
+    is_active: Optional[bool] = Query(None, description="Filtrar por estado activo"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Versión async de get_schools."""
     try:
-        result = AccountService.get_school_account_status(db, school_id, skip=skip, limit=limit)
-        # Guardar en cache (TTL: 60 segundos)
-        set_cached_statement(cache_key, result, ttl=60)
-        return result
+        items = await AsyncSchoolService.get_schools(db, skip=skip, limit=limit + 1, is_active=is_active, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = await AsyncSchoolService.count_schools(db, is_active=is_active, total_mode=total_mode)
+    return PaginatedResponse.create(
+        items=items, total=total, skip=skip, limit=limit, keyset=SCHOOL_KEYSET, cursor=cursor,
+        total_mode=total_mode
+    )
+
+
+@async_router.get("/{school_id}", response_model=School)
+async def get_school_async(
+    school_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de get_school."""
+    not_modified = await check_not_modified_async(request, lambda: async_cache.get_entity_etag("school", school_id))
+    if not_modified:
+        return not_modified
+    
+    school, version = await AsyncSchoolService.get_versioned_school_snapshot(db, school_id)
+    if not school:
+        raise HTTPException(status_code=404, detail="School not found")
+    if version is not None:
+        response.headers["ETag"] = make_etag(version)
+    return school
+
+
+@async_router.get("/{school_id}/statement", response_model=SchoolAccountStatus)
+async def get_school_statement_async(
+    school_id: UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    skip: int = Query(0, ge=0, description="Número de facturas a saltar"),
+    limit: int = Query(10, ge=1, le=100, description="Número de facturas a retornar (máximo 100)"),
+    cursor: Optional[str] = Query(None, description="Cursor de facturas (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    include: Optional[InvoiceInclude] = Query(None, description="include=payments agrega la lista completa de pagos de cada factura (por defecto solo el resumen)"),
+    db: AsyncSession = Depends(get_async_statement_db)
+):
+    """Versión async de get_school_statement."""
+    if cursor is None and include is None:
+        not_modified = await check_not_modified_async(
+            request, lambda: async_cache.get_statement_etag("school", school_id, skip, limit)
+        )
+        if not_modified:
+            return not_modified
+    
+    try:
+        if include == InvoiceInclude.PAYMENTS:
+            # Pagos completos: se leen de la base sin cache (los bloques cacheados llevan solo el resumen)
+            return await AsyncAccountService.get_school_account_status(
+                db, school_id, skip=skip, limit=limit, cursor=cursor, include_payments=True
+            )
+        if cursor is not None:
+            body = await async_cache.get_or_compute_statement_cursor_page(
+                "school",
+                school_id,
+                cursor,
+                limit,
+                lambda: AsyncAccountService.get_school_account_summary(db, school_id),
+                lambda after, size: AsyncAccountService.get_school_invoices(db, school_id, limit=size, cursor=after),
+                STATEMENT_KEYSET,
+                background_tasks=background_tasks
+            )
+        else:
+            body = await async_cache.get_or_compute_statement_page(
+                "school",
+                school_id,
+                skip,
+                limit,
+                lambda: AsyncAccountService.get_school_account_summary(db, school_id),
+                lambda offset, size: AsyncAccountService.get_school_invoices(db, school_id, skip=offset, limit=size),
+                background_tasks=background_tasks,
+                keyset=STATEMENT_KEYSET
+            )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return body.as_response(request.headers.get("accept-encoding", ""))
+
+
+@async_router.post("/", response_model=School, status_code=201)
+async def create_school_async(
+    school: SchoolCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de create_school."""
+    try:
+        return await AsyncSchoolService.create_school(db, school)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+
+@async_router.put("/{school_id}", response_model=School)
+async def update_school_async(
+    school_id: UUID,
+    school_update: SchoolUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de update_school."""
+    school = await AsyncSchoolService.update_school(db, school_id, school_update)
+    if not school:
+        raise HTTPException(status_code=404, detail="School not found")
+    return school
+
+
+@async_router.delete("/{school_id}", status_code=204)
+async def delete_school_async(
+    school_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de delete_school."""
+    success = await AsyncSchoolService.delete_school(db, school_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="School not found")
+    return None
+
+
+@async_router.post("/{school_id}/billing-runs", response_model=BillingRunResult)
+async def run_school_billing_async(
+    school_id: UUID,
+    run: BillingRunCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de run_school_billing."""
+    if await AsyncSchoolService.get_school(db, school_id) is None:
+        raise HTTPException(status_code=404, detail="School not found")
+    try:
+        return await AsyncBillingService.run_billing(db, school_id, run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
-from app.core.database import get_db
+from app.core.database import (
+    get_db, get_async_db, get_read_db, get_async_read_db, get_statement_db, get_async_statement_db
+)
 from app.schemas.student import Student, StudentCreate, StudentUpdate
 from app.schemas.account import StudentAccountStatus
+from app.schemas.invoice import InvoiceInclude
 from app.schemas.pagination import PaginatedResponse
-from app.services.student_service import StudentService
-from app.services.account_service import AccountService
-from app.core.cache import get_cached_statement, set_cached_statement
+from app.services.student_service import StudentService, AsyncStudentService, STUDENT_KEYSET
+from app.services.account_service import AccountService, AsyncAccountService, STATEMENT_KEYSET
+from app.core.cache import (
+    get_or_compute_statement_page, get_or_compute_statement_cursor_page, get_statement_etag, get_entity_etag
+)
+from app.core import async_cache
+from app.core.etag import check_not_modified, check_not_modified_async, make_etag
 from app.core.config import settings
+from app.core.pagination import InvalidCursorError, TotalMode
 
 router = APIRouter()
 
@@ -36,41 +45,67 @@ def get_students(
     limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de registros a retornar"),
     school_id: Optional[UUID] = Query(None, description="Filtrar por ID de colegio"),
     is_active: Optional[bool] = Query(None, description="Filtrar por estado activo"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene una lista de estudiantes con paginación y filtros.
     
     Retorna información de paginación incluyendo:
     - items: Lista de estudiantes de la página actual
-    - total: Total de estudiantes disponibles
+    - total: Total de estudiantes disponibles (según total_mode; null con none)
     - skip: Número de registros saltados
     - limit: Límite de registros por página
     - has_next: Indica si hay más páginas
     - has_previous: Indica si hay páginas anteriores
+    - next_cursor: Cursor de la página siguiente
+    
+    Para recorrer listados grandes usar cursor en lugar de skip: la página continúa
+    después de la última fila de la anterior (con índice), así que su costo no
+    depende de la profundidad y no se corre si se insertan filas.
     """
-    items = StudentService.get_students(
-        db, 
-        skip=skip, 
-        limit=limit, 
-        school_id=school_id, 
-        is_active=is_active
+    try:
+        # Una fila extra indica si hay página siguiente
+        items = StudentService.get_students(
+            db, 
+            skip=skip, 
+            limit=limit + 1, 
+            school_id=school_id, 
+            is_active=is_active,
+            cursor=cursor
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = StudentService.count_students(db, school_id=school_id, is_active=is_active, total_mode=total_mode)
+    return PaginatedResponse.create(
+        items=items, total=total, skip=skip, limit=limit, keyset=STUDENT_KEYSET, cursor=cursor,
+        total_mode=total_mode
     )
-    total = StudentService.count_students(db, school_id=school_id, is_active=is_active)
-    return PaginatedResponse.create(items=items, total=total, skip=skip, limit=limit)
 
 
 @router.get("/{student_id}", response_model=Student)
 def get_student(
     student_id: UUID,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
-    Obtiene un estudiante por ID.
+    Obtiene un estudiante por ID (desde el cache de snapshots).
+    
+    Retorna un ETag con la versión del estudiante: con If-None-Match vigente se
+    responde 304 sin consultar la base de datos.
     """
-    student = StudentService.get_student(db, student_id)
+    not_modified = check_not_modified(request, lambda: get_entity_etag("student", student_id))
+    if not_modified:
+        return not_modified
+    
+    student, version = StudentService.get_versioned_student_snapshot(db, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
+    if version is not None:
+        response.headers["ETag"] = make_etag(version)
     return student
 
 
@@ -111,9 +146,13 @@ def delete_student(
 @router.get("/{student_id}/statement", response_model=StudentAccountStatus)
 def get_student_statement(
     student_id: UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
     skip: int = Query(0, ge=0, description="Número de facturas a saltar"),
     limit: int = Query(10, ge=1, le=100, description="Número de facturas a retornar (máximo 100)"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor de facturas (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    include: Optional[InvoiceInclude] = Query(None, description="include=payments agrega la lista completa de pagos de cada factura (por defecto solo el resumen)"),
+    db: Session = Depends(get_statement_db)
 ):
     """
     Obtiene el estado de cuenta de un estudiante.
@@ -124,24 +163,218 @@ def get_student_statement(
     - Total pendiente
     - Listado de facturas paginado (ordenado por fecha de creación descendente)
     
-    Los resultados se cachean por 60 segundos para mejorar el rendimiento.
+    Los resultados se cachean por 60 segundos para mejorar el rendimiento: los totales
+    se cachean una vez y las facturas en bloques fijos que se recortan según skip/limit.
+    Al vencer se sirve el valor anterior mientras se recalcula en background, y
+    si el recálculo falla se sirve el último valor conocido (hasta 10 minutos).
+    Si varios requests piden el mismo statement sin cache, solo uno lo recalcula.
     La paginación permite manejar grandes volúmenes de facturas eficientemente.
+    
+    Retorna un ETag que cambia con cada escritura sobre el statement: con If-None-Match
+    vigente se responde 304 sin consultar la base de datos ni armar el cuerpo.
+    
+    Para recorrer muchas facturas usar cursor (el next_cursor de la página anterior):
+    los totales salen del mismo cache y las facturas se leen desde el cursor por
+    índice, sin OFFSET. Esas páginas no se cachean ni llevan ETag.
+    
+    Cada factura trae el resumen de sus pagos (cantidad, suma y último pago); con
+    include=payments trae también la lista completa, leída de la base sin cache.
     """
-    cache_key = f"student:{str(student_id)}:statement:skip:{skip}:limit:{limit}"
+    if cursor is None and include is None:
+        not_modified = check_not_modified(request, lambda: get_statement_etag("student", student_id, skip, limit))
+        if not_modified:
+            return not_modified
+    
+    try:
+        if include == InvoiceInclude.PAYMENTS:
+            # Pagos completos: se leen de la base sin cache (los bloques cacheados llevan solo el resumen)
+            return AccountService.get_student_account_status(
+                db, student_id, skip=skip, limit=limit, cursor=cursor, include_payments=True
+            )
+        if cursor is not None:
+            body = get_or_compute_statement_cursor_page(
+                "student",
+                student_id,
+                cursor,
+                limit,
+                lambda: AccountService.get_student_account_summary(db, student_id),
+                lambda after, size: AccountService.get_student_invoices(db, student_id, limit=size, cursor=after),
+                STATEMENT_KEYSET,
+                background_tasks=background_tasks
+            )
+        else:
+            # Totales y bloques de facturas se cachean por separado; ante un miss solo un request recalcula
+            body = get_or_compute_statement_page(
+                "student",
+                student_id,
+                skip,
+                limit,
+                lambda: AccountService.get_student_account_summary(db, student_id),
+                lambda offset, size: AccountService.get_student_invoices(db, student_id, skip=offset, limit=size),
+                background_tasks=background_tasks,
+                keyset=STATEMENT_KEYSET
+            )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # El cuerpo ya está serializado: se retorna tal cual, sin revalidar con response_model
+    return body.as_response(request.headers.get("accept-encoding", ""))
+
+# Camino async (ASYNC_DB_ENABLED): se registra antes que router y atiende las lecturas
+# y las escrituras con AsyncSession y redis.asyncio.
+# Mismo contrato que las versiones síncronas, por eso no se duplican en el schema.
+async_router = APIRouter(include_in_schema=False)
+
+
+@async_router.get("/", response_model=PaginatedResponse[Student])
+async def get_students_async(
+    skip: int = Query(0, ge=0, description="Número de registros a saltar"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE, description="Número de registros a retornar"),
+    school_id: Optional[UUID] = Query(None, description="Filtrar por ID de colegio"),
+    is_active: Optional[bool] = Query(None, description="Filtrar por estado activo"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    total_mode: TotalMode = Query(TotalMode.EXACT, description="Cálculo del total: exact (COUNT cacheado unos segundos), estimate (estimación del planner) o none (sin total)"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Versión async de get_students."""
+    try:
+        items = await AsyncStudentService.get_students(
+            db,
+            skip=skip,
+            limit=limit + 1,
+            school_id=school_id,
+            is_active=is_active,
+            cursor=cursor
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = await AsyncStudentService.count_students(db, school_id=school_id, is_active=is_active, total_mode=total_mode)
+    return PaginatedResponse.create(
+        items=items, total=total, skip=skip, limit=limit, keyset=STUDENT_KEYSET, cursor=cursor,
+        total_mode=total_mode
+    )
+
+
+@async_router.get("/{student_id}", response_model=Student)
+async def get_student_async(
+    student_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de get_student."""
+    not_modified = await check_not_modified_async(request, lambda: async_cache.get_entity_etag("student", student_id))
+    if not_modified:
+        return not_modified
     
-    # Intentar obtener de cache
-    cached = get_cached_statement(cache_key)
-    if cached:
-        return StudentAccountStatus(**cached)
+    student, version = await AsyncStudentService.get_versioned_student_snapshot(db, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    if version is not None:
+        response.headers["ETag"] = make_etag(version)
+    return student
+
+
+@async_router.get("/{student_id}/statement", response_model=StudentAccountStatus)
+async def get_student_statement_async(
+    student_id: UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    skip: int = Query(0, ge=0, description="Número de facturas a saltar"),
+    limit: int = Query(10, ge=1, le=100, description="Número de facturas a retornar (máximo 100)"),
+    cursor: Optional[str] = Query(None, description="Cursor de facturas (next_cursor de la respuesta anterior); si se envía se ignora skip"),
+    include: Optional[InvoiceInclude] = Query(None, description="include=payments agrega la lista completa de pagos de cada factura (por defecto solo el resumen)"),
+    db: AsyncSession = Depends(get_async_statement_db)
+):
+    """Versión async de get_student_statement."""
+    if cursor is None and include is None:
+        not_modified = await check_not_modified_async(
+            request, lambda: async_cache.get_statement_etag("student", student_id, skip, limit)
+        )
+        if not_modified:
+            return not_modified
     
-    # Si no está en cache, obtener de la base de datos
     try:
-        result = AccountService.get_student_account_status(db, student_id, skip=skip, limit=limit)
-        # Guardar en cache (TTL: 60 segundos)
-        set_cached_statement(cache_key, result, ttl=60)
-        return result
+        if include == InvoiceInclude.PAYMENTS:
+            # Pagos completos: se leen de la base sin cache (los bloques cacheados llevan solo el resumen)
+            return await AsyncAccountService.get_student_account_status(
+                db, student_id, skip=skip, limit=limit, cursor=cursor, include_payments=True
+            )
+        if cursor is not None:
+            body = await async_cache.get_or_compute_statement_cursor_page(
+                "student",
+                student_id,
+                cursor,
+                limit,
+                lambda: AsyncAccountService.get_student_account_summary(db, student_id),
+                lambda after, size: AsyncAccountService.get_student_invoices(db, student_id, limit=size, cursor=after),
+                STATEMENT_KEYSET,
+                background_tasks=background_tasks
+            )
+        else:
+            body = await async_cache.get_or_compute_statement_page(
+                "student",
+                student_id,
+                skip,
+                limit,
+                lambda: AsyncAccountService.get_student_account_summary(db, student_id),
+                lambda offset, size: AsyncAccountService.get_student_invoices(db, student_id, skip=offset, limit=size),
+                background_tasks=background_tasks,
+                keyset=STATEMENT_KEYSET
+            )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return body.as_response(request.headers.get("accept-encoding", ""))
+
+
+@async_router.post("/", response_model=Student, status_code=201)
+async def create_student_async(
+    student: StudentCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de create_student."""
+    try:
+        return await AsyncStudentService.create_student(db, student)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@async_router.put("/{student_id}", response_model=Student)
+async def update_student_async(
+    student_id: UUID,
+    student_update: StudentUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de update_student."""
+    try:
+        student = await AsyncStudentService.update_student(db, student_id, student_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return student
 
+
+@async_router.delete("/{student_id}", status_code=204)
+async def delete_student_async(
+    student_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Versión async de delete_student."""
+    success = await AsyncStudentService.delete_student(db, student_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return None
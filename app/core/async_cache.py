@@ -0,0 +1,529 @@
+"""
+Camino async del cache de statements y snapshots (ASYNC_DB_ENABLED).
+
+Implementa las mismas lecturas que app.core.cache (statements paginados con
+stale-while-revalidate, stale-if-error y single-flight, snapshots de entidades y
+ETags) sobre AsyncCacheBackend, con funciones de cálculo async (AsyncSession), y
+StatementWrite para las escrituras async. Acá solo están los pasos que esperan al
+backend o al cálculo: las reglas sin I/O (frescura, claves de recálculo y de lock,
+codificación, espera al lock de otro worker, nivel local) son las de app.core.cache.
+Las invalidaciones se acumulan en el InvalidationBatch del request sin bloquear el
+event loop.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Optional, Any, Tuple, Dict, List, Callable, Awaitable, Type
+from app.core.config import settings
+from app.core.etag import make_etag
+from app.core.cache_backends import AsyncCacheBackend, CacheBackend, create_async_cache_backend
+from app.core import cache
+from app.core.cache import (
+    CachedBody, CacheToken, SnapshotT, SUMMARY_VARIANT, GENERATION_TTL, _LOCK_POLL_INTERVAL,
+    _FRESH, _REVALIDATE, get_cache_backend, _on_cache_error, _local_cache, _local_tier_enabled,
+    _remember_local, _flight_counters, _entity_counters, _count_counters, _count_key,
+    _statement_keys, _variant_key, _lock_key, _snapshot_keys, _snapshot_tag, _clock_generation,
+    _get_local_statements, _merge_backend_statements, _decode_statements, _encode_statement,
+    _totals_fields, _statement_freshness, _stale_if_error, _lock_wait_rounds, _accept_published,
+    _encode_snapshot, _decode_snapshot, _statement_page_blocks, _page_generation,
+    _build_statement_page, _statement_etag, _page_rows
+)
+from app.core.pagination import Keyset
+
+logger = logging.getLogger(__name__)
+
+# Backend async creado a partir del backend síncrono vigente (se recrea si se reemplaza)
+_async_backend: Optional[AsyncCacheBackend] = None
+_async_backend_source: Optional[CacheBackend] = None
+
+# Recálculos en curso en el event loop (clave versionada -> Future con el resultado)
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def get_async_cache_backend() -> AsyncCacheBackend:
+    """Obtiene el backend async equivalente al backend del cache compartido."""
+    global _async_backend, _async_backend_source
+    backend = get_cache_backend()
+    if _async_backend_source is not backend:
+        _async_backend = create_async_cache_backend(backend)
+        _async_backend_source = backend
+    return _async_backend
+
+
+async def get_cached_statements(
+    entity: str,
+    entity_id,
+    variants: List[str]
+) -> List[Tuple[Optional[CachedBody], Optional[CacheToken]]]:
+    """Ver app.core.cache.get_cached_statements."""
+    results, pending, local_mark = _get_local_statements(entity, entity_id, variants)
+    if not pending:
+        return results
+    
+    backend = get_async_cache_backend()
+    if not await backend.available():
+        return results
+    
+    try:
+        generation, values = await _read_statements(backend, entity, entity_id, [variants[index] for index in pending])
+        _merge_backend_statements(entity, entity_id, variants, results, pending, generation, values, local_mark)
+    except Exception as e:
+        _on_cache_error(e, "leyendo cache")
+    
+    return results
+
+
+async def _read_statements(
+    backend: AsyncCacheBackend,
+    entity: str,
+    entity_id,
+    variants: List[str]
+) -> Tuple[str, List[Optional[Tuple[CachedBody, float]]]]:
+    """Lee la generación vigente y varias variantes en un solo round trip."""
+    page_variants = [variant for variant in variants if variant != SUMMARY_VARIANT]
+    generation, totals, payloads = await backend.read_statements(
+        _statement_keys(entity, entity_id),
+        page_variants,
+        SUMMARY_VARIANT in variants,
+        _clock_generation(),
+        GENERATION_TTL
+    )
+    return generation, _decode_statements(variants, page_variants, totals, payloads)
+
+
+async def set_cached_statement(
+    entity: str,
+    entity_id,
+    variant: str,
+    value: CachedBody,
+    token: Optional[CacheToken],
+    ttl: Optional[int] = None
+):
+    """Ver app.core.cache.set_cached_statement."""
+    if token is None:
+        return
+    
+    backend = get_async_cache_backend()
+    if not await backend.available():
+        return
+    
+    if variant == SUMMARY_VARIANT:
+        await _set_cached_totals(backend, entity, entity_id, value, token, ttl)
+        return
+    
+    try:
+        encoded, stored_at = _encode_statement(value)
+        key = _variant_key(entity, entity_id, token.generation, variant)
+        await backend.set(key, encoded, ttl or settings.STATEMENT_CACHE_HARD_TTL)
+        _remember_local(entity, entity_id, variant, value, token._replace(stored_at=stored_at))
+    except Exception as e:
+        _on_cache_error(e, "guardando en cache")
+
+
+async def _set_cached_totals(
+    backend: AsyncCacheBackend,
+    entity: str,
+    entity_id,
+    value: CachedBody,
+    token: CacheToken,
+    ttl: Optional[int]
+):
+    """Ver app.core.cache._set_cached_totals."""
+    try:
+        fields, stored_at = _totals_fields(value)
+        stored = await backend.store_totals(
+            _statement_keys(entity, entity_id),
+            token.generation,
+            ttl or settings.STATEMENT_CACHE_HARD_TTL,
+            fields
+        )
+        if stored:
+            _remember_local(entity, entity_id, SUMMARY_VARIANT, value, token._replace(stored_at=stored_at))
+    except Exception as e:
+        _on_cache_error(e, "guardando totales en cache")
+
+
+async def get_or_compute_statement_page(
+    entity: str,
+    entity_id,
+    skip: int,
+    limit: int,
+    compute_summary: Callable[[], Awaitable[Any]],
+    compute_invoices: Callable[[int, int], Awaitable[List[Any]]],
+    background_tasks=None,
+    keyset: Optional[Keyset] = None
+) -> CachedBody:
+    """
+    Versión async de app.core.cache.get_or_compute_statement_page.
+    Las partes faltantes se calculan en orden (comparten la AsyncSession del request).
+    """
+    items = [(SUMMARY_VARIANT, compute_summary)] + [
+        (variant, _invoice_block_computer(compute_invoices, offset, size))
+        for variant, offset, size in _statement_page_blocks(skip, _page_rows(limit, keyset))
+    ]
+    cached_entries = await get_cached_statements(entity, entity_id, [variant for variant, _ in items])
+    parts = []
+    for (variant, compute), (cached, token) in zip(items, cached_entries):
+        parts.append(await _resolve_statement(entity, entity_id, variant, compute, cached, token, background_tasks))
+    summary, *blocks = parts
+    return _build_statement_page(summary, blocks, skip, limit, _page_generation(cached_entries), keyset)
+
+
+async def get_or_compute_statement_cursor_page(
+    entity: str,
+    entity_id,
+    cursor: str,
+    limit: int,
+    compute_summary: Callable[[], Awaitable[Any]],
+    compute_invoices: Callable[[str, int], Awaitable[List[Any]]],
+    keyset: Keyset,
+    background_tasks=None
+) -> CachedBody:
+    """Versión async de app.core.cache.get_or_compute_statement_cursor_page."""
+    keyset.decode(cursor)
+    [(cached, token)] = await get_cached_statements(entity, entity_id, [SUMMARY_VARIANT])
+    summary = await _resolve_statement(
+        entity, entity_id, SUMMARY_VARIANT, compute_summary, cached, token, background_tasks
+    )
+    invoices = CachedBody.from_lines(await compute_invoices(cursor, limit + 1))
+    return _build_statement_page(summary, [invoices], 0, limit, None, keyset)
+
+
+def _invoice_block_computer(
+    compute_invoices: Callable[[int, int], Awaitable[List[Any]]],
+    offset: int,
+    size: int
+) -> Callable[[], Awaitable[CachedBody]]:
+    async def compute() -> CachedBody:
+        return CachedBody.from_lines(await compute_invoices(offset, size))
+    return compute
+
+
+async def _resolve_statement(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Awaitable[Any]],
+    cached: Optional[CachedBody],
+    token: Optional[CacheToken],
+    background_tasks
+) -> CachedBody:
+    """Ver app.core.cache._resolve_statement."""
+    freshness = _statement_freshness(cached, token, background_tasks is not None)
+    if freshness == _FRESH:
+        return cached
+    if freshness == _REVALIDATE:
+        background_tasks.add_task(_refresh_statement, entity, entity_id, variant, compute, token)
+        return cached
+    
+    try:
+        return await _single_flight(entity, entity_id, variant, compute, token)
+    except Exception as e:
+        return _stale_if_error(entity, entity_id, cached, e)
+
+
+async def _single_flight(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Awaitable[Any]],
+    token: Optional[CacheToken]
+) -> CachedBody:
+    """Ejecuta compute() una sola vez por event loop para cada (generación, variante)."""
+    flight_key = _variant_key(entity, entity_id, token.generation if token else "", variant)
+    future = _inflight.get(flight_key)
+    if future is not None:
+        _flight_counters.incr("coalesced")
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=settings.CACHE_LOCK_TTL)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Solo se recalcula si desistió el dueño; la cancelación de este request se propaga
+            if not future.cancelled():
+                raise
+        logger.warning(f"Sin resultado del recálculo de {flight_key}; calculando directamente")
+        return CachedBody.from_value(await compute())
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight[flight_key] = future
+    try:
+        value = await _compute_statement_with_lock(entity, entity_id, variant, compute, token)
+        future.set_result(value)
+        return value
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Nadie más espera este Future: marcar la excepción como recuperada
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(flight_key, None)
+
+
+async def _compute_statement_with_lock(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Awaitable[Any]],
+    token: Optional[CacheToken]
+) -> CachedBody:
+    """Ver app.core.cache._compute_statement_with_lock (espera con asyncio.sleep)."""
+    backend = get_async_cache_backend()
+    if token is None or not await backend.available():
+        _flight_counters.incr("computed")
+        return CachedBody.from_value(await compute())
+    
+    key = _variant_key(entity, entity_id, token.generation, variant)
+    lock_key = _lock_key(key)
+    owner = None
+    try:
+        owner = await _acquire_recompute_lock(backend, lock_key)
+        wait_for_other = owner is None
+    except Exception as e:
+        _on_cache_error(e, "tomando lock de recálculo")
+        wait_for_other = False
+    
+    if wait_for_other:
+        # Otro worker está calculando: esperar a que publique un valor más nuevo
+        for _ in _lock_wait_rounds():
+            await asyncio.sleep(_LOCK_POLL_INTERVAL)
+            try:
+                _, (cached,) = await _read_statements(backend, entity, entity_id, [variant])
+            except Exception as e:
+                _on_cache_error(e, "leyendo cache")
+                break
+            value = _accept_published(entity, entity_id, variant, token, cached)
+            if value is not None:
+                return value
+        logger.warning(f"Timeout esperando a otro worker para {key}; calculando directamente")
+    
+    try:
+        _flight_counters.incr("computed")
+        value = CachedBody.from_value(await compute())
+        await set_cached_statement(entity, entity_id, variant, value, token)
+        return value
+    finally:
+        if owner is not None:
+            await _release_recompute_lock(backend, lock_key, owner)
+
+
+async def _acquire_recompute_lock(backend: AsyncCacheBackend, lock_key: str) -> Optional[str]:
+    """Toma el lock de recálculo. Retorna el identificador del dueño, o None si ya estaba tomado."""
+    owner = uuid.uuid4().hex
+    if await backend.set(lock_key, owner.encode(), ttl=settings.CACHE_LOCK_TTL, nx=True):
+        return owner
+    return None
+
+
+async def _release_recompute_lock(backend: AsyncCacheBackend, lock_key: str, owner: str):
+    """Libera el lock de recálculo si sigue perteneciendo a owner."""
+    try:
+        await backend.delete_if_equals(lock_key, owner.encode())
+    except Exception as e:
+        _on_cache_error(e, "liberando lock de recálculo")
+
+
+async def _refresh_statement(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Awaitable[Any]],
+    token: CacheToken
+):
+    """
+    Refresca en background un statement vencido, salvo que otro request o worker ya lo
+    haga. Se registra en _inflight recién con el lock tomado (ver app.core.cache._refresh_statement).
+    """
+    flight_key = _variant_key(entity, entity_id, token.generation, variant)
+    if flight_key in _inflight:
+        return
+    
+    backend = get_async_cache_backend()
+    lock_key = _lock_key(flight_key)
+    owner = None
+    if await backend.available():
+        owner = await _acquire_recompute_lock(backend, lock_key)
+        if owner is None:
+            return
+    
+    registered = flight_key not in _inflight
+    if registered:
+        future = asyncio.get_running_loop().create_future()
+        _inflight[flight_key] = future
+    
+    try:
+        if not registered:
+            return
+        _flight_counters.incr("computed")
+        value = CachedBody.from_value(await compute())
+        await set_cached_statement(entity, entity_id, variant, value, token)
+        future.set_result(value)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        logger.warning(f"Error refrescando statement de {entity} {entity_id}: {e}")
+        future.set_exception(e)
+        future.exception()
+    finally:
+        if owner is not None:
+            await _release_recompute_lock(backend, lock_key, owner)
+        if registered:
+            _inflight.pop(flight_key, None)
+
+
+async def get_statement_etag(entity: str, entity_id, skip: int, limit: int) -> Optional[str]:
+    """Ver app.core.cache.get_statement_etag."""
+    backend = get_async_cache_backend()
+    if not await backend.available():
+        return None
+    try:
+        generation = await backend.get(_statement_keys(entity, entity_id).generation)
+    except Exception as e:
+        _on_cache_error(e, "leyendo generación")
+        return None
+    return _statement_etag(generation.decode(), skip, limit) if generation else None
+
+
+async def get_entity_snapshot(
+    entity: str,
+    entity_id,
+    schema: Type[SnapshotT],
+    load: Callable[[], Awaitable[Any]]
+) -> Optional[SnapshotT]:
+    """Ver app.core.cache.get_entity_snapshot (load es async)."""
+    return (await get_versioned_entity_snapshot(entity, entity_id, schema, load))[0]
+
+
+async def get_versioned_entity_snapshot(
+    entity: str,
+    entity_id,
+    schema: Type[SnapshotT],
+    load: Callable[[], Awaitable[Any]]
+) -> Tuple[Optional[SnapshotT], Optional[str]]:
+    """Ver app.core.cache.get_versioned_entity_snapshot (load es async)."""
+    version_key, snapshot_key = _snapshot_keys(entity, entity_id)
+    tag = _snapshot_tag(entity, entity_id)
+    use_local = _local_tier_enabled()
+    local_mark = None
+    if use_local:
+        cached = _local_cache.get(snapshot_key)
+        if cached is not None:
+            return cached
+        local_mark = _local_cache.invalidation_mark()
+    
+    backend = get_async_cache_backend()
+    version = None
+    if await backend.available():
+        try:
+            version, raw = await backend.mget([version_key, snapshot_key])
+            if version is None:
+                version = await _seed_entity_version(backend, version_key)
+            else:
+                result = _decode_snapshot(schema, version, raw)
+                if result is not None:
+                    if use_local:
+                        _local_cache.set(snapshot_key, result, tag, local_mark)
+                    return result
+        except Exception as e:
+            _on_cache_error(e, "leyendo snapshot")
+            version = None
+    
+    _entity_counters.incr("misses")
+    row = await load()
+    if row is None:
+        return None, None
+    snapshot = schema.model_validate(row)
+    
+    if version is not None:
+        try:
+            await backend.set(snapshot_key, _encode_snapshot(version, snapshot), ttl=settings.ENTITY_CACHE_TTL)
+        except Exception as e:
+            _on_cache_error(e, "guardando snapshot")
+    result = (snapshot, version.decode() if version is not None else None)
+    if use_local:
+        _local_cache.set(snapshot_key, result, tag, local_mark)
+    return result
+
+
+async def _seed_entity_version(backend: AsyncCacheBackend, version_key: str) -> Optional[bytes]:
+    """Ver app.core.cache._seed_entity_version."""
+    await backend.set(version_key, str(_clock_generation()).encode(), ttl=GENERATION_TTL, nx=True)
+    return await backend.get(version_key)
+
+
+async def get_entity_version(entity: str, entity_id, create: bool = False) -> Optional[str]:
+    """Ver app.core.cache.get_entity_version."""
+    version_key, _ = _snapshot_keys(entity, entity_id)
+    backend = get_async_cache_backend()
+    if not await backend.available():
+        return None
+    try:
+        version = await backend.get(version_key)
+        if version is None and create:
+            version = await _seed_entity_version(backend, version_key)
+    except Exception as e:
+        _on_cache_error(e, "leyendo versión")
+        return None
+    return version.decode() if version is not None else None
+
+
+async def get_entity_etag(entity: str, entity_id, create: bool = False) -> Optional[str]:
+    """Ver app.core.cache.get_entity_etag."""
+    version = await get_entity_version(entity, entity_id, create=create)
+    return make_etag(version) if version is not None else None
+
+
+async def get_or_compute_count(listing: str, filters: Dict[str, Any], compute: Callable[[], Awaitable[int]]) -> int:
+    """Ver app.core.cache.get_or_compute_count."""
+    key = _count_key(listing, filters)
+    backend = get_async_cache_backend()
+    available = await backend.available()
+    if available:
+        try:
+            cached = await backend.get(key)
+        except Exception as e:
+            _on_cache_error(e, "leyendo total")
+            cached = None
+        if cached is not None:
+            _count_counters.incr("hits")
+            return int(cached)
+    
+    _count_counters.incr("misses")
+    total = await compute()
+    if available:
+        try:
+            await backend.set(key, str(total).encode(), ttl=settings.COUNT_CACHE_TTL)
+        except Exception as e:
+            _on_cache_error(e, "guardando total")
+    return total
+
+
+class StatementWrite(cache.StatementWrite):
+    """
+    Ver app.core.cache.StatementWrite; se usa con async with alrededor del commit:
+        
+        async with StatementWrite(student_id, school_id) as write:
+            db.add(payment)
+            await db.commit()
+            write.add(total_paid=payment.amount)
+    """
+    
+    async def __aenter__(self) -> "StatementWrite":
+        backend = get_async_cache_backend()
+        if not await backend.available():
+            return self
+        try:
+            self._epochs = await backend.begin_writes(
+                [_statement_keys(entity, entity_id) for entity, entity_id in self.entities],
+                settings.CACHE_WRITE_TTL
+            )
+        except Exception as e:
+            _on_cache_error(e, "registrando escritura")
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
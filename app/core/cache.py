@@ -1,198 +1,1581 @@
 """
-Módulo de cache con Redis para optimizar consultas pesadas.
+Módulo de cache para optimizar consultas pesadas.
+
+El cache de statements tiene dos niveles:
+- Local: LRU en memoria del proceso, acotado en tamaño y con TTL corto.
+- Compartido: el backend configurado en CACHE_BACKEND (Redis por defecto, ver
+  app.core.cache_backends), con claves versionadas por generación.
+
+Los statements se guardan como el cuerpo JSON final de la respuesta (opcionalmente
+comprimido con gzip), de modo que un hit no deserializa ni valida nada.
+
+Además se cachean snapshots de colegios y estudiantes por ID (get_entity_snapshot),
+que usan las validaciones de los endpoints de escritura y los GET por ID.
+
+Las invalidaciones se difunden entre workers por el pub/sub del backend para
+vaciar el nivel local de todos los procesos.
 """
+import gzip
+import hashlib
 import json
 import logging
-from typing import Optional, Any
-import redis
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from functools import partial
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeoutError
+from contextvars import ContextVar
+from typing import Optional, Any, Tuple, Dict, List, Set, Callable, Iterator, NamedTuple, Type, TypeVar
+from fastapi import Response
+from pydantic import BaseModel
 from app.core.config import settings
+from app.core.etag import encoded_etag, make_etag
+from app.core.pagination import Keyset
+from app.core.cache_backends import (
+    CacheBackend, CacheCounters, StatementKeys, TotalsWrite, create_cache_backend
+)
 
 logger = logging.getLogger(__name__)
 
-# Cliente Redis (singleton)
-_redis_client: Optional[redis.Redis] = None
+# Backend del cache compartido (se crea al primer uso según CACHE_BACKEND)
+_cache_backend: Optional[CacheBackend] = None
+_cache_backend_lock = threading.Lock()
+
+# Canal de pub/sub para difundir invalidaciones entre workers
+INVALIDATION_CHANNEL = "cache:invalidations"
+
 
+def get_cache_backend() -> CacheBackend:
+    """Obtiene el backend del cache compartido (singleton configurado con CACHE_BACKEND)."""
+    global _cache_backend
+    if _cache_backend is None:
+        with _cache_backend_lock:
+            if _cache_backend is None:
+                _cache_backend = create_cache_backend()
+                logger.info(f"Backend de cache: {_cache_backend.name}")
+    return _cache_backend
 
-def get_redis_client() -> Optional[redis.Redis]:
+
+def set_cache_backend(backend: CacheBackend):
     """
-    Obtiene el cliente Redis (singleton).
-    Retorna None si Redis no está disponible.
+    Reemplaza el backend del cache compartido (ej: MemoryCacheBackend en tests o benchmarks).
+    Vacía el nivel local, que podría tener valores del backend anterior.
     """
-    global _redis_client
+    global _cache_backend
+    _cache_backend = backend
+    _local_cache.clear()
+
+
+def _on_cache_error(e: Exception, action: str):
+    """Registra un error del backend (los de conexión cuentan para el circuit breaker de Redis)."""
+    _backend_counters.incr("errors")
+    logger.warning(f"Error {action}: {e}")
+    get_cache_backend().record_error(e)
+
+
+def get_cache_status() -> Dict[str, Any]:
+    """Estado del backend del cache (para /health)."""
+    return get_cache_backend().status()
+
+
+class LocalCache:
+    """
+    Cache LRU en memoria del proceso, acotado en tamaño y con TTL por entrada.
     
-    if _redis_client is not None:
-        return _redis_client
+    Cada entrada pertenece a un tag (ej: "student:{id}") que permite invalidar
+    todas las variantes de una entidad de una sola vez.
+    """
     
-    try:
-        _redis_client = redis.from_url(
-            settings.REDIS_URL,
-            decode_responses=True,
-            socket_connect_timeout=2,
-            socket_timeout=2
-        )
-        # Test de conexión
-        _redis_client.ping()
-        logger.info("Redis cache conectado exitosamente")
-        return _redis_client
-    except Exception as e:
-        logger.warning(f"Redis no disponible: {e}. Cache deshabilitado.")
-        _redis_client = None
-        return None
+    def __init__(self, max_entries: int = 1024, ttl: float = 10, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expira_en, tag, valor)
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._invalidations = 0
+        self.counters = CacheCounters("hits", "misses", "evictions", "expirations")
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Retorna el valor de la clave o None si no existe o expiró."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._remove(key)
+                self.counters.incr("expirations")
+                entry = None
+            if entry is None:
+                self.counters.incr("misses")
+                return None
+            self._entries.move_to_end(key)
+            self.counters.incr("hits")
+            return entry[2]
+    
+    def invalidation_mark(self) -> int:
+        """
+        Marca de invalidaciones a capturar antes de leer del origen.
+        Pasarla a set() evita guardar un valor que fue invalidado mientras se leía.
+        """
+        with self._lock:
+            return self._invalidations
+    
+    def set(self, key: str, value: Any, tag: str, invalidation_mark: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Guarda un valor, desalojando las entradas menos usadas si se supera el tamaño.
+        ttl permite acortar la vida de la entrada respecto del TTL por defecto.
+        """
+        with self._lock:
+            if invalidation_mark is not None and invalidation_mark != self._invalidations:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + (self.ttl if ttl is None else ttl), tag, value)
+            self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.counters.incr("evictions")
+    
+    def invalidate_tag(self, tag: str):
+        """Elimina todas las entradas de un tag."""
+        with self._lock:
+            self._invalidations += 1
+            for key in self._tags.pop(tag, set()):
+                self._entries.pop(key, None)
+    
+    def clear(self):
+        """Elimina todas las entradas."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+            self._tags.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Contadores del nivel local."""
+        stats = self.counters.snapshot()
+        stats["entries"] = len(self._entries)
+        return stats
+    
+    def _remove(self, key: str):
+        _, tag, _ = self._entries.pop(key)
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+
+class InMemoryInvalidationBroker:
+    """
+    Broker de invalidaciones en memoria.
+    Entrega los mensajes de forma síncrona a los suscriptores (útil para tests).
+    """
+    
+    def __init__(self):
+        self._handlers = []
+    
+    @property
+    def listening(self) -> bool:
+        return bool(self._handlers)
+    
+    def publish(self, tag: str):
+        for handler in list(self._handlers):
+            handler(tag)
+    
+    def publish_many(self, tags: List[str]):
+        for tag in tags:
+            self.publish(tag)
+    
+    def subscribe(self, handler: Callable[[str], None], on_error: Optional[Callable[[], None]] = None) -> bool:
+        self._handlers.append(handler)
+        return True
+    
+    def close(self):
+        self._handlers.clear()
+
+
+class BackendInvalidationBroker:
+    """Broker de invalidaciones sobre el pub/sub del backend (con Redis, un hilo suscriptor por worker)."""
+    
+    def __init__(self, channel: str = INVALIDATION_CHANNEL):
+        self.channel = channel
+        self._subscription = None
+    
+    @property
+    def listening(self) -> bool:
+        return self._subscription is not None and self._subscription.active
+    
+    def publish(self, tag: str):
+        self.publish_many([tag])
+    
+    def publish_many(self, tags: List[str]):
+        """Publica varios tags en un solo mensaje (separados por espacios)."""
+        backend = get_cache_backend()
+        if not tags or not backend.available():
+            return
+        try:
+            backend.publish(self.channel, " ".join(tags))
+        except Exception as e:
+            _on_cache_error(e, "publicando invalidación")
+    
+    def subscribe(self, handler: Callable[[str], None], on_error: Optional[Callable[[], None]] = None) -> bool:
+        backend = get_cache_backend()
+        # Un backend en memoria del proceso no necesita un nivel local delante
+        if not backend.shared or not backend.available():
+            return False
+        try:
+            self._subscription = backend.subscribe(self.channel, handler, on_error)
+        except Exception as e:
+            logger.warning(f"No se pudo suscribir al canal de invalidaciones: {e}")
+            self._subscription = None
+        return self._subscription is not None
+    
+    def close(self):
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+
+
+# Nivel local del cache de statements y broker de invalidaciones del proceso
+_local_cache = LocalCache(settings.LOCAL_CACHE_MAX_ENTRIES, settings.LOCAL_CACHE_TTL)
+_invalidation_broker = BackendInvalidationBroker()
+_backend_counters = CacheCounters("hits", "misses", "errors")
+_flight_counters = CacheCounters("computed", "coalesced", "lock_waits")
+_stale_counters = CacheCounters("stale_while_revalidate", "stale_if_error")
+_entity_counters = CacheCounters("hits", "misses")
+_count_counters = CacheCounters("hits", "misses")
+
+# Recálculos en curso dentro del proceso (clave versionada -> Future con el resultado)
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def set_invalidation_broker(broker):
+    """
+    Reemplaza el broker de invalidaciones (ej: InMemoryInvalidationBroker en tests).
+    Detiene el broker anterior.
+    """
+    global _invalidation_broker
+    _invalidation_broker.close()
+    _invalidation_broker = broker
+
+
+def start_invalidation_listener() -> bool:
+    """
+    Suscribe el nivel local a las invalidaciones de otros workers.
+    Mientras no haya suscripción activa el nivel local no se utiliza,
+    ya que no podría enterarse de escrituras hechas en otros procesos.
+    """
+    if not settings.LOCAL_CACHE_ENABLED:
+        return False
+    started = _invalidation_broker.subscribe(_on_invalidation_message, on_error=_local_cache.clear)
+    if started:
+        logger.info("Cache local habilitado (suscrito a invalidaciones)")
+    return started
+
+
+def _on_invalidation_message(message: str):
+    """Vacía del nivel local los tags de un mensaje de invalidación."""
+    for tag in message.split():
+        _local_cache.invalidate_tag(tag)
+
+
+def stop_invalidation_listener():
+    """Cancela la suscripción y vacía el nivel local."""
+    _invalidation_broker.close()
+    _local_cache.clear()
+
+
+def _local_tier_enabled() -> bool:
+    return settings.LOCAL_CACHE_ENABLED and _invalidation_broker.listening
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Contadores de hits/misses/evictions por nivel de cache.
+    Para el backend compartido se agregan sus propias estadísticas
+    (con Redis, las evictions del servidor y el estado del circuit breaker).
+    """
+    backend = get_cache_backend()
+    backend_stats = {"name": backend.name, **_backend_counters.snapshot()}
+    if backend.available():
+        try:
+            backend_stats.update(backend.stats())
+        except Exception as e:
+            _on_cache_error(e, "leyendo estadísticas del backend")
+    return {
+        "local": _local_cache.stats(),
+        "backend": backend_stats,
+        "single_flight": _flight_counters.snapshot(),
+        "stale": _stale_counters.snapshot(),
+        "entities": _entity_counters.snapshot(),
+        "counts": _count_counters.snapshot()
+    }
+
+
+# Las claves de statement incluyen la generación vigente de la entidad:
+#   {entity}:{id}:statement:gen                       -> contador de generación
+#   {entity}:{id}:statement:{gen}:invoices:{b}:{n}    -> bloque n de b facturas
+# Invalidar es incrementar el contador; las páginas de generaciones anteriores
+# quedan inalcanzables y expiran solas por TTL (sin KEYS ni DEL masivos).
+#
+# Los totales (variante "summary") no dependen de la generación: se guardan en un hash
+#   {entity}:{id}:statement:totals   -> montos en centavos + JSON del resto del resumen
+# que las escrituras actualizan con deltas (HINCRBY) en lugar de borrarlo.
+#   {entity}:{id}:statement:writers  -> escrituras en curso (con TTL)
+# Mientras hay escrituras en curso no se guardan totales recalculados, porque la
+# consulta pudo ver o no el commit y el delta se aplicaría dos veces.
+GENERATION_TTL = 86400  # 1 día; debe ser mayor que STATEMENT_CACHE_HARD_TTL
+
+SUMMARY_VARIANT = "summary"
+
+# Intervalo de sondeo mientras otro worker recalcula un statement
+_LOCK_POLL_INTERVAL = 0.05
+
+# Qué hacer con un statement leído del cache (ver _statement_freshness)
+_FRESH = "fresh"
+_REVALIDATE = "revalidate"
+_RECOMPUTE = "recompute"
+
+
+def _clock_generation() -> int:
+    """Generación inicial basada en el reloj (microsegundos)."""
+    return time.time_ns() // 1000
+
+
+def _statement_prefix(entity: str, entity_id) -> str:
+    """Prefijo de las claves de statement de una entidad (ej: "student:{id}:statement:")."""
+    return f"{entity}:{entity_id}:statement:"
+
+
+def _entity_tag(entity: str, entity_id) -> str:
+    """Tag de invalidación de una entidad (ej: "student:{id}")."""
+    return f"{entity}:{entity_id}"
+
+
+def _statement_keys(entity: str, entity_id) -> StatementKeys:
+    """Claves de generación, totales y escrituras en curso de una entidad."""
+    return StatementKeys.for_prefix(_statement_prefix(entity, entity_id))
+
+
+def _variant_key(entity: str, entity_id, generation: str, variant: str) -> str:
+    """Clave de una variante bajo una generación; identifica también su recálculo en curso."""
+    return f"{_statement_prefix(entity, entity_id)}{generation}:{variant}"
+
+
+def _lock_key(variant_key: str) -> str:
+    """Clave del lock de recálculo de una variante entre workers."""
+    return f"{variant_key}:lock"
+
+
+def _to_cents(amount) -> int:
+    """Convierte un monto (Decimal o string con 2 decimales) a centavos."""
+    return int(Decimal(str(amount)).scaleb(2))
+
+
+def _from_cents(cents: int) -> str:
+    """Convierte centavos al formato en que Pydantic serializa los montos (ej: "100.00")."""
+    return str(Decimal(cents).scaleb(-2))
+
+
+class CacheToken(NamedTuple):
+    """
+    Estado del cache leído antes de calcular un statement.
+    Se pasa a set_cached_statement para no guardar resultados ya invalidados.
+    """
+    generation: str
+    local_mark: Optional[int] = None
+    # Momento (epoch) en que se guardó el valor retornado junto al token; None en un miss
+    stored_at: Optional[float] = None
+    
+    @property
+    def age(self) -> Optional[float]:
+        """Antigüedad en segundos del valor retornado junto al token."""
+        return None if self.stored_at is None else time.time() - self.stored_at
+
+
+class CachedBody(NamedTuple):
+    """Cuerpo JSON de una respuesta cacheada, opcionalmente comprimido con gzip."""
+    content: bytes
+    compressed: bool = False
+    # ETag de la versión con que se armó el cuerpo (None si no se conoce)
+    etag: Optional[str] = None
+    
+    @classmethod
+    def from_value(cls, value: Any) -> "CachedBody":
+        """
+        Serializa un valor una sola vez (igual que lo haría FastAPI con response_model).
+        Los cuerpos de al menos STATEMENT_CACHE_COMPRESSION_MIN_SIZE bytes se comprimen.
+        """
+        if isinstance(value, cls):
+            return value
+        if hasattr(value, 'model_dump_json'):
+            content = value.model_dump_json().encode()
+        else:
+            content = json.dumps(value, default=str, separators=(",", ":")).encode()
+        return cls._from_content(content)
+    
+    @classmethod
+    def from_lines(cls, values) -> "CachedBody":
+        """Serializa una lista de modelos como objetos JSON separados por saltos de línea."""
+        return cls._from_content(b"\n".join(value.model_dump_json().encode() for value in values))
+    
+    @classmethod
+    def _from_content(cls, content: bytes) -> "CachedBody":
+        if settings.STATEMENT_CACHE_COMPRESSION and len(content) >= settings.STATEMENT_CACHE_COMPRESSION_MIN_SIZE:
+            return cls(gzip.compress(content, compresslevel=settings.STATEMENT_CACHE_COMPRESSION_LEVEL), True)
+        return cls(content, False)
+    
+    def json_bytes(self) -> bytes:
+        """Cuerpo JSON sin comprimir."""
+        return gzip.decompress(self.content) if self.compressed else self.content
+    
+    def as_response(self, accept_encoding: str = "") -> Response:
+        """
+        Respuesta HTTP con el cuerpo tal cual está cacheado.
+        Si el cliente acepta gzip, el cuerpo comprimido se envía sin descomprimir
+        (con un ETag distinto al de la representación sin comprimir).
+        """
+        headers = {"Vary": "Accept-Encoding"}
+        if self.compressed and "gzip" in accept_encoding.lower():
+            headers["Content-Encoding"] = "gzip"
+            if self.etag:
+                headers["ETag"] = encoded_etag(self.etag, "gzip")
+            return Response(content=self.content, media_type="application/json", headers=headers)
+        if self.etag:
+            headers["ETag"] = self.etag
+        return Response(content=self.json_bytes(), media_type="application/json", headers=headers)
+
+
+def _encode_statement(body: CachedBody) -> Tuple[bytes, float]:
+    """Serializa un statement con su momento de guardado ("{stored_at}|{z|j}|{cuerpo}")."""
+    stored_at = round(time.time(), 3)
+    header = f"{stored_at:.3f}|{'z' if body.compressed else 'j'}|".encode()
+    return header + body.content, stored_at
+
 
+def _decode_statement(raw: bytes) -> Tuple[CachedBody, float]:
+    """Deserializa un statement guardado con _encode_statement. Retorna (cuerpo, stored_at)."""
+    stored_at, encoding, content = raw.split(b"|", 2)
+    return CachedBody(content, encoding == b"z"), float(stored_at)
 
-def get_cached_statement(key: str) -> Optional[Any]:
+
+def _decode_totals(totals: Dict[str, Any]) -> Tuple[CachedBody, float]:
+    """
+    Arma el JSON del resumen a partir del hash de totales. Retorna (cuerpo, stored_at).
+    """
+    summary = json.loads(totals["doc"])
+    invoiced, paid = int(totals["total_invoiced"]), int(totals["total_paid"])
+    summary["total_invoiced"] = _from_cents(invoiced)
+    summary["total_paid"] = _from_cents(paid)
+    summary["total_pending"] = _from_cents(invoiced - paid)
+    summary["total_invoices"] = int(totals["total_invoices"])
+    content = json.dumps(summary, separators=(",", ":"), ensure_ascii=False).encode()
+    return CachedBody(content), float(totals["stored_at"])
+
+
+def _read_statements(
+    backend: CacheBackend,
+    entity: str,
+    entity_id,
+    variants: List[str]
+) -> Tuple[str, List[Optional[Tuple[CachedBody, float]]]]:
+    """
+    Lee la generación vigente y varias variantes del backend en una sola operación.
+    Retorna (generación, [(cuerpo, stored_at) o None por variante]).
     """
-    Obtiene un statement del cache.
+    page_variants = [variant for variant in variants if variant != SUMMARY_VARIANT]
+    generation, totals, payloads = backend.read_statements(
+        _statement_keys(entity, entity_id),
+        page_variants,
+        SUMMARY_VARIANT in variants,
+        _clock_generation(),
+        GENERATION_TTL
+    )
+    return generation, _decode_statements(variants, page_variants, totals, payloads)
+
+
+def _decode_statements(
+    variants: List[str],
+    page_variants: List[str],
+    totals: Optional[Dict[str, Any]],
+    payloads: List[Optional[bytes]]
+) -> List[Optional[Tuple[CachedBody, float]]]:
+    """Decodifica lo leído con read_statements en el orden de variants."""
+    pages = dict(zip(page_variants, payloads))
+    values = []
+    for variant in variants:
+        if variant == SUMMARY_VARIANT:
+            values.append(_decode_totals(totals) if totals else None)
+        elif pages[variant]:
+            values.append(_decode_statement(pages[variant]))
+        else:
+            values.append(None)
+    return values
+
+
+def get_cached_statement(entity: str, entity_id, variant: str) -> Tuple[Optional[CachedBody], Optional[CacheToken]]:
+    """
+    Obtiene el cuerpo serializado de un statement del cache (primero del nivel local, luego del backend).
+    
+    El valor puede estar vencido (más antiguo que STATEMENT_CACHE_SOFT_TTL);
+    su antigüedad está disponible en token.age.
     
     Args:
-        key: Clave de cache (ej: "student:1:statement")
+        entity: Tipo de entidad ("student" o "school")
+        entity_id: ID de la entidad (UUID)
+        variant: Variante del statement (ej: "summary" o "invoices:50:0")
     
     Returns:
-        Datos cacheados o None si no existe
+        Tupla (cuerpo cacheado o None, token o None si el backend no está disponible).
+        El token debe pasarse a set_cached_statement al guardar el resultado.
     """
-    redis_client = get_redis_client()
-    if not redis_client:
-        return None
+    return get_cached_statements(entity, entity_id, [variant])[0]
+
+
+def get_cached_statements(
+    entity: str,
+    entity_id,
+    variants: List[str]
+) -> List[Tuple[Optional[CachedBody], Optional[CacheToken]]]:
+    """
+    Obtiene varias variantes del statement de una entidad.
+    Las que no están en el nivel local se leen del backend en un solo round trip.
+    
+    Returns:
+        Una tupla (cuerpo o None, token o None) por variante, en el mismo orden.
+    """
+    results, pending, local_mark = _get_local_statements(entity, entity_id, variants)
+    if not pending:
+        return results
+    
+    backend = get_cache_backend()
+    if not backend.available():
+        return results
     
     try:
-        cached = redis_client.get(key)
-        if cached:
-            logger.debug(f"Cache hit: {key}")
-            return json.loads(cached)
+        generation, values = _read_statements(backend, entity, entity_id, [variants[index] for index in pending])
+        _merge_backend_statements(entity, entity_id, variants, results, pending, generation, values, local_mark)
     except Exception as e:
-        logger.warning(f"Error leyendo cache: {e}")
+        _on_cache_error(e, "leyendo cache")
     
-    return None
+    return results
+
+
+def _get_local_statements(
+    entity: str,
+    entity_id,
+    variants: List[str]
+) -> Tuple[List[Tuple[Optional[CachedBody], Optional[CacheToken]]], List[int], Optional[int]]:
+    """
+    Busca las variantes en el nivel local.
+    Retorna (resultados, índices a leer del backend, marca de invalidación del nivel local o None).
+    """
+    results: List[Tuple[Optional[CachedBody], Optional[CacheToken]]] = [(None, None)] * len(variants)
+    if not _local_tier_enabled():
+        return results, list(range(len(variants))), None
+    
+    prefix = _statement_prefix(entity, entity_id)
+    pending = []
+    for index, variant in enumerate(variants):
+        entry = _local_cache.get(f"{prefix}{variant}")
+        if entry is not None:
+            results[index] = entry
+        else:
+            pending.append(index)
+    return results, pending, _local_cache.invalidation_mark() if pending else None
+
+
+def _merge_backend_statements(
+    entity: str,
+    entity_id,
+    variants: List[str],
+    results: List[Tuple[Optional[CachedBody], Optional[CacheToken]]],
+    pending: List[int],
+    generation: str,
+    values: List[Optional[Tuple[CachedBody, float]]],
+    local_mark: Optional[int]
+):
+    """Completa results con lo leído del backend para los índices pendientes (y lo guarda en el nivel local)."""
+    for index, cached in zip(pending, values):
+        if cached is None:
+            _backend_counters.incr("misses")
+            results[index] = (None, CacheToken(generation, local_mark))
+            continue
+        _backend_counters.incr("hits")
+        logger.debug(f"Cache hit: {_variant_key(entity, entity_id, generation, variants[index])}")
+        value, stored_at = cached
+        token = CacheToken(generation, local_mark, stored_at)
+        _remember_local(entity, entity_id, variants[index], value, token)
+        results[index] = (value, token)
+
+
+def _remember_local(entity: str, entity_id, variant: str, value: CachedBody, token: CacheToken):
+    """
+    Guarda un valor en el nivel local si fue leído con el nivel local habilitado.
+    Solo se guardan valores frescos, y nunca más allá de su soft TTL.
+    """
+    if token.local_mark is None or not _local_tier_enabled():
+        return
+    remaining = settings.STATEMENT_CACHE_SOFT_TTL - (token.age or 0)
+    if remaining <= 0:
+        return
+    _local_cache.set(
+        f"{_statement_prefix(entity, entity_id)}{variant}",
+        (value, token),
+        _entity_tag(entity, entity_id),
+        token.local_mark,
+        ttl=min(_local_cache.ttl, remaining)
+    )
 
 
-def set_cached_statement(key: str, value: Any, ttl: int = 60):
+def set_cached_statement(
+    entity: str,
+    entity_id,
+    variant: str,
+    value: CachedBody,
+    token: Optional[CacheToken],
+    ttl: Optional[int] = None
+):
     """
-    Guarda un statement en el cache.
+    Guarda un statement en el cache bajo la generación leída antes de calcularlo.
+    
+    Si la entidad fue invalidada mientras se calculaba, la clave corresponde a una
+    generación ya vencida y el valor nunca se sirve. Los totales ("summary") se
+    guardan en el hash de totales solo si la generación no cambió y no hay
+    escrituras en curso.
     
     Args:
-        key: Clave de cache
-        value: Valor a guardar
-        ttl: Tiempo de vida en segundos (default: 60)
+        entity: Tipo de entidad ("student" o "school")
+        entity_id: ID de la entidad (UUID)
+        variant: Variante del statement (ej: "summary" o "invoices:50:0")
+        value: Cuerpo serializado a guardar (CachedBody.from_value)
+        token: Token retornado por get_cached_statement
+        ttl: Tiempo de vida en el backend en segundos (default: STATEMENT_CACHE_HARD_TTL).
+            El valor se considera fresco solo durante STATEMENT_CACHE_SOFT_TTL.
     """
-    redis_client = get_redis_client()
-    if not redis_client:
+    if token is None:
+        return
+    
+    backend = get_cache_backend()
+    if not backend.available():
+        return
+    
+    if variant == SUMMARY_VARIANT:
+        _set_cached_totals(backend, entity, entity_id, value, token, ttl)
         return
     
     try:
-        # Convertir a dict si es un modelo Pydantic
-        if hasattr(value, 'model_dump'):
-            value_dict = value.model_dump()
-        elif hasattr(value, 'dict'):
-            value_dict = value.dict()
-        else:
-            value_dict = value
-        
-        redis_client.setex(
-            key,
-            ttl,
-            json.dumps(value_dict, default=str)
-        )
+        encoded, stored_at = _encode_statement(value)
+        key = _variant_key(entity, entity_id, token.generation, variant)
+        backend.set(key, encoded, ttl or settings.STATEMENT_CACHE_HARD_TTL)
+        _remember_local(entity, entity_id, variant, value, token._replace(stored_at=stored_at))
         logger.debug(f"Cache guardado: {key}")
     except Exception as e:
-        logger.warning(f"Error guardando en cache: {e}")
+        _on_cache_error(e, "guardando en cache")
 
 
-def invalidate_student_statement(student_id):
+def _set_cached_totals(backend: CacheBackend, entity: str, entity_id, value: CachedBody, token: CacheToken, ttl: Optional[int]):
+    """Guarda el resumen en el hash de totales (montos en centavos) con compare-and-set."""
+    try:
+        fields, stored_at = _totals_fields(value)
+        stored = backend.store_totals(
+            _statement_keys(entity, entity_id),
+            token.generation,
+            ttl or settings.STATEMENT_CACHE_HARD_TTL,
+            fields
+        )
+        if stored:
+            _remember_local(entity, entity_id, SUMMARY_VARIANT, value, token._replace(stored_at=stored_at))
+            logger.debug(f"Totales guardados: {entity} {entity_id}")
+    except Exception as e:
+        _on_cache_error(e, "guardando totales en cache")
+
+
+def _totals_fields(value: CachedBody) -> Tuple[Dict[str, Any], float]:
+    """Campos del hash de totales para un resumen (montos en centavos). Retorna (campos, stored_at)."""
+    summary = json.loads(value.json_bytes())
+    stored_at = round(time.time(), 3)
+    fields = {
+        "epoch": uuid.uuid4().hex,
+        "stored_at": f"{stored_at:.3f}",
+        "doc": value.json_bytes(),
+        "total_invoiced": _to_cents(summary.get("total_invoiced", 0)),
+        "total_paid": _to_cents(summary.get("total_paid", 0)),
+        "total_invoices": summary.get("total_invoices", 0)
+    }
+    return fields, stored_at
+
+
+def get_or_compute_statement(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Any],
+    background_tasks=None
+) -> CachedBody:
     """
-    Invalida el cache del statement de un estudiante.
-    Invalida todas las variantes de paginación usando un patrón.
+    Obtiene un statement del cache o lo calcula, coalesciendo recálculos concurrentes.
+    
+    Según la antigüedad del valor cacheado:
+    - Menor a STATEMENT_CACHE_SOFT_TTL: se sirve directamente.
+    - Dentro de STATEMENT_CACHE_STALE_WHILE_REVALIDATE adicionales: se sirve el
+      valor vencido y se refresca en background (stale-while-revalidate).
+    - Hasta STATEMENT_CACHE_HARD_TTL: se recalcula, pero si compute() falla se
+      sirve el valor vencido (stale-if-error).
+    
+    Ante un miss solo un hilo por proceso ejecuta compute(); el resto espera su
+    resultado. Entre procesos, un lock corto en el backend hace que los demás workers
+    esperen a que el valor aparezca en el cache en lugar de recalcularlo.
+    Las claves incluyen la generación, así que una escritura posterior nunca se
+    une a un recálculo iniciado antes de ella.
     
     Args:
-        student_id: ID del estudiante (UUID)
+        entity: Tipo de entidad ("student" o "school")
+        entity_id: ID de la entidad (UUID)
+        variant: Variante del statement (ej: "summary" o "invoices:50:0")
+        compute: Función que calcula el statement desde la base de datos
+        background_tasks: BackgroundTasks del request para refrescar valores vencidos.
+            Sin él, los valores vencidos se recalculan en el request.
+    
+    Returns:
+        El cuerpo serializado del statement, cacheado o recién calculado.
+        Las excepciones de compute() se propagan a todos los que esperaban.
     """
-    # Invalidar todas las variantes de paginación usando un patrón
-    redis_client = get_redis_client()
-    if not redis_client:
-        return
+    return get_or_compute_statements(entity, entity_id, [(variant, compute)], background_tasks)[0]
+
+
+def get_or_compute_statements(
+    entity: str,
+    entity_id,
+    items: List[Tuple[str, Callable[[], Any]]],
+    background_tasks=None
+) -> List[CachedBody]:
+    """
+    Igual que get_or_compute_statement para varias variantes de una entidad:
+    todas se leen del cache en un solo round trip y las faltantes se calculan
+    en orden (la primera excepción se propaga).
+    
+    Args:
+        items: Pares (variante, compute) a resolver
+    """
+    cached_entries = get_cached_statements(entity, entity_id, [variant for variant, _ in items])
+    return [
+        _resolve_statement(entity, entity_id, variant, compute, cached, token, background_tasks)
+        for (variant, compute), (cached, token) in zip(items, cached_entries)
+    ]
+
+
+def _resolve_statement(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Any],
+    cached: Optional[CachedBody],
+    token: Optional[CacheToken],
+    background_tasks
+) -> CachedBody:
+    """Aplica las reglas de frescura (soft TTL, SWR, stale-if-error) a un valor leído del cache."""
+    freshness = _statement_freshness(cached, token, background_tasks is not None)
+    if freshness == _FRESH:
+        return cached
+    if freshness == _REVALIDATE:
+        background_tasks.add_task(_refresh_statement, entity, entity_id, variant, compute, token)
+        return cached
     
     try:
-        pattern = f"student:{student_id}:statement:*"
-        keys = redis_client.keys(pattern)
-        if keys:
-            redis_client.delete(*keys)
-            logger.info(f"Cache invalidado: {len(keys)} claves para student {student_id}")
+        return _single_flight(entity, entity_id, variant, compute, token)
     except Exception as e:
-        logger.warning(f"Error invalidando cache: {e}")
+        return _stale_if_error(entity, entity_id, cached, e)
 
 
-def invalidate_school_statement(school_id):
+def _statement_freshness(cached: Optional[CachedBody], token: Optional[CacheToken], can_revalidate: bool) -> str:
     """
-    Invalida el cache del statement de un colegio.
-    Invalida todas las variantes de paginación usando un patrón.
+    Decide según la antigüedad del valor cacheado (ver get_or_compute_statement) si se
+    sirve (_FRESH), se sirve y se refresca en background (_REVALIDATE) o se recalcula
+    (_RECOMPUTE). can_revalidate indica si hay dónde programar el refresh.
+    """
+    if cached is None:
+        return _RECOMPUTE
+    age = token.age or 0
+    if age < settings.STATEMENT_CACHE_SOFT_TTL:
+        return _FRESH
+    swr_limit = settings.STATEMENT_CACHE_SOFT_TTL + settings.STATEMENT_CACHE_STALE_WHILE_REVALIDATE
+    if age < swr_limit and can_revalidate:
+        _stale_counters.incr("stale_while_revalidate")
+        return _REVALIDATE
+    return _RECOMPUTE
+
+
+def _stale_if_error(entity: str, entity_id, cached: Optional[CachedBody], error: Exception) -> CachedBody:
+    """
+    Valor vencido a servir cuando falla el recálculo (stale-if-error).
+    Relanza el error si no hay valor cacheado o si es de validación (ValueError).
+    """
+    if cached is None or isinstance(error, ValueError):
+        raise error
+    _stale_counters.incr("stale_if_error")
+    logger.warning(f"Error recalculando statement de {entity} {entity_id}; sirviendo valor vencido: {error}")
+    return cached
+
+
+def get_or_compute_statement_page(
+    entity: str,
+    entity_id,
+    skip: int,
+    limit: int,
+    compute_summary: Callable[[], Any],
+    compute_invoices: Callable[[int, int], List[Any]],
+    background_tasks=None,
+    keyset: Optional[Keyset] = None
+) -> CachedBody:
+    """
+    Arma el statement paginado de una entidad a partir de dos tipos de entradas de cache:
+    
+    - "summary": los totales, compartidos por todas las páginas.
+    - "invoices:{b}:{n}": bloques de STATEMENT_PAGE_BLOCK_SIZE facturas alineados
+      a múltiplos del tamaño de bloque; cualquier skip/limit se arma recortando
+      los bloques que cubren el rango.
+    
+    Así, paginar las facturas de un colegio reutiliza un único cálculo de totales
+    y la cantidad de claves no depende de las combinaciones de skip/limit.
+    El cuerpo se arma concatenando bytes ya serializados (sin revalidar).
     
     Args:
-        school_id: ID del colegio (UUID)
+        compute_summary: Calcula los totales (SchoolAccountSummary/StudentAccountSummary)
+        compute_invoices: compute_invoices(offset, size) retorna las facturas del bloque
+        keyset: Orden de las facturas; si se pasa, se agrega el next_cursor de la página
+    
+    Returns:
+        Cuerpo JSON con la forma de SchoolAccountStatus/StudentAccountStatus
     """
-    # Invalidar todas las variantes de paginación usando un patrón
-    redis_client = get_redis_client()
-    if not redis_client:
-        return
+    items = [(SUMMARY_VARIANT, compute_summary)] + [
+        (variant, partial(_compute_invoice_block, compute_invoices, offset, size))
+        for variant, offset, size in _statement_page_blocks(skip, _page_rows(limit, keyset))
+    ]
+    cached_entries = get_cached_statements(entity, entity_id, [variant for variant, _ in items])
+    summary, *blocks = [
+        _resolve_statement(entity, entity_id, variant, compute, cached, token, background_tasks)
+        for (variant, compute), (cached, token) in zip(items, cached_entries)
+    ]
+    return _build_statement_page(summary, blocks, skip, limit, _page_generation(cached_entries), keyset)
+
+
+def get_or_compute_statement_cursor_page(
+    entity: str,
+    entity_id,
+    cursor: str,
+    limit: int,
+    compute_summary: Callable[[], Any],
+    compute_invoices: Callable[[str, int], List[Any]],
+    keyset: Keyset,
+    background_tasks=None
+) -> CachedBody:
+    """
+    Arma una página del statement a partir de un cursor: los totales salen del cache
+    (la misma entrada "summary" que get_or_compute_statement_page) y las facturas se
+    leen de la base desde el cursor, sin OFFSET (los cursores no se cachean).
+    Sin ETag: la página no depende solo de la generación.
+    
+    Args:
+        compute_invoices: compute_invoices(cursor, size) retorna las facturas posteriores al cursor
+    
+    Raises:
+        InvalidCursorError: Si el cursor no es válido para el statement
+    """
+    keyset.decode(cursor)
+    summary = get_or_compute_statement(entity, entity_id, SUMMARY_VARIANT, compute_summary, background_tasks)
+    invoices = CachedBody.from_lines(compute_invoices(cursor, limit + 1))
+    return _build_statement_page(summary, [invoices], 0, limit, None, keyset)
+
+
+def _page_rows(limit: int, keyset: Optional[Keyset]) -> int:
+    """Filas a leer para una página: una extra si hay que saber si existe la siguiente."""
+    return limit + 1 if keyset is not None else limit
+
+
+def _statement_page_blocks(skip: int, limit: int) -> List[Tuple[str, int, int]]:
+    """Bloques de facturas que cubren una página: (variante, offset, tamaño) por bloque."""
+    block_size = settings.STATEMENT_PAGE_BLOCK_SIZE
+    return [
+        (f"invoices:{block_size}:{block}", block * block_size, block_size)
+        for block in range(skip // block_size, (skip + limit - 1) // block_size + 1)
+    ]
+
+
+def _page_generation(cached_entries: List[Tuple[Optional[CachedBody], Optional[CacheToken]]]) -> Optional[str]:
+    """Generación con que se leyeron todas las partes de una página (None si no coinciden)."""
+    generations = {token.generation if token else None for _, token in cached_entries}
+    return generations.pop() if len(generations) == 1 else None
+
+
+def _build_statement_page(
+    summary: CachedBody,
+    blocks: List[CachedBody],
+    skip: int,
+    limit: int,
+    generation: Optional[str],
+    keyset: Optional[Keyset] = None
+) -> CachedBody:
+    """
+    Recorta los bloques a la página pedida y la agrega al JSON de totales (sin revalidar).
+    Con keyset los bloques traen una fila extra, que solo indica si hay página siguiente:
+    el next_cursor se arma con la última factura de la página.
+    """
+    rows = []
+    for block in blocks:
+        content = block.json_bytes()
+        if content:
+            rows.extend(content.split(b"\n"))
+    start = skip % settings.STATEMENT_PAGE_BLOCK_SIZE
+    page = rows[start:start + _page_rows(limit, keyset)]
+    
+    # Agregar las facturas y la paginación al objeto JSON de totales
+    pagination = f',"skip":{skip},"limit":{limit}'
+    if keyset is not None:
+        next_cursor = keyset.cursor_for_row(json.loads(page[limit - 1])) if len(page) > limit else None
+        page = page[:limit]
+        pagination += f',"next_cursor":{json.dumps(next_cursor)}'
+    summary_json = summary.json_bytes()
+    content = (
+        summary_json[:-1]
+        + b',"invoices":[' + b",".join(page) + b"]"
+        + (pagination + "}").encode()
+    )
+    # El ETag usa la generación con que se leyeron todas las partes
+    return CachedBody(content, etag=_statement_etag(generation, skip, limit) if generation else None)
+
+
+def _statement_etag(generation: str, skip: int, limit: int) -> str:
+    return make_etag(generation, skip, limit)
+
+
+def get_statement_etag(entity: str, entity_id, skip: int, limit: int) -> Optional[str]:
+    """
+    ETag vigente de una página del statement, leyendo solo la generación del backend
+    (sin consultar la base). None si no se conoce (sin cache o generación inexistente).
+    """
+    backend = get_cache_backend()
+    if not backend.available():
+        return None
+    try:
+        generation = backend.get(_statement_keys(entity, entity_id).generation)
+    except Exception as e:
+        _on_cache_error(e, "leyendo generación")
+        return None
+    return _statement_etag(generation.decode(), skip, limit) if generation else None
+
+
+def _compute_invoice_block(compute_invoices: Callable[[int, int], List[Any]], offset: int, size: int) -> CachedBody:
+    """Calcula un bloque de facturas y lo serializa (una factura JSON por línea)."""
+    return CachedBody.from_lines(compute_invoices(offset, size))
+
+
+def _single_flight(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Any],
+    token: Optional[CacheToken]
+) -> CachedBody:
+    """Ejecuta compute() una sola vez por proceso para cada (generación, variante)."""
+    flight_key = _variant_key(entity, entity_id, token.generation if token else "", variant)
+    with _inflight_lock:
+        future = _inflight.get(flight_key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[flight_key] = future
+    
+    if not is_leader:
+        _flight_counters.incr("coalesced")
+        try:
+            return future.result(timeout=settings.CACHE_LOCK_TTL)
+        except (FutureTimeoutError, CancelledError):
+            # El líder no terminó a tiempo o desistió (refresh en background sin lock)
+            logger.warning(f"Sin resultado del recálculo de {flight_key}; calculando directamente")
+            return CachedBody.from_value(compute())
+    
+    try:
+        value = _compute_statement_with_lock(entity, entity_id, variant, compute, token)
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(flight_key, None)
+
+
+def _acquire_recompute_lock(backend: CacheBackend, lock_key: str) -> Optional[str]:
+    """Toma el lock de recálculo. Retorna el identificador del dueño, o None si ya estaba tomado."""
+    owner = uuid.uuid4().hex
+    if backend.set(lock_key, owner.encode(), ttl=settings.CACHE_LOCK_TTL, nx=True):
+        return owner
+    return None
+
+
+def _release_recompute_lock(backend: CacheBackend, lock_key: str, owner: str):
+    """Libera el lock de recálculo si sigue perteneciendo a owner."""
+    try:
+        backend.delete_if_equals(lock_key, owner.encode())
+    except Exception as e:
+        _on_cache_error(e, "liberando lock de recálculo")
+
+
+def _compute_statement_with_lock(
+    entity: str,
+    entity_id,
+    variant: str,
+    compute: Callable[[], Any],
+    token: Optional[CacheToken]
+) -> CachedBody:
+    """
+    Calcula un statement tomando un lock corto en el backend.
+    Si otro worker tiene el lock, espera a que publique el valor (hasta CACHE_LOCK_WAIT).
+    """
+    backend = get_cache_backend()
+    if token is None or not backend.available():
+        _flight_counters.incr("computed")
+        return CachedBody.from_value(compute())
     
+    key = _variant_key(entity, entity_id, token.generation, variant)
+    lock_key = _lock_key(key)
+    owner = None
     try:
-        pattern = f"school:{school_id}:statement:*"
-        keys = redis_client.keys(pattern)
-        if keys:
-            redis_client.delete(*keys)
-            logger.info(f"Cache invalidado: {len(keys)} claves para school {school_id}")
+        owner = _acquire_recompute_lock(backend, lock_key)
+        wait_for_other = owner is None
     except Exception as e:
-        logger.warning(f"Error invalidando cache: {e}")
+        _on_cache_error(e, "tomando lock de recálculo")
+        wait_for_other = False
+    
+    if wait_for_other:
+        # Otro worker está calculando: esperar a que publique un valor más nuevo
+        for _ in _lock_wait_rounds():
+            time.sleep(_LOCK_POLL_INTERVAL)
+            try:
+                _, (cached,) = _read_statements(backend, entity, entity_id, [variant])
+            except Exception as e:
+                _on_cache_error(e, "leyendo cache")
+                break
+            value = _accept_published(entity, entity_id, variant, token, cached)
+            if value is not None:
+                return value
+        logger.warning(f"Timeout esperando a otro worker para {key}; calculando directamente")
+    
+    try:
+        _flight_counters.incr("computed")
+        value = CachedBody.from_value(compute())
+        set_cached_statement(entity, entity_id, variant, value, token)
+        return value
+    finally:
+        if owner is not None:
+            _release_recompute_lock(backend, lock_key, owner)
+
+
+def _lock_wait_rounds() -> Iterator[None]:
+    """
+    Rondas de espera a otro worker que tiene el lock de recálculo, hasta CACHE_LOCK_WAIT:
+    en cada una el llamador duerme _LOCK_POLL_INTERVAL y relee el cache.
+    """
+    _flight_counters.incr("lock_waits")
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        yield
+
+
+def _accept_published(
+    entity: str,
+    entity_id,
+    variant: str,
+    token: CacheToken,
+    cached: Optional[Tuple[CachedBody, float]]
+) -> Optional[CachedBody]:
+    """
+    Valor publicado por el worker que tenía el lock, si es más nuevo que el leído antes
+    de esperar (se guarda en el nivel local). None si todavía no publicó uno.
+    """
+    if not cached:
+        return None
+    value, stored_at = cached
+    if token.stored_at is not None and stored_at <= token.stored_at:
+        return None
+    _remember_local(entity, entity_id, variant, value, token._replace(stored_at=stored_at))
+    return value
+
+
+def _refresh_statement(entity: str, entity_id, variant: str, compute: Callable[[], Any], token: CacheToken):
+    """
+    Refresca en background un statement vencido (stale-while-revalidate).
+    Si otro hilo o worker ya lo está recalculando, no hace nada.
+    
+    El recálculo se registra en _inflight recién después de tomar el lock de Redis: si
+    se registrara antes y otro worker tuviera el lock, los requests que se sumaron a este
+    recálculo se quedarían sin resultado.
+    """
+    flight_key = _variant_key(entity, entity_id, token.generation, variant)
+    with _inflight_lock:
+        if flight_key in _inflight:
+            return
+    
+    backend = get_cache_backend()
+    lock_key = _lock_key(flight_key)
+    owner = None
+    if backend.available():
+        owner = _acquire_recompute_lock(backend, lock_key)
+        if owner is None:
+            return
+    
+    with _inflight_lock:
+        registered = flight_key not in _inflight
+        if registered:
+            future = Future()
+            _inflight[flight_key] = future
+    
+    try:
+        if not registered:
+            # Un request del mismo proceso empezó a recalcularlo mientras se tomaba el lock
+            return
+        _flight_counters.incr("computed")
+        value = CachedBody.from_value(compute())
+        set_cached_statement(entity, entity_id, variant, value, token)
+        future.set_result(value)
+    except Exception as e:
+        logger.warning(f"Error refrescando statement de {entity} {entity_id}: {e}")
+        future.set_exception(e)
+    finally:
+        if owner is not None:
+            _release_recompute_lock(backend, lock_key, owner)
+        if registered:
+            with _inflight_lock:
+                _inflight.pop(flight_key, None)
+
+
+# Las invalidaciones (deltas de escrituras, incrementos de generación y de versión de
+# snapshots) no se aplican en el momento: se acumulan en el InvalidationBatch del request
+# y se aplican juntas al terminarlo, después del commit, en un solo round trip (más una
+# publicación con todos los tags). Fuera de un request (scripts, tests) se aplican al instante.
+_current_batch: ContextVar[Optional["InvalidationBatch"]] = ContextVar("cache_invalidation_batch", default=None)
+
+
+class InvalidationBatch:
+    """
+    Invalidaciones acumuladas durante un request.
+    
+    El middleware HTTP activa un batch por request y lo aplica al terminar:
+        
+        batch = InvalidationBatch()
+        try:
+            with batch:
+                response = await call_next(request)
+        finally:
+            await run_in_threadpool(batch.flush)
+    
+    Las invalidaciones repetidas sobre la misma entidad se aplican una sola vez;
+    las escrituras (StatementWrite) se aplican todas, cada una con sus deltas.
+    """
+    
+    def __init__(self):
+        self.writes: List[TotalsWrite] = []
+        self.generations: Dict[str, StatementKeys] = {}
+        self.versions: Dict[str, None] = {}
+        self.tags: Dict[str, None] = {}
+        self.flushed = False
+        self._token = None
+    
+    def __enter__(self) -> "InvalidationBatch":
+        self._token = _current_batch.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        _current_batch.reset(self._token)
+        return False
+    
+    def add(
+        self,
+        writes: List[TotalsWrite] = (),
+        generations: List[StatementKeys] = (),
+        versions: List[str] = (),
+        tags: List[str] = ()
+    ):
+        """Acumula invalidaciones (se aplican en flush)."""
+        self.writes.extend(writes)
+        for keys in generations:
+            self.generations[keys.prefix] = keys
+        self.versions.update(dict.fromkeys(versions))
+        self.tags.update(dict.fromkeys(tags))
+    
+    def flush(self):
+        """
+        Aplica las invalidaciones acumuladas en el backend y luego vacía el nivel local
+        de este y del resto de los workers (para descartar lecturas en curso).
+        Las invalidaciones agregadas después se aplican al instante.
+        """
+        self.flushed = True
+        if not (self.writes or self.generations or self.versions or self.tags):
+            return
+        backend = get_cache_backend()
+        if backend.available():
+            try:
+                backend.apply_invalidations(
+                    self.writes,
+                    list(self.generations.values()),
+                    list(self.versions),
+                    _clock_generation(),
+                    GENERATION_TTL
+                )
+                logger.info(
+                    f"Cache invalidado: {len(self.writes)} escrituras, {len(self.generations)} statements, "
+                    f"{len(self.versions)} snapshots"
+                )
+            except Exception as e:
+                _on_cache_error(e, "aplicando invalidaciones")
+        
+        tags = list(self.tags)
+        for tag in tags:
+            _local_cache.invalidate_tag(tag)
+        _invalidation_broker.publish_many(tags)
+
 
+def _invalidate(**invalidations):
+    """Acumula invalidaciones en el batch del request, o las aplica al instante si no hay uno."""
+    batch = _current_batch.get()
+    if batch is None or batch.flushed:
+        batch = InvalidationBatch()
+        batch.add(**invalidations)
+        batch.flush()
+    else:
+        batch.add(**invalidations)
 
-def invalidate_statements_for_invoice(invoice_id, db):
+
+def _bump_generation(entity: str, entity_id):
     """
-    Invalida los statements relacionados con una factura.
-    Necesita acceso a la DB para obtener student_id y school_id.
+    Invalida todos los statements de una entidad incrementando su generación
+    y notifica al resto de los workers para que vacíen su nivel local.
     
     Args:
-        invoice_id: ID de la factura (UUID)
-        db: Sesión de base de datos
+        entity: Tipo de entidad ("student" o "school")
+        entity_id: ID de la entidad (UUID)
+    """
+    _invalidate(generations=[_statement_keys(entity, entity_id)], tags=[_entity_tag(entity, entity_id)])
+
+
+class StatementWrite:
+    """
+    Escritura sobre datos financieros que mantiene al día los totales cacheados.
+    
+    Se usa como context manager alrededor del commit:
+        
+        with StatementWrite(student_id, school_id) as write:
+            db.add(payment)
+            db.commit()
+            write.add(total_paid=payment.amount)
+    
+    Al entrar registra la escritura en curso; al salir aplica los deltas a los totales
+    de ambas entidades de forma atómica (en Redis, un script Lua) e invalida solo las
+    páginas de facturas. Si el bloque falla, o se llamó a invalidate(), los totales se
+    descartan. Dentro de un request los deltas se aplican al terminarlo, junto con el
+    resto de las invalidaciones del request (ver InvalidationBatch).
     """
-    from app.models.invoice import Invoice
     
-    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-    if invoice:
-        invalidate_student_statement(invoice.student_id)
-        if invoice.student and invoice.student.school_id:
-            invalidate_school_statement(invoice.student.school_id)
+    def __init__(self, student_id, school_id):
+        self.entities = [("student", student_id), ("school", school_id)]
+        self.deltas = {"total_invoiced": 0, "total_paid": 0, "total_invoices": 0}
+        self.discard_totals = False
+        self._epochs: List[Optional[str]] = [None] * len(self.entities)
+    
+    def add(self, total_invoiced=0, total_paid=0, total_invoices: int = 0):
+        """Acumula deltas sobre los totales (montos en la moneda de la factura)."""
+        self.deltas["total_invoiced"] += _to_cents(total_invoiced)
+        self.deltas["total_paid"] += _to_cents(total_paid)
+        self.deltas["total_invoices"] += total_invoices
+    
+    def invalidate(self):
+        """Descarta los totales en lugar de aplicar deltas (ej: la factura cambió de estudiante)."""
+        self.discard_totals = True
+    
+    def __enter__(self) -> "StatementWrite":
+        backend = get_cache_backend()
+        if not backend.available():
+            return self
+        try:
+            self._epochs = backend.begin_writes(
+                [_statement_keys(entity, entity_id) for entity, entity_id in self.entities],
+                settings.CACHE_WRITE_TTL
+            )
+        except Exception as e:
+            _on_cache_error(e, "registrando escritura")
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # El commit pudo haberse hecho (parcialmente): no confiar en los deltas
+            self.discard_totals = True
+        self._apply()
+        return False
+    
+    def _apply(self):
+        _invalidate(
+            writes=[
+                TotalsWrite(
+                    _statement_keys(entity, entity_id),
+                    None if self.discard_totals else epoch,
+                    self.deltas
+                )
+                for (entity, entity_id), epoch in zip(self.entities, self._epochs)
+            ],
+            tags=[_entity_tag(entity, entity_id) for entity, entity_id in self.entities]
+        )
 
 
-def invalidate_statements_for_payment(payment_id, db):
+def invalidate_student_statement(student_id):
     """
-    Invalida los statements relacionados con un pago.
-    Necesita acceso a la DB para obtener invoice -> student -> school.
+    Invalida el cache del statement de un estudiante.
+    Todas las variantes de paginación quedan invalidadas al cambiar la generación.
     
     Args:
-        payment_id: ID del pago (UUID)
-        db: Sesión de base de datos
+        student_id: ID del estudiante (UUID)
     """
-    from app.models.payment import Payment
+    _bump_generation("student", student_id)
+
+
+def invalidate_school_statement(school_id):
+    """
+    Invalida el cache del statement de un colegio.
+    Todas las variantes de paginación quedan invalidadas al cambiar la generación.
     
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
-    if payment and payment.invoice:
-        invalidate_student_statement(payment.invoice.student_id)
-        if payment.invoice.student and payment.invoice.student.school_id:
-            invalidate_school_statement(payment.invoice.student.school_id)
+    Args:
+        school_id: ID del colegio (UUID)
+    """
+    _bump_generation("school", school_id)
 
 
-def _invalidate_key(key: str):
+def invalidate_statements(student_id, school_id):
     """
-    Invalida una clave de cache.
+    Invalida los statements de un estudiante y de su colegio.
+    Recibe el par ya conocido por la escritura (sin consultar la base).
     
     Args:
-        key: Clave a invalidar
+        student_id: ID del estudiante (UUID)
+        school_id: ID del colegio (UUID)
     """
-    redis_client = get_redis_client()
-    if not redis_client:
-        return
+    _bump_generation("student", student_id)
+    _bump_generation("school", school_id)
+
+
+# Snapshots de entidades (colegios y estudiantes) por ID:
+#   {entity}:{id}:version    -> versión de la fila (se incrementa en cada update/delete)
+#   {entity}:{id}:snapshot   -> "{versión}|{JSON del schema}"
+# Un snapshot solo es válido si su versión coincide con la vigente: una fila leída
+# antes de una escritura y guardada después nunca se sirve. La versión también es
+# el ETag de GET /schools/{id}, /students/{id} e /invoices/{id} (las facturas tienen
+# versión pero no snapshot).
+SnapshotT = TypeVar("SnapshotT", bound=BaseModel)
+
+
+def _snapshot_keys(entity: str, entity_id) -> Tuple[str, str]:
+    """Claves de versión y de snapshot de una entidad."""
+    return f"{entity}:{entity_id}:version", f"{entity}:{entity_id}:snapshot"
+
+
+def _snapshot_tag(entity: str, entity_id) -> str:
+    """Tag de invalidación del snapshot (distinto del de statements de la entidad)."""
+    return f"{entity}:{entity_id}:snapshot"
+
+
+def get_entity_snapshot(
+    entity: str,
+    entity_id,
+    schema: Type[SnapshotT],
+    load: Callable[[], Any]
+) -> Optional[SnapshotT]:
+    """
+    Obtiene un snapshot inmutable de una entidad, leyendo la base solo ante un miss.
+    
+    Args:
+        entity: Tipo de entidad ("student" o "school")
+        entity_id: ID de la entidad (UUID)
+        schema: Schema Pydantic (frozen) con el que se valida y serializa la fila
+        load: Función que lee la fila de la base (retorna None si no existe)
+    
+    Returns:
+        El snapshot, o None si la entidad no existe (los inexistentes no se cachean)
+    """
+    return get_versioned_entity_snapshot(entity, entity_id, schema, load)[0]
+
+
+def get_versioned_entity_snapshot(
+    entity: str,
+    entity_id,
+    schema: Type[SnapshotT],
+    load: Callable[[], Any]
+) -> Tuple[Optional[SnapshotT], Optional[str]]:
+    """
+    Igual que get_entity_snapshot, pero retorna también la versión con que se leyó
+    el snapshot (para el ETag), o None si el backend no está disponible.
+    """
+    version_key, snapshot_key = _snapshot_keys(entity, entity_id)
+    tag = _snapshot_tag(entity, entity_id)
+    use_local = _local_tier_enabled()
+    local_mark = None
+    if use_local:
+        cached = _local_cache.get(snapshot_key)
+        if cached is not None:
+            return cached
+        local_mark = _local_cache.invalidation_mark()
+    
+    backend = get_cache_backend()
+    version = None
+    if backend.available():
+        try:
+            version, raw = backend.mget([version_key, snapshot_key])
+            if version is None:
+                version = _seed_entity_version(backend, version_key)
+            else:
+                result = _decode_snapshot(schema, version, raw)
+                if result is not None:
+                    if use_local:
+                        _local_cache.set(snapshot_key, result, tag, local_mark)
+                    return result
+        except Exception as e:
+            _on_cache_error(e, "leyendo snapshot")
+            version = None
+    
+    _entity_counters.incr("misses")
+    row = load()
+    if row is None:
+        return None, None
+    snapshot = schema.model_validate(row)
     
+    if version is not None:
+        try:
+            backend.set(snapshot_key, _encode_snapshot(version, snapshot), ttl=settings.ENTITY_CACHE_TTL)
+        except Exception as e:
+            _on_cache_error(e, "guardando snapshot")
+    result = (snapshot, version.decode() if version is not None else None)
+    if use_local:
+        _local_cache.set(snapshot_key, result, tag, local_mark)
+    return result
+
+
+def _encode_snapshot(version: bytes, snapshot: BaseModel) -> bytes:
+    """Serializa un snapshot con la versión con que se leyó ("{versión}|{json}")."""
+    return version + b"|" + snapshot.model_dump_json().encode()
+
+
+def _decode_snapshot(schema: Type[SnapshotT], version: bytes, raw: Optional[bytes]) -> Optional[Tuple[SnapshotT, str]]:
+    """Snapshot guardado con _encode_snapshot y la versión, si corresponde a la versión vigente."""
+    if raw is None:
+        return None
+    stored_version, content = raw.split(b"|", 1)
+    if stored_version != version:
+        return None
+    _entity_counters.incr("hits")
+    return schema.model_validate_json(content), version.decode()
+
+
+def _seed_entity_version(backend: CacheBackend, version_key: str) -> Optional[bytes]:
+    """
+    Crea el contador de versión si no existe (expirado o nunca creado), sembrándolo
+    con el reloj para no repetir una versión de la que pueda quedar un snapshot o ETag viejo.
+    """
+    backend.set(version_key, str(_clock_generation()).encode(), ttl=GENERATION_TTL, nx=True)
+    return backend.get(version_key)
+
+
+def get_entity_version(entity: str, entity_id, create: bool = False) -> Optional[str]:
+    """
+    Versión vigente de una entidad, leída del backend sin consultar la base.
+    
+    Args:
+        entity: Tipo de entidad ("school", "student" o "invoice")
+        entity_id: ID de la entidad (UUID)
+        create: Crear el contador si no existe (para etiquetar una respuesta con él)
+    
+    Returns:
+        La versión, o None si no existe (y create es False) o el backend no está disponible
+    """
+    version_key, _ = _snapshot_keys(entity, entity_id)
+    backend = get_cache_backend()
+    if not backend.available():
+        return None
     try:
-        redis_client.delete(key)
-        logger.info(f"Cache invalidado: {key}")
+        version = backend.get(version_key)
+        if version is None and create:
+            version = _seed_entity_version(backend, version_key)
     except Exception as e:
-        logger.warning(f"Error invalidando cache: {e}")
+        _on_cache_error(e, "leyendo versión")
+        return None
+    return version.decode() if version is not None else None
+
+
+def get_entity_etag(entity: str, entity_id, create: bool = False) -> Optional[str]:
+    """ETag de la versión vigente de una entidad (ver get_entity_version)."""
+    version = get_entity_version(entity, entity_id, create=create)
+    return make_etag(version) if version is not None else None
+
+
+def _count_key(listing: str, filters: Dict[str, Any]) -> str:
+    """Clave del total de un listado: count:{listado}:{hash de los filtros}"""
+    signature = json.dumps(filters, sort_keys=True, default=str)
+    return f"count:{listing}:{hashlib.sha1(signature.encode()).hexdigest()[:16]}"
+
+
+def get_or_compute_count(listing: str, filters: Dict[str, Any], compute: Callable[[], int]) -> int:
+    """
+    Total exacto de un listado con unos filtros, cacheado COUNT_CACHE_TTL segundos
+    por firma de filtros (no se invalida con las escrituras: puede atrasarse hasta el TTL).
+    
+    Args:
+        listing: Nombre del listado (ej: "invoices")
+        filters: Filtros aplicados (los None también forman parte de la firma)
+        compute: Cuenta las filas en la base
+    """
+    key = _count_key(listing, filters)
+    backend = get_cache_backend()
+    if backend.available():
+        try:
+            cached = backend.get(key)
+        except Exception as e:
+            _on_cache_error(e, "leyendo total")
+            cached = None
+        if cached is not None:
+            _count_counters.incr("hits")
+            return int(cached)
+    
+    _count_counters.incr("misses")
+    total = compute()
+    if backend.available():
+        try:
+            backend.set(key, str(total).encode(), ttl=settings.COUNT_CACHE_TTL)
+        except Exception as e:
+            _on_cache_error(e, "guardando total")
+    return total
+
+
+def bump_entity_version(entity: str, entity_id):
+    """
+    Incrementa la versión de una entidad (invalida su ETag) sin cachear snapshots de ella
+    (ej: facturas). Debe llamarse después del commit de la escritura.
+    """
+    version_key, _ = _snapshot_keys(entity, entity_id)
+    _invalidate(versions=[version_key])
+
+
+def invalidate_entity_snapshot(entity: str, entity_id):
+    """
+    Invalida el snapshot de una entidad incrementando su versión.
+    Debe llamarse después del commit de la escritura (dentro de un request se aplica al terminarlo).
+    
+    Args:
+        entity: Tipo de entidad ("student" o "school")
+        entity_id: ID de la entidad (UUID)
+    """
+    version_key, _ = _snapshot_keys(entity, entity_id)
+    _invalidate(versions=[version_key], tags=[_snapshot_tag(entity, entity_id)])
+
 
@@ -0,0 +1,1053 @@
+"""
+Backends del cache compartido.
+
+El cache de statements (app.core.cache) no usa Redis directamente sino la
+interfaz CacheBackend, con tres implementaciones seleccionables con
+CACHE_BACKEND en Settings:
+
+- "redis": Redis compartido entre workers (pool de conexiones + circuit breaker).
+- "memory": diccionario LRU acotado en memoria del proceso. Sirve para instalaciones
+  de un solo worker sin Redis y para medir el cache sin servidor.
+- "none": no cachea nada; todas las lecturas son misses.
+
+El camino async de lectura (ASYNC_DB_ENABLED) usa AsyncCacheBackend, creado a partir
+del backend configurado con create_async_cache_backend (con Redis, sobre redis.asyncio
+y compartiendo el circuit breaker del backend síncrono).
+
+Además de las operaciones básicas (get/set/mget/delete/publish), la interfaz
+incluye las operaciones compuestas del cache de statements, que deben ser atómicas
+(en Redis se ejecutan como scripts Lua).
+"""
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Any, Tuple, Dict, List, Callable, NamedTuple
+import asyncio
+import redis
+from redis import asyncio as redis_asyncio
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheCounters:
+    """Contadores thread-safe (hits/misses/evictions de un nivel de cache, estados del breaker, etc.)."""
+    
+    def __init__(self, *names: str):
+        self._lock = threading.Lock()
+        self._values = {name: 0 for name in names}
+    
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._values[name] += amount
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._values)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker para Redis.
+    
+    - closed: las operaciones se ejecutan normalmente. Si fallan
+      failure_threshold veces dentro de failure_window segundos, se abre.
+    - open: Redis se considera caído y el cache se omite sin latencia extra.
+      Tras un backoff exponencial (backoff_base * 2^n, hasta backoff_max) pasa a half_open.
+    - half_open: un único request sondea Redis; si responde se cierra,
+      si no se vuelve a abrir duplicando el backoff.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        failure_window: float = 10.0,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = []
+        self._consecutive_opens = 0
+        self._retry_at = 0.0
+        self.counters = CacheCounters("opened", "probes", "short_circuited")
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+    
+    def allow_request(self) -> bool:
+        """
+        Indica si se puede usar Redis. Con el circuito abierto retorna False,
+        salvo para el único request que sondea cuando vence el backoff.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self._clock() >= self._retry_at:
+                self._state = self.HALF_OPEN
+                self.counters.incr("probes")
+                return True
+            self.counters.incr("short_circuited")
+            return False
+    
+    @property
+    def probing(self) -> bool:
+        """True si el request actual debe sondear Redis (estado half_open)."""
+        with self._lock:
+            return self._state == self.HALF_OPEN
+    
+    def record_success(self):
+        """Registra un sondeo exitoso: cierra el circuito y reinicia el backoff."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures.clear()
+            self._consecutive_opens = 0
+    
+    def record_failure(self):
+        """Registra un fallo de conexión; abre el circuito al superar el umbral."""
+        with self._lock:
+            now = self._clock()
+            if self._state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._failures = [t for t in self._failures if now - t < self.failure_window]
+            self._failures.append(now)
+            if self._state == self.CLOSED and len(self._failures) >= self.failure_threshold:
+                self._open(now)
+    
+    def trip(self):
+        """Abre el circuito inmediatamente (ej: Redis rechaza la conexión inicial)."""
+        with self._lock:
+            self._open(self._clock())
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado del circuito para /health y /metrics."""
+        with self._lock:
+            retry_in = max(0.0, self._retry_at - self._clock()) if self._state == self.OPEN else 0.0
+            snapshot = {
+                "state": self._state,
+                "recent_failures": len(self._failures),
+                "retry_in_seconds": round(retry_in, 3)
+            }
+        snapshot.update(self.counters.snapshot())
+        return snapshot
+    
+    def _open(self, now: float):
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** self._consecutive_opens))
+        self._consecutive_opens += 1
+        self._state = self.OPEN
+        self._retry_at = now + backoff
+        self._failures.clear()
+        self.counters.incr("opened")
+        logger.warning(f"Circuito de Redis abierto; próximo sondeo en {backoff:.1f}s")
+
+
+class StatementKeys(NamedTuple):
+    """Claves del statement de una entidad (ver el esquema en app.core.cache)."""
+    prefix: str       # {entity}:{id}:statement:
+    generation: str   # contador de generación
+    totals: str       # hash de totales
+    writers: str      # escrituras en curso
+    
+    @classmethod
+    def for_prefix(cls, prefix: str) -> "StatementKeys":
+        return cls(prefix, f"{prefix}gen", f"{prefix}totals", f"{prefix}writers")
+
+
+class TotalsWrite(NamedTuple):
+    """Deltas a aplicar sobre los totales de una entidad al terminar una escritura."""
+    keys: StatementKeys
+    epoch: Optional[str]        # epoch de los totales al comenzar; None descarta los totales
+    deltas: Dict[str, int]      # total_invoiced/total_paid en centavos, total_invoices
+
+
+# Campos del hash de totales que se mantienen con deltas
+TOTALS_DELTA_FIELDS = ("total_invoiced", "total_paid", "total_invoices")
+
+
+class Subscription(ABC):
+    """Suscripción activa a un canal de pub/sub."""
+    
+    @property
+    @abstractmethod
+    def active(self) -> bool:
+        """True mientras la suscripción sigue recibiendo mensajes."""
+    
+    @abstractmethod
+    def close(self):
+        """Cancela la suscripción."""
+
+
+class CacheBackend(ABC):
+    """
+    Interfaz del cache compartido.
+    
+    Las operaciones pueden lanzar excepciones (ej: Redis caído); el llamador las
+    registra con record_error y continúa sin cache. Antes de operar se consulta
+    available(), que no debe bloquear cuando el backend está caído.
+    """
+    
+    # Nombre del backend (valor de CACHE_BACKEND)
+    name = ""
+    # True si el cache es compartido entre procesos (y por lo tanto tiene sentido
+    # un nivel local delante, invalidado por pub/sub)
+    shared = False
+    
+    def available(self) -> bool:
+        """Indica si el backend puede usarse en este momento."""
+        return True
+    
+    def record_error(self, error: Exception):
+        """Registra un error de una operación (ej: para el circuit breaker)."""
+    
+    def status(self) -> Dict[str, Any]:
+        """Estado del backend para /health."""
+        return {"backend": self.name}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas propias del backend para /metrics (ej: evictions)."""
+        return {}
+    
+    # Operaciones básicas
+    
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Valor de una clave, o None si no existe."""
+    
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        """
+        Guarda un valor con TTL opcional (en segundos).
+        Con nx=True solo lo guarda si la clave no existe; retorna si se guardó.
+        """
+    
+    @abstractmethod
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Valores de varias claves en una sola operación."""
+    
+    @abstractmethod
+    def delete(self, *keys: str) -> int:
+        """Elimina claves. Retorna cuántas existían."""
+    
+    @abstractmethod
+    def delete_if_equals(self, key: str, value: bytes) -> bool:
+        """Elimina la clave solo si su valor es value (liberar locks)."""
+    
+    @abstractmethod
+    def publish(self, channel: str, message: str):
+        """Publica un mensaje en un canal."""
+    
+    @abstractmethod
+    def subscribe(
+        self,
+        channel: str,
+        handler: Callable[[str], None],
+        on_error: Optional[Callable[[], None]] = None
+    ) -> Optional[Subscription]:
+        """Suscribe handler a un canal. Retorna None si no es posible."""
+    
+    # Operaciones atómicas del cache de statements
+    
+    @abstractmethod
+    def read_statements(
+        self,
+        keys: StatementKeys,
+        variants: List[str],
+        include_totals: bool,
+        initial_generation: int,
+        generation_ttl: int
+    ) -> Tuple[str, Optional[Dict[str, Any]], List[Optional[bytes]]]:
+        """
+        Resuelve la generación (inicializándola con initial_generation si no existe)
+        y lee las variantes {prefix}{gen}:{variant}.
+        
+        Returns:
+            (generación, totales o None, payload o None por variante). Los totales se
+            omiten si una escritura murió sin aplicar su delta (pending sin writers).
+        """
+    
+    @abstractmethod
+    def store_totals(self, keys: StatementKeys, generation: str, ttl: int, fields: Dict[str, Any]) -> bool:
+        """
+        Reemplaza el hash de totales solo si la generación sigue siendo generation
+        y no hay escrituras en curso. Retorna si se guardó.
+        """
+    
+    @abstractmethod
+    def begin_writes(self, keys: List[StatementKeys], ttl: float) -> List[Optional[str]]:
+        """
+        Registra una escritura en curso sobre cada entidad (expira a los ttl segundos)
+        y marca sus totales como pendientes. Retorna el epoch de los totales de cada una.
+        """
+    
+    @abstractmethod
+    def apply_invalidations(
+        self,
+        writes: List[TotalsWrite],
+        generations: List[StatementKeys],
+        versions: List[str],
+        initial_generation: int,
+        generation_ttl: int
+    ):
+        """
+        Aplica en un solo round trip las invalidaciones acumuladas de un request:
+        - writes: termina escrituras; aplica los deltas si los totales conservan el epoch
+          (si no, los descarta), incrementa la generación y desregistra la escritura.
+        - generations: incrementa la generación y descarta los totales de cada entidad.
+        - versions: incrementa cada contador de versión (renovando su TTL a generation_ttl).
+        Las escrituras se aplican antes que los incrementos de generación.
+        """
+
+
+class NullCacheBackend(CacheBackend):
+    """Backend que no cachea nada (nunca está disponible)."""
+    
+    name = "none"
+    
+    def available(self) -> bool:
+        return False
+    
+    def get(self, key):
+        return None
+    
+    def set(self, key, value, ttl=None, nx=False):
+        return False
+    
+    def mget(self, keys):
+        return [None] * len(keys)
+    
+    def delete(self, *keys):
+        return 0
+    
+    def delete_if_equals(self, key, value):
+        return False
+    
+    def publish(self, channel, message):
+        pass
+    
+    def subscribe(self, channel, handler, on_error=None):
+        return None
+    
+    def read_statements(self, keys, variants, include_totals, initial_generation, generation_ttl):
+        return str(initial_generation), None, [None] * len(variants)
+    
+    def store_totals(self, keys, generation, ttl, fields):
+        return False
+    
+    def begin_writes(self, keys, ttl):
+        return [None] * len(keys)
+    
+    def apply_invalidations(self, writes, generations, versions, initial_generation, generation_ttl):
+        pass
+
+
+class _MemorySubscription(Subscription):
+    
+    def __init__(self, handlers: List[Callable[[str], None]], handler: Callable[[str], None]):
+        self._handlers = handlers
+        self._handler = handler
+    
+    @property
+    def active(self) -> bool:
+        return self._handler in self._handlers
+    
+    def close(self):
+        if self._handler in self._handlers:
+            self._handlers.remove(self._handler)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Cache en memoria del proceso: LRU acotado a max_entries claves, con TTL por clave.
+    
+    No es compartido entre procesos: con varios workers cada uno tendría su propio
+    cache y no vería las invalidaciones de los demás. Usar con un solo worker.
+    """
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.RLock()
+        # clave -> (valor, expira_en o None)
+        self._data: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self.counters = CacheCounters("evictions", "expirations")
+    
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.name, "state": "closed"}
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._data)
+        return {"entries": entries, **self.counters.snapshot()}
+    
+    def _get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and self._clock() >= expires_at:
+            del self._data[key]
+            self.counters.incr("expirations")
+            return None
+        self._data.move_to_end(key)
+        return value
+    
+    def _put(self, key: str, value: Any, ttl: Optional[float] = None, keep_ttl: bool = False):
+        expires_at = self._clock() + float(ttl) if ttl else None
+        if keep_ttl and key in self._data:
+            expires_at = self._data[key][1]
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.counters.incr("evictions")
+    
+    def _incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = int(self._get(key) or 0) + amount
+        self._put(key, value, ttl, keep_ttl=ttl is None)
+        return value
+    
+    @staticmethod
+    def _as_bytes(value: Any) -> Optional[bytes]:
+        if value is None or isinstance(value, bytes):
+            return value
+        return str(value).encode()
+    
+    def get(self, key):
+        with self._lock:
+            return self._as_bytes(self._get(key))
+    
+    def set(self, key, value, ttl=None, nx=False):
+        with self._lock:
+            if nx and self._get(key) is not None:
+                return False
+            self._put(key, value, ttl)
+            return True
+    
+    def mget(self, keys):
+        with self._lock:
+            return [self._as_bytes(self._get(key)) for key in keys]
+    
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+    
+    def delete_if_equals(self, key, value):
+        with self._lock:
+            if self._get(key) != value:
+                return False
+            del self._data[key]
+            return True
+    
+    def publish(self, channel, message):
+        for handler in list(self._handlers.get(channel, ())):
+            handler(message)
+    
+    def subscribe(self, channel, handler, on_error=None):
+        handlers = self._handlers.setdefault(channel, [])
+        handlers.append(handler)
+        return _MemorySubscription(handlers, handler)
+    
+    def _current_generation(self, keys: StatementKeys, initial_generation: int, generation_ttl: int) -> str:
+        generation = self._get(keys.generation)
+        if generation is None:
+            generation = initial_generation
+            self._put(keys.generation, generation, generation_ttl)
+        return str(generation)
+    
+    def _bump(self, keys: StatementKeys, initial_generation: int, generation_ttl: int):
+        generation = self._get(keys.generation)
+        self._put(keys.generation, int(generation or initial_generation) + 1, generation_ttl)
+    
+    def read_statements(self, keys, variants, include_totals, initial_generation, generation_ttl):
+        with self._lock:
+            generation = self._current_generation(keys, initial_generation, generation_ttl)
+            totals = None
+            if include_totals:
+                totals = self._get(keys.totals)
+                if totals is not None and totals["pending"] > 0 and self._get(keys.writers) is None:
+                    totals = None
+            payloads = [self._as_bytes(self._get(f"{keys.prefix}{generation}:{variant}")) for variant in variants]
+            return generation, dict(totals) if totals else None, payloads
+    
+    def store_totals(self, keys, generation, ttl, fields):
+        with self._lock:
+            if str(self._get(keys.generation)) != generation or self._get(keys.writers) is not None:
+                return False
+            self._put(keys.totals, {**fields, "pending": 0}, ttl)
+            return True
+    
+    def begin_writes(self, keys, ttl):
+        epochs = []
+        with self._lock:
+            for entity_keys in keys:
+                self._incr(entity_keys.writers, ttl=ttl)
+                totals = self._get(entity_keys.totals)
+                if totals is None:
+                    epochs.append(None)
+                    continue
+                totals["pending"] += 1
+                epochs.append(totals["epoch"])
+        return epochs
+    
+    def apply_invalidations(self, writes, generations, versions, initial_generation, generation_ttl):
+        with self._lock:
+            for write in writes:
+                totals = self._get(write.keys.totals)
+                if write.epoch is not None and totals is not None and totals["epoch"] == write.epoch:
+                    totals["pending"] -= 1
+                    for field in TOTALS_DELTA_FIELDS:
+                        totals[field] = int(totals[field]) + write.deltas.get(field, 0)
+                else:
+                    self._data.pop(write.keys.totals, None)
+                self._bump(write.keys, initial_generation, generation_ttl)
+                if self._incr(write.keys.writers, -1) <= 0:
+                    self._data.pop(write.keys.writers, None)
+            for entity_keys in generations:
+                self._data.pop(entity_keys.totals, None)
+                self._bump(entity_keys, initial_generation, generation_ttl)
+            for key in versions:
+                self._incr(key, ttl=generation_ttl)
+
+
+# Resuelve la generación y lee los totales y los payloads de varias variantes en un
+# solo round trip. Si el contador no existe se inicializa con el reloj (microsegundos),
+# de modo que un contador expirado o desalojado nunca reutiliza una generación previa.
+_GET_STATEMENTS_SCRIPT = """
+local gen = redis.call('GET', KEYS[1])
+if not gen then
+    gen = ARGV[1]
+    redis.call('SET', KEYS[1], gen, 'EX', ARGV[2])
+end
+local totals = false
+if ARGV[4] == '1' then
+    local fields = redis.call('HMGET', KEYS[2], 'stored_at', 'pending', 'doc',
+        'total_invoiced', 'total_paid', 'total_invoices')
+    -- pending > 0 sin escrituras registradas: un escritor murió sin aplicar su delta
+    if fields[1] and (tonumber(fields[2]) == 0 or redis.call('EXISTS', KEYS[3]) == 1) then
+        totals = fields
+    end
+end
+local result = {gen, totals}
+for i = 5, #ARGV do
+    result[#result + 1] = redis.call('GET', ARGV[3] .. gen .. ':' .. ARGV[i])
+end
+return result
+"""
+
+# Guarda los totales recalculados solo si la generación no cambió desde la lectura
+# y no hay escrituras en curso (compare-and-set)
+_SET_TOTALS_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] or redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('HSET', KEYS[2], 'epoch', ARGV[3], 'pending', 0, 'stored_at', ARGV[4], 'doc', ARGV[5],
+    'total_invoiced', ARGV[6], 'total_paid', ARGV[7], 'total_invoices', ARGV[8])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Registra una escritura en curso antes del commit.
+# Retorna el epoch de los totales cacheados (o nil si no hay totales).
+_BEGIN_WRITE_SCRIPT = """
+redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('HINCRBY', KEYS[2], 'pending', 1)
+    return redis.call('HGET', KEYS[2], 'epoch')
+end
+return false
+"""
+
+# Termina una escritura después del commit: aplica los deltas a los totales si son los
+# mismos que había al comenzar (si no, o sin epoch, los borra), invalida las páginas
+# incrementando la generación y desregistra la escritura.
+_APPLY_WRITE_SCRIPT = """
+if ARGV[3] ~= '' and redis.call('HGET', KEYS[2], 'epoch') == ARGV[3] then
+    redis.call('HINCRBY', KEYS[2], 'pending', -1)
+    redis.call('HINCRBY', KEYS[2], 'total_invoiced', ARGV[4])
+    redis.call('HINCRBY', KEYS[2], 'total_paid', ARGV[5])
+    redis.call('HINCRBY', KEYS[2], 'total_invoices', ARGV[6])
+else
+    redis.call('DEL', KEYS[2])
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+local gen = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if redis.call('DECR', KEYS[3]) <= 0 then
+    redis.call('DEL', KEYS[3])
+end
+return gen
+"""
+
+# Incrementa la generación de forma atómica (inicializándola con el reloj si no existe)
+# y descarta los totales
+_BUMP_GENERATION_SCRIPT = """
+redis.call('DEL', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+local gen = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return gen
+"""
+
+# Elimina una clave solo si conserva el valor esperado (liberar un lock propio)
+_DELETE_IF_EQUALS_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_TOTALS_FIELDS = ("stored_at", "pending", "doc", "total_invoiced", "total_paid", "total_invoices")
+
+
+def _register_scripts(client) -> Dict[str, Any]:
+    """
+    Registra los scripts Lua una sola vez por cliente. Cada Script guarda su SHA y se
+    ejecuta con EVALSHA (recargándose solo si el servidor lo perdió, ej: SCRIPT FLUSH).
+    """
+    return {
+        "get_statements": client.register_script(_GET_STATEMENTS_SCRIPT),
+        "set_totals": client.register_script(_SET_TOTALS_SCRIPT),
+        "begin_write": client.register_script(_BEGIN_WRITE_SCRIPT),
+        "apply_write": client.register_script(_APPLY_WRITE_SCRIPT),
+        "bump_generation": client.register_script(_BUMP_GENERATION_SCRIPT),
+        "delete_if_equals": client.register_script(_DELETE_IF_EQUALS_SCRIPT),
+    }
+
+
+class _RedisSubscription(Subscription):
+    
+    def __init__(self, pubsub, thread):
+        self._pubsub = pubsub
+        self._thread = thread
+    
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend sobre Redis: un cliente (singleton) sobre un ConnectionPool compartido,
+    protegido por un circuit breaker. Las operaciones compuestas son scripts Lua;
+    las que afectan a varias entidades se envían en un pipeline (un round trip).
+    """
+    
+    name = "redis"
+    shared = True
+    
+    def __init__(self, url: str = None, breaker: Optional[CircuitBreaker] = None):
+        self.url = url or settings.REDIS_URL
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.REDIS_CIRCUIT_FAILURE_THRESHOLD,
+            failure_window=settings.REDIS_CIRCUIT_FAILURE_WINDOW,
+            backoff_base=settings.REDIS_CIRCUIT_BACKOFF_BASE,
+            backoff_max=settings.REDIS_CIRCUIT_BACKOFF_MAX
+        )
+        self.client: Optional[redis.Redis] = None
+        self._client_lock = threading.Lock()
+        self._scripts: Dict[str, Any] = {}
+    
+    def available(self) -> bool:
+        """
+        Conecta el cliente la primera vez y sondea Redis en half_open.
+        Retorna False si el circuito está abierto, sin intentar conectar.
+        """
+        if not self.breaker.allow_request():
+            return False
+        
+        if self.client is None:
+            with self._client_lock:
+                if self.client is None:
+                    pool = redis.ConnectionPool.from_url(
+                        self.url,
+                        max_connections=settings.REDIS_MAX_CONNECTIONS,
+                        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                        socket_timeout=settings.REDIS_SOCKET_TIMEOUT
+                    )
+                    # Los statements se guardan como bytes (decode_responses=False)
+                    client = redis.Redis(connection_pool=pool)
+                    try:
+                        # Test de conexión
+                        client.ping()
+                        logger.info("Redis cache conectado exitosamente")
+                    except Exception as e:
+                        logger.warning(f"Redis no disponible: {e}. Cache deshabilitado.")
+                        self.breaker.trip()
+                        pool.disconnect()
+                        return False
+                    self._scripts = _register_scripts(client)
+                    self.client = client
+                    self.breaker.record_success()
+                    return True
+        
+        if self.breaker.probing:
+            try:
+                self.client.ping()
+                self.breaker.record_success()
+                logger.info("Redis disponible nuevamente; circuito cerrado")
+            except Exception as e:
+                logger.warning(f"Redis sigue sin responder: {e}")
+                self.breaker.record_failure()
+                return False
+        
+        return True
+    
+    def record_error(self, error: Exception):
+        """Los errores de conexión y timeouts cuentan para el circuit breaker."""
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            self.breaker.record_failure()
+    
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.breaker.snapshot()}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Evictions del servidor (INFO stats) y estado del circuit breaker."""
+        stats = {"circuit_breaker": self.breaker.snapshot()}
+        if self.client is not None:
+            stats["evictions"] = int(self.client.info("stats").get("evicted_keys", 0))
+        return stats
+    
+    def get(self, key):
+        return self.client.get(key)
+    
+    def set(self, key, value, ttl=None, nx=False):
+        px = int(ttl * 1000) if ttl else None
+        return bool(self.client.set(key, value, px=px, nx=nx))
+    
+    def mget(self, keys):
+        return self.client.mget(keys) if keys else []
+    
+    def delete(self, *keys):
+        return self.client.delete(*keys) if keys else 0
+    
+    def delete_if_equals(self, key, value):
+        return bool(self._scripts["delete_if_equals"](keys=[key], args=[value]))
+    
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+    
+    def subscribe(self, channel, handler, on_error=None):
+        def _on_message(message):
+            data = message["data"]
+            handler(data.decode() if isinstance(data, bytes) else data)
+        
+        def _on_exception(exc, pubsub, thread):
+            # Pudimos perder mensajes: el llamador decide qué descartar
+            logger.warning(f"Error en suscripción a {channel}: {exc}")
+            if on_error:
+                on_error()
+            time.sleep(1)
+        
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(**{channel: _on_message})
+            thread = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=_on_exception)
+        except Exception:
+            pubsub.close()
+            raise
+        return _RedisSubscription(pubsub, thread)
+    
+    def read_statements(self, keys, variants, include_totals, initial_generation, generation_ttl):
+        generation, totals, *payloads = self._scripts["get_statements"](
+            keys=[keys.generation, keys.totals, keys.writers],
+            args=[initial_generation, generation_ttl, keys.prefix, "1" if include_totals else "0"] + variants
+        )
+        return generation.decode(), dict(zip(_TOTALS_FIELDS, totals)) if totals else None, payloads
+    
+    def store_totals(self, keys, generation, ttl, fields):
+        return bool(self._scripts["set_totals"](
+            keys=[keys.generation, keys.totals, keys.writers],
+            args=[
+                generation,
+                ttl,
+                fields["epoch"],
+                fields["stored_at"],
+                fields["doc"],
+                fields["total_invoiced"],
+                fields["total_paid"],
+                fields["total_invoices"]
+            ]
+        ))
+    
+    def begin_writes(self, keys, ttl):
+        script = self._scripts["begin_write"]
+        pipe = self.client.pipeline(transaction=False)
+        for entity_keys in keys:
+            script(keys=[entity_keys.writers, entity_keys.totals], args=[int(ttl * 1000)], client=pipe)
+        return [epoch.decode() if epoch else None for epoch in pipe.execute()]
+    
+    def apply_invalidations(self, writes, generations, versions, initial_generation, generation_ttl):
+        apply_write = self._scripts["apply_write"]
+        bump_generation = self._scripts["bump_generation"]
+        pipe = self.client.pipeline(transaction=False)
+        for write in writes:
+            apply_write(
+                keys=[write.keys.generation, write.keys.totals, write.keys.writers],
+                args=[initial_generation, generation_ttl, write.epoch or ""]
+                + [write.deltas.get(field, 0) for field in TOTALS_DELTA_FIELDS],
+                client=pipe
+            )
+        for entity_keys in generations:
+            bump_generation(
+                keys=[entity_keys.generation, entity_keys.totals], args=[initial_generation, generation_ttl], client=pipe
+            )
+        for key in versions:
+            pipe.incr(key)
+            pipe.expire(key, generation_ttl)
+        pipe.execute()
+
+
+class AsyncCacheBackend(ABC):
+    """
+    Interfaz asíncrona del cache compartido para el camino async de lectura.
+    
+    Cubre las operaciones que usan las lecturas de statements, snapshots y ETags, y el
+    registro de escrituras en curso (con la misma semántica que en CacheBackend); las
+    invalidaciones se acumulan en el batch del request y las aplica el backend síncrono.
+    """
+    
+    name = ""
+    
+    async def available(self) -> bool:
+        """Indica si el backend puede usarse en este momento."""
+        return True
+    
+    def record_error(self, error: Exception):
+        """Registra un error de una operación (ej: para el circuit breaker)."""
+    
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """Ver CacheBackend.get."""
+    
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        """Ver CacheBackend.set."""
+    
+    @abstractmethod
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Ver CacheBackend.mget."""
+    
+    @abstractmethod
+    async def delete_if_equals(self, key: str, value: bytes) -> bool:
+        """Ver CacheBackend.delete_if_equals."""
+    
+    @abstractmethod
+    async def read_statements(
+        self,
+        keys: StatementKeys,
+        variants: List[str],
+        include_totals: bool,
+        initial_generation: int,
+        generation_ttl: int
+    ) -> Tuple[str, Optional[Dict[str, Any]], List[Optional[bytes]]]:
+        """Ver CacheBackend.read_statements."""
+    
+    @abstractmethod
+    async def store_totals(self, keys: StatementKeys, generation: str, ttl: int, fields: Dict[str, Any]) -> bool:
+        """Ver CacheBackend.store_totals."""
+    
+    @abstractmethod
+    async def begin_writes(self, keys: List[StatementKeys], ttl: float) -> List[Optional[str]]:
+        """Ver CacheBackend.begin_writes."""
+
+
+class AsyncBackendAdapter(AsyncCacheBackend):
+    """Adapta un backend en memoria del proceso ("memory" o "none"), cuyas operaciones no bloquean."""
+    
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.name = backend.name
+    
+    async def available(self):
+        return self.backend.available()
+    
+    def record_error(self, error):
+        self.backend.record_error(error)
+    
+    async def get(self, key):
+        return self.backend.get(key)
+    
+    async def set(self, key, value, ttl=None, nx=False):
+        return self.backend.set(key, value, ttl=ttl, nx=nx)
+    
+    async def mget(self, keys):
+        return self.backend.mget(keys)
+    
+    async def delete_if_equals(self, key, value):
+        return self.backend.delete_if_equals(key, value)
+    
+    async def read_statements(self, keys, variants, include_totals, initial_generation, generation_ttl):
+        return self.backend.read_statements(keys, variants, include_totals, initial_generation, generation_ttl)
+    
+    async def store_totals(self, keys, generation, ttl, fields):
+        return self.backend.store_totals(keys, generation, ttl, fields)
+    
+    async def begin_writes(self, keys, ttl):
+        return self.backend.begin_writes(keys, ttl)
+
+
+class AsyncRedisCacheBackend(AsyncCacheBackend):
+    """
+    Backend async sobre redis.asyncio, con su propio pool de conexiones (del event loop)
+    y los mismos scripts Lua que RedisCacheBackend.
+    """
+    
+    name = "redis"
+    
+    def __init__(self, url: str = None, breaker: Optional[CircuitBreaker] = None):
+        self.url = url or settings.REDIS_URL
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.REDIS_CIRCUIT_FAILURE_THRESHOLD,
+            failure_window=settings.REDIS_CIRCUIT_FAILURE_WINDOW,
+            backoff_base=settings.REDIS_CIRCUIT_BACKOFF_BASE,
+            backoff_max=settings.REDIS_CIRCUIT_BACKOFF_MAX
+        )
+        self.client: Optional[redis_asyncio.Redis] = None
+        self._connect_lock = asyncio.Lock()
+        self._scripts: Dict[str, Any] = {}
+    
+    async def available(self) -> bool:
+        """Igual que RedisCacheBackend.available, sin bloquear el event loop."""
+        if not self.breaker.allow_request():
+            return False
+        
+        if self.client is None:
+            async with self._connect_lock:
+                if self.client is None:
+                    client = redis_asyncio.Redis.from_url(
+                        self.url,
+                        max_connections=settings.REDIS_MAX_CONNECTIONS,
+                        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                        socket_timeout=settings.REDIS_SOCKET_TIMEOUT
+                    )
+                    try:
+                        await client.ping()
+                        logger.info("Redis (async) conectado exitosamente")
+                    except Exception as e:
+                        logger.warning(f"Redis no disponible: {e}. Cache deshabilitado.")
+                        self.breaker.trip()
+                        await client.close(close_connection_pool=True)
+                        return False
+                    self._scripts = _register_scripts(client)
+                    self.client = client
+                    self.breaker.record_success()
+                    return True
+        
+        if self.breaker.probing:
+            try:
+                await self.client.ping()
+                self.breaker.record_success()
+                logger.info("Redis disponible nuevamente; circuito cerrado")
+            except Exception as e:
+                logger.warning(f"Redis sigue sin responder: {e}")
+                self.breaker.record_failure()
+                return False
+        
+        return True
+    
+    def record_error(self, error: Exception):
+        """Los errores de conexión y timeouts cuentan para el circuit breaker."""
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            self.breaker.record_failure()
+    
+    async def get(self, key):
+        return await self.client.get(key)
+    
+    async def set(self, key, value, ttl=None, nx=False):
+        px = int(ttl * 1000) if ttl else None
+        return bool(await self.client.set(key, value, px=px, nx=nx))
+    
+    async def mget(self, keys):
+        return await self.client.mget(keys) if keys else []
+    
+    async def delete_if_equals(self, key, value):
+        return bool(await self._scripts["delete_if_equals"](keys=[key], args=[value]))
+    
+    async def read_statements(self, keys, variants, include_totals, initial_generation, generation_ttl):
+        generation, totals, *payloads = await self._scripts["get_statements"](
+            keys=[keys.generation, keys.totals, keys.writers],
+            args=[initial_generation, generation_ttl, keys.prefix, "1" if include_totals else "0"] + variants
+        )
+        return generation.decode(), dict(zip(_TOTALS_FIELDS, totals)) if totals else None, payloads
+    
+    async def store_totals(self, keys, generation, ttl, fields):
+        return bool(await self._scripts["set_totals"](
+            keys=[keys.generation, keys.totals, keys.writers],
+            args=[
+                generation,
+                ttl,
+                fields["epoch"],
+                fields["stored_at"],
+                fields["doc"],
+                fields["total_invoiced"],
+                fields["total_paid"],
+                fields["total_invoices"]
+            ]
+        ))
+    
+    async def begin_writes(self, keys, ttl):
+        script = self._scripts["begin_write"]
+        pipe = self.client.pipeline(transaction=False)
+        for entity_keys in keys:
+            await script(keys=[entity_keys.writers, entity_keys.totals], args=[int(ttl * 1000)], client=pipe)
+        return [epoch.decode() if epoch else None for epoch in await pipe.execute()]
+
+
+def create_async_cache_backend(backend: CacheBackend) -> AsyncCacheBackend:
+    """
+    Crea el backend async equivalente a un backend síncrono.
+    Con Redis usa la misma URL y comparte el circuit breaker, así que una caída
+    detectada por un camino también corta el otro.
+    """
+    if isinstance(backend, RedisCacheBackend):
+        return AsyncRedisCacheBackend(backend.url, breaker=backend.breaker)
+    return AsyncBackendAdapter(backend)
+
+
+def create_cache_backend(name: Optional[str] = None) -> CacheBackend:
+    """
+    Crea el backend configurado en CACHE_BACKEND ("redis", "memory" o "none").
+    
+    Raises:
+        ValueError: Si el nombre no corresponde a un backend conocido
+    """
+    name = (name or settings.CACHE_BACKEND).lower()
+    if name == "redis":
+        return RedisCacheBackend()
+    if name == "memory":
+        return MemoryCacheBackend(settings.MEMORY_CACHE_MAX_ENTRIES)
+    if name == "none":
+        return NullCacheBackend()
+    raise ValueError(f"Unknown cache backend: {name}")
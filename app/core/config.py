@@ -10,12 +10,76 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     LOG_LEVEL: str = "INFO"
     
+    # Camino async (AsyncSession sobre asyncpg + redis.asyncio) para lecturas y escrituras;
+    # ASYNC_DATABASE_URL por defecto se deriva de DATABASE_URL
+    ASYNC_DB_ENABLED: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+    ASYNC_DB_POOL_SIZE: int = 10
+    ASYNC_DB_MAX_OVERFLOW: int = 20
+    
+    # Cache de sentencias compiladas de SQLAlchemy (por engine) y de sentencias preparadas
+    # en el servidor de asyncpg (por conexión; 0 las desactiva, ej: detrás de PgBouncer
+    # en modo transaction)
+    DB_QUERY_CACHE_SIZE: int = 1200
+    ASYNC_DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+    
+    # Réplica de lectura para listados y statements (ver get_read_db); sin URL todo va al
+    # primario. Localmente puede ser otra URL de la misma base (ej: otro usuario).
+    # READ_REPLICA_ASYNC_URL por defecto se deriva de READ_REPLICA_URL
+    READ_REPLICA_URL: Optional[str] = None
+    READ_REPLICA_ASYNC_URL: Optional[str] = None
+    READ_REPLICA_POOL_SIZE: int = 10
+    READ_REPLICA_MAX_OVERFLOW: int = 20
+    READ_YOUR_WRITES_TTL: int = 300  # segundos que dura la cookie de posición tras una escritura
+    
     # Configuración de paginación
     DEFAULT_PAGE_SIZE: int = 10
     MAX_PAGE_SIZE: int = 100
     
+    # Carga masiva de facturas (POST /invoices/bulk)
+    BULK_INVOICE_MAX_ROWS: int = 50000  # filas máximas por request
+    BULK_INVOICE_CHUNK_SIZE: int = 1000  # filas por consulta de validación y por INSERT/commit
+    
+    # Importación de pagos de conciliación bancaria (POST /invoices/payments/import)
+    PAYMENT_IMPORT_CHUNK_SIZE: int = 1000  # filas por transacción
+    
     # Configuración de cache
     CACHE_TTL: int = 300  # 5 minutos
+    CACHE_BACKEND: str = "redis"  # redis | memory (un solo worker, sin Redis) | none (sin cache)
+    MEMORY_CACHE_MAX_ENTRIES: int = 10000  # claves máximas del backend "memory"
+    
+    # TTLs de statements: frescos hasta SOFT_TTL; durante STALE_WHILE_REVALIDATE segundos
+    # más se sirve el valor vencido y se refresca en background; hasta HARD_TTL el valor
+    # vencido solo se sirve si el recálculo falla (stale-if-error)
+    STATEMENT_CACHE_SOFT_TTL: int = 60
+    STATEMENT_CACHE_STALE_WHILE_REVALIDATE: int = 60
+    STATEMENT_CACHE_HARD_TTL: int = 600
+    STATEMENT_PAGE_BLOCK_SIZE: int = 50  # facturas por bloque cacheado del listado de statements
+    ENTITY_CACHE_TTL: int = 300  # snapshots de colegios y estudiantes por ID
+    COUNT_CACHE_TTL: int = 30  # totales exactos de listados por filtros (total_mode=exact)
+    
+    # Compresión gzip de los cuerpos de statements cacheados
+    STATEMENT_CACHE_COMPRESSION: bool = True
+    STATEMENT_CACHE_COMPRESSION_MIN_SIZE: int = 2048  # bytes
+    STATEMENT_CACHE_COMPRESSION_LEVEL: int = 6
+    
+    # Conexión a Redis (pool compartido) y circuit breaker
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 2.0  # segundos (conexión y lectura)
+    REDIS_CIRCUIT_FAILURE_THRESHOLD: int = 5  # fallos de conexión que abren el circuito...
+    REDIS_CIRCUIT_FAILURE_WINDOW: float = 10.0  # ...dentro de esta ventana (segundos)
+    REDIS_CIRCUIT_BACKOFF_BASE: float = 1.0  # primer intervalo antes de sondear Redis
+    REDIS_CIRCUIT_BACKOFF_MAX: float = 60.0  # intervalo máximo entre sondeos
+    
+    # Cache local en proceso (primer nivel, delante de Redis)
+    LOCAL_CACHE_ENABLED: bool = True
+    LOCAL_CACHE_MAX_ENTRIES: int = 1024
+    LOCAL_CACHE_TTL: int = 10  # segundos; acota el desfase si se pierde una invalidación
+    
+    # Coalescing de recálculos de statements (single-flight)
+    CACHE_LOCK_TTL: int = 10  # segundos que dura el lock de recálculo en Redis
+    CACHE_LOCK_WAIT: float = 5.0  # segundos máximos esperando el resultado de otro worker
+    CACHE_WRITE_TTL: int = 30  # segundos que una escritura en curso impide guardar totales recalculados
     
     class Config:
         env_file = ".env"
@@ -1,23 +1,60 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Optional
 from app.core.config import settings
 import logging
+import re
+
+logger = logging.getLogger(__name__)
 
 # Crear engine de SQLAlchemy
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
     pool_size=10,
-    max_overflow=20
+    max_overflow=20,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE
 )
 
 # Crear SessionLocal
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Réplica de lectura (READ_REPLICA_URL); sin ella las sesiones de lectura usan el primario
+read_engine = create_engine(
+    settings.READ_REPLICA_URL,
+    pool_pre_ping=True,
+    pool_size=settings.READ_REPLICA_POOL_SIZE,
+    max_overflow=settings.READ_REPLICA_MAX_OVERFLOW,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE
+) if settings.READ_REPLICA_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 # Base para los modelos
 Base = declarative_base()
 
+# Engine y sesiones async (asyncpg), creados al primer uso solo si ASYNC_DB_ENABLED
+_async_engine = None
+_AsyncSessionLocal = None
+_async_read_engine = None
+_AsyncReadSessionLocal = None
+_AsyncStatementSessionLocal = None
+
+# Read-your-writes: las respuestas de escritura retornan la posición (LSN) del primario
+# después del commit, y el cliente la reenvía en sus lecturas (header o cookie) para no
+# leer de una réplica que todavía no la aplicó
+DB_POSITION_HEADER = "X-DB-Position"
+DB_POSITION_COOKIE = "db_position"
+_LSN_PATTERN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+_PRIMARY_POSITION = text("SELECT pg_current_wal_lsn()::text")
+# pg_last_wal_replay_lsn() es NULL fuera de una réplica (ej: el stand-in local, otra URL
+# de la misma base): se considera al día
+_REPLICA_CAUGHT_UP = text(
+    "SELECT pg_last_wal_replay_lsn() IS NULL OR pg_last_wal_replay_lsn() >= CAST(:position AS pg_lsn)"
+)
+
 
 def get_db():
     """
@@ -30,6 +67,255 @@ def get_db():
         db.close()
 
 
+def has_read_replica() -> bool:
+    """Indica si hay una réplica de lectura configurada."""
+    return settings.READ_REPLICA_URL is not None
+
+
+def get_read_position(request: Request) -> Optional[str]:
+    """Posición de la última escritura del cliente (header o cookie), si es un LSN válido."""
+    position = request.headers.get(DB_POSITION_HEADER) or request.cookies.get(DB_POSITION_COOKIE)
+    if position and _LSN_PATTERN.match(position):
+        return position
+    return None
+
+
+def get_primary_position() -> Optional[str]:
+    """LSN actual del primario (leído después del commit de una escritura)."""
+    with engine.connect() as connection:
+        return connection.scalar(_PRIMARY_POSITION)
+
+
+def get_read_db(request: Request):
+    """
+    Dependency para lecturas que toleran el lag de la réplica (listados y statements).
+    Usa la réplica, salvo que el cliente envíe la posición de una escritura propia que
+    la réplica todavía no aplicó: entonces usa el primario (read-your-writes).
+    """
+    session_factory = ReadSessionLocal
+    if has_read_replica():
+        position = get_read_position(request)
+        if position is not None and not _replica_caught_up(position):
+            session_factory = SessionLocal
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _replica_caught_up(position: str) -> bool:
+    """Indica si la réplica ya aplicó la posición; ante un error se lee del primario."""
+    try:
+        with read_engine.connect() as connection:
+            return bool(connection.scalar(_REPLICA_CAUGHT_UP, {"position": position}))
+    except Exception as e:
+        logger.warning(f"No se pudo consultar la posición de la réplica: {e}")
+        return False
+
+
+class ConsistentReadSession(Session):
+    """
+    Sesión de lectura para resultados que se guardan en el cache compartido (statements).
+    
+    El engine se elige en la primera consulta y no al abrir la sesión: la réplica solo si
+    ya aplicó la posición actual del primario, si no el primario. La primera consulta
+    ocurre después de leer la generación del cache, así que toda escritura que invalidó
+    esa generación ya está dentro de la posición leída: un valor calculado en la réplica
+    nunca queda cacheado (ni con su ETag) con datos anteriores a esa escritura.
+    Con escrituras constantes sobre un colegio los misses tienden a ir al primario.
+    """
+    
+    def __init__(self, *args, primary_bind=None, replica_bind=None, **kwargs):
+        kwargs["bind"] = primary_bind
+        super().__init__(*args, **kwargs)
+        self._primary_bind = primary_bind
+        self._replica_bind = replica_bind
+        self._routed_bind = None
+    
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._routed_bind is None:
+            self._routed_bind = _consistent_bind(self._primary_bind, self._replica_bind)
+        return self._routed_bind
+
+
+def _consistent_bind(primary, replica):
+    """Réplica si ya aplicó la posición actual del primario; ante un error, el primario."""
+    try:
+        with primary.connect() as connection:
+            position = connection.scalar(_PRIMARY_POSITION)
+        with replica.connect() as connection:
+            if connection.scalar(_REPLICA_CAUGHT_UP, {"position": position}):
+                return replica
+    except Exception as e:
+        logger.warning(f"No se pudo comparar la posición de la réplica con el primario: {e}")
+    return primary
+
+
+# Sesiones de los statements cacheados; sin réplica son sesiones comunes del primario
+StatementSessionLocal = sessionmaker(
+    class_=ConsistentReadSession,
+    autocommit=False,
+    autoflush=False,
+    primary_bind=engine,
+    replica_bind=read_engine
+) if settings.READ_REPLICA_URL else SessionLocal
+
+
+def get_statement_db():
+    """
+    Dependency para los statements (cacheados): la réplica solo si está al día con el
+    primario (ver ConsistentReadSession).
+    """
+    db = StatementSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _asyncpg_url(url: str) -> str:
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def _asyncpg_connect_args() -> dict:
+    """
+    Argumentos de conexión de asyncpg: las sentencias se preparan en el servidor y se
+    reutilizan por conexión, así que PostgreSQL no vuelve a parsear las consultas
+    frecuentes (y puede usar un plan genérico).
+    """
+    return {"prepared_statement_cache_size": settings.ASYNC_DB_PREPARED_STATEMENT_CACHE_SIZE}
+
+
+def get_async_database_url() -> str:
+    """URL del engine async: ASYNC_DATABASE_URL, o DATABASE_URL con el driver asyncpg."""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    return _asyncpg_url(settings.DATABASE_URL)
+
+
+def get_async_read_database_url() -> str:
+    """URL async de la réplica: READ_REPLICA_ASYNC_URL, o READ_REPLICA_URL con el driver asyncpg."""
+    if settings.READ_REPLICA_ASYNC_URL:
+        return settings.READ_REPLICA_ASYNC_URL
+    return _asyncpg_url(settings.READ_REPLICA_URL)
+
+
+def get_async_sessionmaker():
+    """Crea (una sola vez) el engine async y su fábrica de sesiones."""
+    global _async_engine, _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        
+        _async_engine = create_async_engine(
+            get_async_database_url(),
+            pool_pre_ping=True,
+            pool_size=settings.ASYNC_DB_POOL_SIZE,
+            max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+            query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+            connect_args=_asyncpg_connect_args()
+        )
+        # Sin expirar al commit: los objetos se serializan después de cerrar la transacción
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _AsyncSessionLocal
+
+
+def get_async_read_sessionmaker():
+    """Crea (una sola vez) el engine async de la réplica; sin réplica usa el del primario."""
+    global _async_read_engine, _AsyncReadSessionLocal
+    if not has_read_replica():
+        return get_async_sessionmaker()
+    if _AsyncReadSessionLocal is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        
+        _async_read_engine = create_async_engine(
+            get_async_read_database_url(),
+            pool_pre_ping=True,
+            pool_size=settings.READ_REPLICA_POOL_SIZE,
+            max_overflow=settings.READ_REPLICA_MAX_OVERFLOW,
+            query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+            connect_args=_asyncpg_connect_args()
+        )
+        _AsyncReadSessionLocal = async_sessionmaker(_async_read_engine, autoflush=False, expire_on_commit=False)
+    return _AsyncReadSessionLocal
+
+
+async def get_async_db():
+    """
+    Dependency para obtener una sesión async de base de datos (camino de lectura async).
+    """
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    """
+    Dependency async para lecturas que toleran el lag de la réplica (ver get_read_db).
+    """
+    session_factory = get_async_read_sessionmaker()
+    if has_read_replica():
+        position = get_read_position(request)
+        if position is not None and not await _async_replica_caught_up(position):
+            session_factory = get_async_sessionmaker()
+    async with session_factory() as db:
+        yield db
+
+
+def get_async_statement_sessionmaker():
+    """
+    Fábrica async de las sesiones de statements (ver ConsistentReadSession); sin réplica
+    usa la del primario.
+    """
+    global _AsyncStatementSessionLocal
+    if not has_read_replica():
+        return get_async_sessionmaker()
+    if _AsyncStatementSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        
+        get_async_sessionmaker()
+        get_async_read_sessionmaker()
+        _AsyncStatementSessionLocal = async_sessionmaker(
+            sync_session_class=ConsistentReadSession,
+            autoflush=False,
+            expire_on_commit=False,
+            primary_bind=_async_engine.sync_engine,
+            replica_bind=_async_read_engine.sync_engine
+        )
+    return _AsyncStatementSessionLocal
+
+
+async def get_async_statement_db():
+    """Ver get_statement_db."""
+    async with get_async_statement_sessionmaker()() as db:
+        yield db
+
+
+async def _async_replica_caught_up(position: str) -> bool:
+    """Ver _replica_caught_up."""
+    get_async_read_sessionmaker()
+    try:
+        async with _async_read_engine.connect() as connection:
+            return bool(await connection.scalar(_REPLICA_CAUGHT_UP, {"position": position}))
+    except Exception as e:
+        logger.warning(f"No se pudo consultar la posición de la réplica: {e}")
+        return False
+
+
+async def dispose_async_engine():
+    """Cierra las conexiones de los engines async (primario y réplica), si fueron creados."""
+    global _async_engine, _AsyncSessionLocal, _async_read_engine, _AsyncReadSessionLocal
+    global _AsyncStatementSessionLocal
+    _AsyncStatementSessionLocal = None
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _AsyncSessionLocal = None
+    if _async_read_engine is not None:
+        await _async_read_engine.dispose()
+        _async_read_engine = None
+        _AsyncReadSessionLocal = None
+
+
 def init_db():
     """
     Inicializa las tablas de la base de datos.
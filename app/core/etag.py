@@ -0,0 +1,73 @@
+"""
+ETags fuertes derivados de la versión de cada recurso.
+
+La versión (generación del statement o versión de la entidad) se lee del cache
+compartido sin consultar PostgreSQL, así que un request con un If-None-Match
+vigente se responde 304 sin calcular ni serializar el cuerpo.
+"""
+from typing import Awaitable, Callable, Optional
+from fastapi import Request, Response
+
+# Sufijo del ETag de la representación comprimida con gzip (debe diferir de la original)
+GZIP_SUFFIX = "-gzip"
+
+
+def make_etag(*parts) -> str:
+    """Arma un ETag fuerte a partir de la versión del recurso (ej: make_etag(gen, skip, limit))."""
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def encoded_etag(etag: str, content_encoding: Optional[str]) -> str:
+    """ETag de la representación con la codificación dada (ej: '"123-gzip"' para gzip)."""
+    if content_encoding == "gzip":
+        return etag[:-1] + GZIP_SUFFIX + '"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> Optional[str]:
+    """
+    Compara un header If-None-Match con el ETag vigente (comparación débil, RFC 9110).
+    Acepta también el ETag de la representación gzip.
+    
+    Returns:
+        El ETag del header que coincide, o None
+    """
+    if not if_none_match or not etag:
+        return None
+    candidates = (etag, encoded_etag(etag, "gzip"))
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in candidates:
+            return candidate
+    return None
+
+
+def check_not_modified(request: Request, get_etag: Callable[[], Optional[str]]) -> Optional[Response]:
+    """
+    Retorna una respuesta 304 si el If-None-Match del request coincide con el ETag vigente.
+    get_etag() solo se llama si el request trae If-None-Match.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    return _not_modified(if_none_match, get_etag())
+
+
+async def check_not_modified_async(
+    request: Request,
+    get_etag: Callable[[], Awaitable[Optional[str]]]
+) -> Optional[Response]:
+    """Igual que check_not_modified, con get_etag async (camino de lectura async)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    return _not_modified(if_none_match, await get_etag())
+
+
+def _not_modified(if_none_match: str, etag: Optional[str]) -> Optional[Response]:
+    matched = etag_matches(if_none_match, etag)
+    if matched is None:
+        return None
+    return Response(status_code=304, headers={"ETag": matched, "Vary": "Accept-Encoding"})
@@ -0,0 +1,120 @@
+"""
+Paginación por cursor (keyset) de los listados.
+
+Con OFFSET, PostgreSQL recorre y descarta todas las filas anteriores a la página;
+con un cursor la consulta continúa donde terminó la página anterior
+(WHERE (created_at, id) < (:created_at, :id)) y, con un índice compuesto sobre
+las mismas columnas, la página N cuesta lo mismo que la primera. Además las
+páginas no se corren si se insertan filas mientras se recorre el listado.
+
+El cursor es opaco para el cliente: los valores de orden de la última fila de la
+página en JSON, codificados en base64 URL-safe.
+"""
+import base64
+import binascii
+import enum
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+from sqlalchemy import literal, tuple_
+
+
+class TotalMode(str, enum.Enum):
+    """Cómo se calcula el total de un listado paginado"""
+    EXACT = "exact"  # COUNT(*) con los filtros, cacheado por unos segundos
+    ESTIMATE = "estimate"  # Estimación de filas del planner (sin recorrer la tabla)
+    NONE = "none"  # Sin total (has_next sale de leer una fila extra)
+
+
+class InvalidCursorError(ValueError):
+    """El cursor no es válido para el listado (mal formado o de otro listado)"""
+
+
+class Keyset:
+    """
+    Orden estable de un listado: columnas de orden descendente, con id como desempate
+    al final para que dos filas nunca tengan la misma clave.
+    
+    Ej: Keyset(Invoice.due_date, Invoice.created_at, Invoice.id)
+    """
+    
+    def __init__(self, *columns):
+        self.columns = columns
+    
+    def order_by(self) -> List[Any]:
+        """Cláusulas ORDER BY del listado"""
+        return [column.desc() for column in self.columns]
+    
+    def paginate(self, query, skip: int, limit: int, cursor: Optional[str] = None):
+        """
+        Ordena la consulta (Query o Select) y aplica la página: desde el cursor si se
+        envía (se ignora skip), o con OFFSET skip si no.
+        
+        Raises:
+            InvalidCursorError: Si el cursor no es válido para este listado
+        """
+        query = query.order_by(*self.order_by())
+        if cursor is not None:
+            query = query.where(self.after(cursor))
+        else:
+            query = query.offset(skip)
+        return query.limit(limit)
+    
+    def after(self, cursor: str):
+        """Condición de las filas posteriores al cursor: (a, b, id) < (:a, :b, :id)"""
+        values = self.decode(cursor)
+        return tuple_(*self.columns) < tuple_(
+            *(literal(value, column.type) for column, value in zip(self.columns, values))
+        )
+    
+    def cursor_for(self, item) -> str:
+        """Cursor que apunta después de item (modelo o schema con las columnas de orden)"""
+        return self._encode([getattr(item, column.key) for column in self.columns])
+    
+    def cursor_for_row(self, row: Dict[str, Any]) -> str:
+        """Cursor que apunta después de una fila ya serializada a JSON (dict)"""
+        return self._encode([row[column.key] for column in self.columns])
+    
+    def decode(self, cursor: str) -> List[Any]:
+        """
+        Valores de orden de un cursor, convertidos al tipo de cada columna.
+        
+        Raises:
+            InvalidCursorError: Si el cursor no es válido para este listado
+        """
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor.encode() + b"=" * (-len(cursor) % 4)))
+            if not isinstance(raw, list) or len(raw) != len(self.columns):
+                raise ValueError("cantidad de valores incorrecta")
+            return [_parse_value(column, value) for column, value in zip(self.columns, raw)]
+        except (ValueError, TypeError, binascii.Error) as e:
+            raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+    
+    @staticmethod
+    def _encode(values: Sequence[Any]) -> str:
+        content = json.dumps([_json_value(value) for value in values], separators=(",", ":"))
+        return base64.urlsafe_b64encode(content.encode()).rstrip(b"=").decode()
+
+
+def _json_value(value: Any) -> Any:
+    """Valor de orden como JSON (fechas en ISO 8601, UUIDs como texto)"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _parse_value(column, value: Any) -> Any:
+    """Convierte un valor del cursor al tipo de la columna"""
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is UUID:
+        return UUID(value)
+    if not isinstance(value, python_type):
+        raise TypeError(f"se esperaba {python_type.__name__}")
+    return value
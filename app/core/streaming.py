@@ -0,0 +1,69 @@
+"""
+Lectura incremental de cuerpos de requests grandes (NDJSON, CSV).
+
+Los chunks del cuerpo se decodifican y se cortan en líneas a medida que llegan, sin
+cargar el cuerpo completo en memoria; solo se retiene la línea incompleta del final
+de cada chunk.
+"""
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Optional, Tuple
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], encoding: str = "utf-8") -> AsyncIterator[str]:
+    """
+    Líneas de texto de un stream de bytes (ej: request.stream()), sin el salto de línea.
+    
+    Acepta finales de línea \\n y \\r\\n, y una última línea sin salto. Un carácter
+    multibyte cortado entre dos chunks se decodifica completo.
+    
+    Raises:
+        UnicodeDecodeError: Si el cuerpo no está en la codificación indicada
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(
+    chunks: AsyncIterable[bytes],
+    csv_format: bool = False
+) -> AsyncIterator[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Registros de un cuerpo NDJSON (un objeto JSON por línea) o CSV (la primera línea
+    tiene los nombres de las columnas), uno por línea no vacía.
+    
+    Cada registro se produce como (registro, None), o (None, error) si la línea no se
+    pudo leer; así quien consume puede informar la fila y seguir con las siguientes.
+    Los campos de una fila CSV no pueden contener saltos de línea.
+    
+    Raises:
+        UnicodeDecodeError: Si el cuerpo no está en UTF-8
+    """
+    header = None
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if not csv_format:
+            try:
+                yield json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield None, f"Invalid JSON: {e.msg}"
+            continue
+        
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield dict(zip(header, values)), None
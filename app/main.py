@@ -2,10 +2,18 @@ from fastapi import FastAPI, status, Request
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.core.database import get_db, init_db
+from app.core.database import (
+    get_db, init_db, dispose_async_engine, has_read_replica, get_primary_position,
+    DB_POSITION_HEADER, DB_POSITION_COOKIE
+)
+from app.core.config import settings
 from app.api.routes import api_router
 from app.core.exceptions import validation_exception_handler
+from app.core.cache import (
+    InvalidationBatch, start_invalidation_listener, stop_invalidation_listener, get_cache_stats, get_cache_status
+)
 import logging
 
 # Configurar logging
@@ -48,6 +56,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def flush_cache_invalidations(request: Request, call_next):
+    """
+    Acumula las invalidaciones de cache del request y las aplica al terminarlo
+    (después del commit y antes de responder) en un solo round trip.
+    """
+    batch = InvalidationBatch()
+    try:
+        with batch:
+            return await call_next(request)
+    finally:
+        await run_in_threadpool(batch.flush)
+
+
+@app.middleware("http")
+async def read_your_writes_position(request: Request, call_next):
+    """
+    Con réplica de lectura, agrega a las respuestas de escrituras exitosas la posición
+    (LSN) del primario después del commit, en un header y una cookie: las lecturas del
+    mismo cliente que la envían van al primario hasta que la réplica la aplique.
+    """
+    response = await call_next(request)
+    if has_read_replica() and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        try:
+            position = await run_in_threadpool(get_primary_position)
+        except Exception as e:
+            logger.warning(f"No se pudo leer la posición del primario: {e}")
+            position = None
+        if position:
+            response.headers[DB_POSITION_HEADER] = position
+            response.set_cookie(
+                DB_POSITION_COOKIE, position, max_age=settings.READ_YOUR_WRITES_TTL, httponly=True
+            )
+    return response
+
+
 # Agregar exception handler personalizado para errores de validación
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 
@@ -66,6 +111,16 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Error al inicializar base de datos: {e}")
         raise
+    
+    # Suscribir el cache local a las invalidaciones de otros workers
+    start_invalidation_listener()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cancela la suscripción a invalidaciones de cache y cierra el engine async."""
+    stop_invalidation_listener()
+    await dispose_async_engine()
 
 
 @app.get("/", tags=["root"])
@@ -84,6 +139,8 @@ def health_check():
     """
     Health check endpoint.
     Verifica el estado de la aplicación y la conexión a la base de datos.
+    Informa además el estado del backend de cache (el cache es opcional,
+    por lo que un circuito abierto no marca la aplicación como unhealthy).
     """
     try:
         # Verificar conexión a la base de datos
@@ -97,6 +154,7 @@ def health_check():
             content={
                 "status": "healthy",
                 "database": "connected",
+                "cache": get_cache_status(),
                 "service": "mattilda-api"
             }
         )
@@ -107,6 +165,7 @@ def health_check():
             content={
                 "status": "unhealthy",
                 "database": "disconnected",
+                "cache": get_cache_status(),
                 "service": "mattilda-api",
                 "error": str(e)
             }
@@ -135,7 +194,8 @@ def metrics():
         return {
             "total_schools": total_schools,
             "total_students": total_students,
-            "total_invoices": total_invoices
+            "total_invoices": total_invoices,
+            "cache": get_cache_stats()
         }
     except Exception as e:
         logger.error(f"Error obteniendo métricas: {e}")
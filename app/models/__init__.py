@@ -2,6 +2,7 @@ from app.models.school import School
 from app.models.student import Student
 from app.models.invoice import Invoice
 from app.models.payment import Payment
+from app.models.balance import SchoolBalance, StudentBalance
 
-__all__ = ["School", "Student", "Invoice", "Payment"]
+__all__ = ["School", "Student", "Invoice", "Payment", "SchoolBalance", "StudentBalance"]
 
@@ -0,0 +1,162 @@
+from sqlalchemy import Column, ForeignKey, Integer, Numeric, DDL, event
+from sqlalchemy.dialects.postgresql import UUID
+from app.core.database import Base
+
+
+class SchoolBalance(Base):
+    """
+    Totales del estado de cuenta de un colegio, mantenidos por triggers de PostgreSQL
+    en la misma transacción que cada escritura sobre students, invoices y payments.
+    """
+    
+    __tablename__ = "school_balances"
+    
+    school_id = Column(UUID(as_uuid=True), ForeignKey("schools.id", ondelete="CASCADE"), primary_key=True)
+    total_invoiced = Column(Numeric(14, 2), nullable=False, server_default="0")
+    total_paid = Column(Numeric(14, 2), nullable=False, server_default="0")
+    total_invoices = Column(Integer, nullable=False, server_default="0")
+    active_students = Column(Integer, nullable=False, server_default="0")
+    
+    def __repr__(self):
+        return f"<SchoolBalance(school_id={self.school_id}, total_invoiced={self.total_invoiced}, total_paid={self.total_paid})>"
+
+
+class StudentBalance(Base):
+    """Totales del estado de cuenta de un estudiante (ver SchoolBalance)"""
+    
+    __tablename__ = "student_balances"
+    
+    student_id = Column(UUID(as_uuid=True), ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    total_invoiced = Column(Numeric(14, 2), nullable=False, server_default="0")
+    total_paid = Column(Numeric(14, 2), nullable=False, server_default="0")
+    total_invoices = Column(Integer, nullable=False, server_default="0")
+    
+    def __repr__(self):
+        return f"<StudentBalance(student_id={self.student_id}, total_invoiced={self.total_invoiced}, total_paid={self.total_paid})>"
+
+
+# Funciones y triggers que mantienen los balances. Las filas se crean al insertar el
+# colegio o el estudiante y se eliminan en cascada con él; cada trigger descuenta la
+# fila anterior (OLD) y suma la nueva (NEW), siempre en orden estudiante -> colegio
+# para que escrituras concurrentes tomen los locks de los balances en el mismo orden.
+# Los INSERT de facturas se suman por sentencia (tabla de transición agrupada por
+# estudiante y colegio), así una carga masiva actualiza cada balance una sola vez.
+# Debe coincidir con las migraciones 006 (que además carga los balances existentes) y 011.
+BALANCE_TRIGGERS_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION balances_on_school_change() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO school_balances (school_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION balances_on_student_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO student_balances (student_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active THEN
+            UPDATE school_balances SET active_students = active_students - 1 WHERE school_id = OLD.school_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active THEN
+            UPDATE school_balances SET active_students = active_students + 1 WHERE school_id = NEW.school_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION balances_on_invoice_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE student_balances
+            SET total_invoiced = total_invoiced - OLD.total_amount, total_invoices = total_invoices - 1
+            WHERE student_id = OLD.student_id;
+            UPDATE school_balances
+            SET total_invoiced = total_invoiced - OLD.total_amount, total_invoices = total_invoices - 1
+            WHERE school_id = OLD.school_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE student_balances
+            SET total_invoiced = total_invoiced + NEW.total_amount, total_invoices = total_invoices + 1
+            WHERE student_id = NEW.student_id;
+            UPDATE school_balances
+            SET total_invoiced = total_invoiced + NEW.total_amount, total_invoices = total_invoices + 1
+            WHERE school_id = NEW.school_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION balances_on_invoice_insert() RETURNS trigger AS $$
+    BEGIN
+        UPDATE student_balances
+        SET total_invoiced = student_balances.total_invoiced + inserted_totals.total_invoiced,
+            total_invoices = student_balances.total_invoices + inserted_totals.total_invoices
+        FROM (
+            SELECT student_id, SUM(total_amount) AS total_invoiced, COUNT(*) AS total_invoices
+            FROM inserted GROUP BY student_id
+        ) AS inserted_totals
+        WHERE student_balances.student_id = inserted_totals.student_id;
+        UPDATE school_balances
+        SET total_invoiced = school_balances.total_invoiced + inserted_totals.total_invoiced,
+            total_invoices = school_balances.total_invoices + inserted_totals.total_invoices
+        FROM (
+            SELECT school_id, SUM(total_amount) AS total_invoiced, COUNT(*) AS total_invoices
+            FROM inserted GROUP BY school_id
+        ) AS inserted_totals
+        WHERE school_balances.school_id = inserted_totals.school_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION balances_on_payment_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE student_balances SET total_paid = total_paid - OLD.amount WHERE student_id = OLD.student_id;
+            UPDATE school_balances SET total_paid = total_paid - OLD.amount WHERE school_id = OLD.school_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE student_balances SET total_paid = total_paid + NEW.amount WHERE student_id = NEW.student_id;
+            UPDATE school_balances SET total_paid = total_paid + NEW.amount WHERE school_id = NEW.school_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS trg_school_balances ON schools",
+    """
+    CREATE TRIGGER trg_school_balances AFTER INSERT ON schools
+    FOR EACH ROW EXECUTE FUNCTION balances_on_school_change()
+    """,
+    "DROP TRIGGER IF EXISTS trg_student_balances ON students",
+    """
+    CREATE TRIGGER trg_student_balances AFTER INSERT OR DELETE OR UPDATE OF is_active, school_id ON students
+    FOR EACH ROW EXECUTE FUNCTION balances_on_student_change()
+    """,
+    "DROP TRIGGER IF EXISTS trg_invoice_balances ON invoices",
+    """
+    CREATE TRIGGER trg_invoice_balances AFTER DELETE OR UPDATE OF total_amount, student_id, school_id ON invoices
+    FOR EACH ROW EXECUTE FUNCTION balances_on_invoice_change()
+    """,
+    "DROP TRIGGER IF EXISTS trg_invoice_balances_insert ON invoices",
+    """
+    CREATE TRIGGER trg_invoice_balances_insert AFTER INSERT ON invoices
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT EXECUTE FUNCTION balances_on_invoice_insert()
+    """,
+    "DROP TRIGGER IF EXISTS trg_payment_balances ON payments",
+    """
+    CREATE TRIGGER trg_payment_balances AFTER INSERT OR DELETE OR UPDATE OF amount, student_id, school_id ON payments
+    FOR EACH ROW EXECUTE FUNCTION balances_on_payment_change()
+    """,
+]
+
+# Con create_all (tests y fallback de init_db) los triggers se crean junto con las tablas;
+# en producción los crea la migración 006
+for _statement in BALANCE_TRIGGERS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
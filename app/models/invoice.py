@@ -1,8 +1,9 @@
 from sqlalchemy import Column, String, DateTime, Date, ForeignKey, Numeric, Enum as SQLEnum, UniqueConstraint, Index, CheckConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum
+from decimal import Decimal
 import uuid
 from app.core.database import Base
 
@@ -21,10 +22,24 @@ class Invoice(Base):
     __tablename__ = "invoices"
     __table_args__ = (
         UniqueConstraint('school_id', 'invoice_number', name='uq_invoice_school_number'),
-        Index('idx_invoice_school_due', 'school_id', 'due_date'),
-        Index('idx_invoice_student_due', 'student_id', 'due_date'),
+        # Orden de los statements y del listado (paginación por cursor): uno por cada
+        # combinación de filtro y orden del listado, con las columnas de orden al final
+        Index('idx_invoice_school_due_created', 'school_id', 'due_date', 'created_at', 'id'),
+        Index('idx_invoice_student_due_created', 'student_id', 'due_date', 'created_at', 'id'),
+        Index('idx_invoice_created', 'created_at', 'id'),
+        Index('idx_invoice_school_created', 'school_id', 'created_at', 'id'),
+        Index('idx_invoice_school_status_created', 'school_id', 'status', 'created_at', 'id'),
+        Index('idx_invoice_student_created', 'student_id', 'created_at', 'id'),
+        Index('idx_invoice_status_created', 'status', 'created_at', 'id'),
+        Index('idx_invoice_due_created', 'due_date', 'created_at', 'id'),
+        # Una factura por estudiante y período de facturación recurrente (corridas idempotentes)
+        Index(
+            'uq_invoice_school_period_student', 'school_id', 'billing_period', 'student_id',
+            unique=True, postgresql_where=text('billing_period IS NOT NULL')
+        ),
         CheckConstraint('total_amount >= 0', name='ck_invoice_total_amount_positive'),
         CheckConstraint('due_date >= issue_date', name='ck_invoice_due_after_issue'),
+        CheckConstraint('paid_amount >= 0', name='ck_invoice_paid_amount_non_negative'),
     )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
@@ -32,10 +47,12 @@ class Invoice(Base):
     school_id = Column(UUID(as_uuid=True), ForeignKey("schools.id"), nullable=False, index=True)
     student_id = Column(UUID(as_uuid=True), ForeignKey("students.id"), nullable=False, index=True)
     total_amount = Column(Numeric(12, 2), nullable=False)  # Renombrado de amount
+    paid_amount = Column(Numeric(12, 2), nullable=False, default=Decimal("0.00"), server_default="0")  # Suma de los pagos
     description = Column(String(500), nullable=True)
     issue_date = Column(Date, nullable=False, server_default=func.current_date())
     due_date = Column(Date, nullable=False)  # Cambiado de DateTime a Date
     status = Column(SQLEnum(InvoiceStatus), default=InvoiceStatus.PENDING, nullable=False, index=True)
+    billing_period = Column(String(7), nullable=True)  # YYYY-MM si la creó una corrida de facturación
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -1,7 +1,7 @@
 from sqlalchemy import Column, String, DateTime, ForeignKey, Numeric, Index, CheckConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import uuid
 from app.core.database import Base
 
@@ -13,6 +13,9 @@ class Payment(Base):
     __table_args__ = (
         Index('idx_payment_student_date', 'student_id', 'payment_date'),
         Index('idx_payment_school_date', 'school_id', 'payment_date'),
+        Index('idx_payment_invoice_date', 'invoice_id', 'payment_date', 'id'),  # Pagos de una factura (cursor)
+        # Referencias bancarias ya importadas por colegio (importación de pagos)
+        Index('idx_payment_school_reference', 'school_id', 'payment_reference', postgresql_where=text('payment_reference IS NOT NULL')),
         CheckConstraint('amount > 0', name='ck_payment_amount_positive'),
     )
     
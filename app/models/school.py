@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Boolean
+from sqlalchemy import Column, String, DateTime, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -10,6 +10,9 @@ class School(Base):
     """Modelo de Colegio"""
     
     __tablename__ = "schools"
+    __table_args__ = (
+        Index('idx_school_created', 'created_at', 'id'),  # Orden del listado (paginación por cursor)
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(200), nullable=False, index=True)
@@ -13,6 +13,9 @@ class Student(Base):
     __table_args__ = (
         UniqueConstraint('school_id', 'student_code', name='uq_student_school_code'),
         Index('idx_student_active_school', 'is_active', 'school_id'),
+        # Orden del listado, general y por colegio (paginación por cursor)
+        Index('idx_student_created', 'created_at', 'id'),
+        Index('idx_student_school_created', 'school_id', 'created_at', 'id'),
     )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
@@ -2,13 +2,16 @@ from app.schemas.school import School, SchoolCreate, SchoolUpdate
 from app.schemas.student import Student, StudentCreate, StudentUpdate
 from app.schemas.invoice import Invoice, InvoiceCreate, InvoiceUpdate
 from app.schemas.payment import Payment, PaymentCreate
-from app.schemas.account import AccountStatus, SchoolAccountStatus, StudentAccountStatus
+from app.schemas.account import (
+    AccountStatus, SchoolAccountStatus, StudentAccountStatus, SchoolAccountSummary, StudentAccountSummary
+)
 
 __all__ = [
     "School", "SchoolCreate", "SchoolUpdate",
     "Student", "StudentCreate", "StudentUpdate",
     "Invoice", "InvoiceCreate", "InvoiceUpdate",
     "Payment", "PaymentCreate",
-    "AccountStatus", "SchoolAccountStatus", "StudentAccountStatus"
+    "AccountStatus", "SchoolAccountStatus", "StudentAccountStatus",
+    "SchoolAccountSummary", "StudentAccountSummary"
 ]
 
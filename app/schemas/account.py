@@ -12,25 +12,34 @@ class AccountStatus(BaseModel):
     total_pending: Decimal = Decimal("0.00")
 
 
-class SchoolAccountStatus(AccountStatus):
-    """Schema para estado de cuenta de un colegio"""
+class SchoolAccountSummary(AccountStatus):
+    """Schema para los totales del estado de cuenta de un colegio (sin facturas)"""
     school_id: UUID
     school_name: str
     total_students: int
-    invoices: List[Invoice] = []
     total_invoices: int = Field(0, description="Total de facturas")
+
+
+class SchoolAccountStatus(SchoolAccountSummary):
+    """Schema para estado de cuenta de un colegio"""
+    invoices: List[Invoice] = []
     skip: int = Field(0, description="Número de facturas saltadas")
     limit: int = Field(10, description="Límite de facturas retornadas")
+    next_cursor: Optional[str] = Field(None, description="Cursor de la página siguiente de facturas; null si no hay más")
 
 
-class StudentAccountStatus(AccountStatus):
-    """Schema para estado de cuenta de un estudiante"""
+class StudentAccountSummary(AccountStatus):
+    """Schema para los totales del estado de cuenta de un estudiante (sin facturas)"""
     student_id: UUID
     student_name: str
     school_id: UUID
     school_name: str
-    invoices: List[Invoice] = []
     total_invoices: int = Field(0, description="Total de facturas")
+
+
+class StudentAccountStatus(StudentAccountSummary):
+    """Schema para estado de cuenta de un estudiante"""
+    invoices: List[Invoice] = []
     skip: int = Field(0, description="Número de facturas saltadas")
     limit: int = Field(10, description="Límite de facturas retornadas")
-
+    next_cursor: Optional[str] = Field(None, description="Cursor de la página siguiente de facturas; null si no hay más")
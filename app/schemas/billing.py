@@ -0,0 +1,43 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
+
+class BillingRunCreate(BaseModel):
+    """Schema para una corrida de facturación mensual de un colegio"""
+    period: str = Field(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="Período facturado (YYYY-MM)")
+    total_amount: Decimal = Field(..., gt=0, description="Monto de la factura de cada estudiante activo")
+    due_day: int = Field(10, ge=1, le=28, description="Día del período en que vence la factura")
+    description: str = Field("Mensualidad {period}", max_length=500, description="Descripción de las facturas; {period} se reemplaza por el período")
+    invoice_number_prefix: str = Field("INV", min_length=1, max_length=20, description="Prefijo de los números de factura: {prefijo}-{período}-{secuencia}")
+    
+    @property
+    def issue_date(self) -> date:
+        """Primer día del período"""
+        year, month = (int(part) for part in self.period.split("-"))
+        return date(year, month, 1)
+    
+    @property
+    def due_date(self) -> date:
+        """Día due_day del período"""
+        return self.issue_date.replace(day=self.due_day)
+    
+    @property
+    def invoice_description(self) -> str:
+        """Descripción de las facturas con el período aplicado"""
+        return self.description.replace("{period}", self.period)
+
+
+class BillingRunResult(BaseModel):
+    """Resultado de una corrida de facturación (repetirla solo factura a los estudiantes que falten)"""
+    school_id: UUID
+    period: str
+    active_students: int = Field(..., description="Estudiantes activos del colegio")
+    created: int = Field(..., description="Facturas creadas en esta corrida")
+    already_billed: int = Field(..., description="Estudiantes activos que ya tenían factura del período")
+    skipped: int = Field(0, description="Estudiantes facturados en paralelo por otra carga del período durante la corrida (no se crearon)")
+    first_invoice_number: Optional[str] = Field(None, description="Primer número de factura asignado en esta corrida")
+    last_invoice_number: Optional[str] = Field(None, description="Último número de factura asignado en esta corrida")
+    elapsed_ms: float = Field(..., description="Duración de la corrida (ms)")
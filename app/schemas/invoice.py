@@ -1,10 +1,22 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
 from datetime import datetime, date
 from decimal import Decimal
 from uuid import UUID
+import enum
 from app.models.invoice import InvoiceStatus
-from app.schemas.payment import Payment
+from app.schemas.payment import Payment, PaymentSummary
+
+
+class InvoiceInclude(str, enum.Enum):
+    """Relaciones opcionales de las facturas en listados y statements"""
+    PAYMENTS = "payments"  # Lista completa de pagos de cada factura
+
+
+class InvoiceSort(str, enum.Enum):
+    """Orden del listado de facturas (siempre descendente, con id como desempate)"""
+    CREATED_AT = "created_at"  # Más recientes primero
+    DUE_DATE = "due_date"  # Vencimiento más lejano primero (mismo orden que los statements)
 
 
 class InvoiceBase(BaseModel):
@@ -24,6 +36,20 @@ class InvoiceCreate(InvoiceBase):
     pass
 
 
+class InvoiceBulkError(BaseModel):
+    """Error de una fila de la carga masiva de facturas"""
+    index: int = Field(..., description="Posición de la fila (0 = primera) en el array JSON o línea del NDJSON")
+    invoice_number: Optional[str] = Field(None, description="Número de factura de la fila, si se pudo leer")
+    detail: str = Field(..., description="Motivo por el que la fila no se creó")
+
+
+class InvoiceBulkResult(BaseModel):
+    """Resultado de la carga masiva: las filas válidas se crean aunque otras fallen"""
+    created: int = Field(..., description="Facturas creadas")
+    failed: int = Field(..., description="Filas rechazadas")
+    errors: List[InvoiceBulkError] = Field(default=[], description="Errores por fila, ordenados por posición")
+
+
 class InvoiceUpdate(BaseModel):
     """Schema para actualizar un Invoice"""
     invoice_number: Optional[str] = Field(None, min_length=1, max_length=50)
@@ -41,8 +67,22 @@ class Invoice(InvoiceBase):
     id: UUID
     created_at: datetime
     updated_at: Optional[datetime] = None
-    payments: Optional[List[Payment]] = Field(default=[], description="Lista de pagos asociados a la factura")
+    paid_amount: Decimal = Field(Decimal("0.00"), description="Total pagado (suma de los pagos de la factura)")
+    billing_period: Optional[str] = Field(None, description="Período (YYYY-MM) de la corrida de facturación que la creó, si corresponde")
+    payment_summary: Optional[PaymentSummary] = Field(None, description="Resumen de los pagos (cantidad, suma y fecha del último)")
+    payments: Optional[List[Payment]] = Field(default=[], description="Lista de pagos asociados a la factura (en listados y statements solo con include=payments)")
     
     class Config:
         from_attributes = True
+    
+    @model_validator(mode="after")
+    def summarize_payments(self):
+        """Con los pagos cargados el resumen se calcula a partir de ellos"""
+        if self.payment_summary is None and self.payments is not None:
+            self.payment_summary = PaymentSummary(
+                count=len(self.payments),
+                total_amount=sum((payment.amount for payment in self.payments), Decimal("0.00")),
+                last_payment_date=max((payment.payment_date for payment in self.payments), default=None)
+            )
+        return self
 
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, TypeVar, Generic
+from typing import List, Optional, TypeVar, Generic
+from app.core.pagination import Keyset, TotalMode
 
 T = TypeVar('T')
 
@@ -7,27 +8,44 @@ T = TypeVar('T')
 class PaginatedResponse(BaseModel, Generic[T]):
     """Schema genérico para respuestas paginadas"""
     items: List[T] = Field(..., description="Lista de items de la página actual")
-    total: int = Field(..., description="Total de items disponibles")
+    total: Optional[int] = Field(..., description="Total de items disponibles (estimado con total_mode=estimate; null con total_mode=none)")
+    total_mode: TotalMode = Field(TotalMode.EXACT, description="Cómo se calculó el total")
     skip: int = Field(0, description="Número de items saltados")
     limit: int = Field(10, description="Límite de items por página")
     has_next: bool = Field(..., description="Indica si hay más páginas disponibles")
     has_previous: bool = Field(..., description="Indica si hay páginas anteriores")
+    next_cursor: Optional[str] = Field(None, description="Cursor de la página siguiente (enviarlo como cursor); null si no hay más")
 
     @classmethod
     def create(
         cls,
         items: List[T],
-        total: int,
+        total: Optional[int],
         skip: int = 0,
-        limit: int = 10
+        limit: int = 10,
+        keyset: Optional[Keyset] = None,
+        cursor: Optional[str] = None,
+        total_mode: TotalMode = TotalMode.EXACT
     ) -> "PaginatedResponse[T]":
-        """Método helper para crear una respuesta paginada"""
+        """
+        Método helper para crear una respuesta paginada.
+
+        items se pide con limit + 1: la fila extra solo indica si hay página siguiente
+        (no se retorna), así que has_next no depende del total (que puede ser None con
+        total_mode=none). Con keyset se agrega el next_cursor de la última fila; con
+        cursor la página no tiene offset (skip se reporta como 0).
+        """
+        has_next = len(items) > limit
+        items = items[:limit]
+        if cursor is not None:
+            skip = 0
         return cls(
             items=items,
             total=total,
+            total_mode=total_mode,
             skip=skip,
             limit=limit,
-            has_next=(skip + limit) < total,
-            has_previous=skip > 0
+            has_next=has_next,
+            has_previous=skip > 0 or cursor is not None,
+            next_cursor=keyset.cursor_for(items[-1]) if has_next and keyset is not None else None
         )
-
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, List, Optional
 from datetime import datetime
 from decimal import Decimal
 from uuid import UUID
@@ -38,3 +38,64 @@ class Payment(PaymentBase):
     class Config:
         from_attributes = True
 
+
+class PaymentSummary(BaseModel):
+    """Resumen de los pagos de una factura"""
+    count: int = Field(0, description="Cantidad de pagos")
+    total_amount: Decimal = Field(Decimal("0.00"), description="Suma de los pagos")
+    last_payment_date: Optional[datetime] = Field(None, description="Fecha del último pago")
+
+
+class PaymentImportRow(BaseModel):
+    """Fila de un archivo de conciliación bancaria (las columnas extra se ignoran)"""
+    invoice_number: Optional[str] = Field(None, max_length=50, description="Número de factura del colegio")
+    payment_reference: Optional[str] = Field(None, max_length=100, description="Referencia bancaria del pago; sin invoice_number se usa como número de factura")
+    amount: Decimal = Field(..., gt=0, description="Monto del pago (debe ser mayor a 0)")
+    payment_method: Optional[str] = Field(None, max_length=50, description="Método de pago")
+    notes: Optional[str] = Field(None, max_length=500, description="Notas adicionales")
+    payment_date: datetime = Field(default_factory=datetime.now, description="Fecha del pago")
+    
+    @model_validator(mode="before")
+    @classmethod
+    def drop_empty_values(cls, data: Any) -> Any:
+        """Las celdas vacías del CSV equivalen a columnas ausentes"""
+        if isinstance(data, dict):
+            return {key: value for key, value in data.items() if value != ""}
+        return data
+    
+    @model_validator(mode="after")
+    def require_invoice_key(self):
+        """La fila tiene que identificar la factura"""
+        if not self.invoice_key:
+            raise ValueError("invoice_number or payment_reference is required")
+        return self
+    
+    @property
+    def invoice_key(self) -> Optional[str]:
+        """Número de factura con el que se concilia la fila"""
+        return self.invoice_number or self.payment_reference
+    
+    @property
+    def bank_reference(self) -> Optional[str]:
+        """
+        Referencia que identifica la transacción del banco (para no importarla dos
+        veces); solo si no se está usando como número de factura.
+        """
+        return self.payment_reference if self.invoice_number else None
+
+
+class PaymentImportError(BaseModel):
+    """Fila del archivo de pagos que no se pudo conciliar"""
+    index: int = Field(..., description="Posición de la fila de datos (0 = primera, sin contar el encabezado del CSV)")
+    invoice_number: Optional[str] = Field(None, description="Número de factura con el que se buscó la fila")
+    payment_reference: Optional[str] = Field(None, description="Referencia bancaria de la fila")
+    detail: str = Field(..., description="Motivo por el que la fila no se aplicó")
+
+
+class PaymentImportResult(BaseModel):
+    """Resultado de la importación de pagos: las filas conciliadas se aplican aunque otras no"""
+    rows: int = Field(0, description="Filas de datos leídas")
+    matched: int = Field(0, description="Pagos conciliados y registrados")
+    unmatched: int = Field(0, description="Filas no aplicadas")
+    total_amount: Decimal = Field(Decimal("0.00"), description="Suma de los pagos registrados")
+    unmatched_rows: List[PaymentImportError] = Field(default=[], description="Detalle de las filas no aplicadas, en orden")
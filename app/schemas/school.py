@@ -28,11 +28,12 @@ class SchoolUpdate(BaseModel):
 
 
 class School(SchoolBase):
-    """Schema para retornar un School"""
+    """Schema para retornar un School (inmutable: se usa como snapshot cacheado)"""
     id: UUID
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
+        frozen = True
 
@@ -32,11 +32,12 @@ class StudentUpdate(BaseModel):
 
 
 class Student(StudentBase):
-    """Schema para retornar un Student"""
+    """Schema para retornar un Student (inmutable: se usa como snapshot cacheado)"""
     id: UUID
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
+        frozen = True
 
@@ -1,141 +1,456 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import bindparam, func, select, true
+from sqlalchemy.sql import Select
+from typing import List, Optional
 from decimal import Decimal
 from uuid import UUID
+import logging
+from app.models.balance import SchoolBalance, StudentBalance
 from app.models.school import School
 from app.models.student import Student
 from app.models.invoice import Invoice
 from app.models.payment import Payment
-from app.schemas.account import SchoolAccountStatus, StudentAccountStatus
+from app.schemas.account import (
+    SchoolAccountStatus, StudentAccountStatus, SchoolAccountSummary, StudentAccountSummary
+)
 from app.schemas.invoice import Invoice as InvoiceSchema
+from app.services.invoice_service import InvoiceService, AsyncInvoiceService
+from app.core.pagination import Keyset
+
+logger = logging.getLogger(__name__)
+
+# Nivel de aislamiento de los cálculos de statements: totales y páginas de facturas
+# leídos en el mismo request ven el mismo snapshot de la base
+STATEMENT_ISOLATION_LEVEL = "REPEATABLE READ"
+
+# Orden estable de las facturas de los statements (ver app.core.pagination)
+STATEMENT_KEYSET = Keyset(Invoice.due_date, Invoice.created_at, Invoice.id)
 
 
 class AccountService:
     """Servicio para calcular estados de cuenta"""
     
+    @staticmethod
+    def begin_statement_snapshot(db: Session):
+        """
+        Inicia la transacción de lectura del statement en REPEATABLE READ, para que los
+        totales y las facturas calculados en el mismo request sean consistentes entre sí.
+        Si la sesión ya tiene una transacción en curso se sigue usando esa.
+        """
+        if not db.in_transaction():
+            db.connection(execution_options={"isolation_level": STATEMENT_ISOLATION_LEVEL})
+    
+    @staticmethod
+    def get_school_account_summary(db: Session, school_id: UUID) -> SchoolAccountSummary:
+        """
+        Calcula los totales del estado de cuenta de un colegio (sin el listado de facturas).
+        Incluye: total facturado, total pagado, total pendiente, facturas y estudiantes activos.
+        Lee la fila de school_balances junto con el colegio (O(1), un round trip); si falta
+        (balances sin reconstruir) recurre a las agregaciones de _school_totals_query.
+        """
+        AccountService.begin_statement_snapshot(db)
+        row = db.execute(_SCHOOL_SUMMARY, {"school_id": school_id}).first()
+        if row is not None and row.has_balance is None:
+            _log_missing_balance("school", school_id)
+            row = db.execute(_SCHOOL_TOTALS, {"school_id": school_id}).first()
+        return _school_summary(school_id, row)
+    
+    @staticmethod
+    def get_school_invoices(
+        db: Session,
+        school_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> List[InvoiceSchema]:
+        """
+        Obtiene una página de facturas de un colegio con el resumen de sus pagos (y la
+        lista completa con include_payments, ver InvoiceService.page_schemas).
+        Ordenadas por fecha de vencimiento y creación descendente (id como desempate,
+        para que las páginas sean estables y puedan cachearse por bloques).
+        Con cursor la página continúa después del cursor (se ignora skip).
+        No valida que el colegio exista.
+        """
+        return AccountService._get_invoices(db, Invoice.school_id == school_id, skip, limit, cursor, include_payments)
+    
     @staticmethod
     def get_school_account_status(
-        db: Session, 
+        db: Session,
         school_id: UUID,
         skip: int = 0,
-        limit: int = 10
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
     ) -> SchoolAccountStatus:
         """
         Calcula el estado de cuenta de un colegio.
         Incluye: total facturado, total pagado, total pendiente y listado de facturas paginado.
-        Optimizado: usa school_id directamente en invoices y payments (sin joins).
+        Dos consultas (totales y página) sobre el mismo snapshot REPEATABLE READ.
         """
-        # Validar que el colegio existe
-        school = db.query(School).filter(School.id == school_id).first()
-        if not school:
-            raise ValueError(f"School with id {school_id} does not exist")
-        
-        # Query base para facturas del colegio (ahora con school_id directo, sin join)
-        invoices_query = db.query(Invoice).filter(Invoice.school_id == school_id)
-        
-        # Contar total de facturas
-        total_invoices = invoices_query.count()
-        
-        # Obtener facturas paginadas con sus pagos
-        invoices = invoices_query.options(
-            joinedload(Invoice.payments)
-        ).order_by(Invoice.due_date.desc(), Invoice.created_at.desc()).offset(skip).limit(limit).all()
-        
-        # Calcular totales usando agregaciones directas (evita doble conteo)
-        # Total facturado: suma directa de invoices por school_id
-        total_invoiced_result = db.query(func.sum(Invoice.total_amount)).filter(
-            Invoice.school_id == school_id
-        ).scalar()
-        total_invoiced = Decimal(total_invoiced_result) if total_invoiced_result else Decimal("0.00")
-        
-        # Total pagado: suma directa de payments por school_id (evita joins y doble conteo)
-        total_paid_result = db.query(func.sum(Payment.amount)).filter(
-            Payment.school_id == school_id
-        ).scalar()
-        total_paid = Decimal(total_paid_result) if total_paid_result else Decimal("0.00")
-        
-        total_pending = total_invoiced - total_paid
-        
-        # Convertir facturas paginadas a schemas
-        invoice_schemas = [InvoiceSchema.model_validate(invoice) for invoice in invoices]
-        
-        # Contar estudiantes activos
-        total_students = db.query(Student).filter(
-            Student.school_id == school_id,
-            Student.is_active == True
-        ).count()
+        summary = AccountService.get_school_account_summary(db, school_id)
+        invoices = AccountService.get_school_invoices(
+            db, school_id, skip=skip, limit=limit + 1, cursor=cursor, include_payments=include_payments
+        )
         
         return SchoolAccountStatus(
-            school_id=school.id,
-            school_name=school.name,
-            total_students=total_students,
-            total_invoiced=total_invoiced,
-            total_paid=total_paid,
-            total_pending=total_pending,
-            invoices=invoice_schemas,
-            total_invoices=total_invoices,
-            skip=skip,
-            limit=limit
+            **summary.model_dump(),
+            **_invoice_page(invoices, skip, limit, cursor)
         )
     
+    @staticmethod
+    def get_student_account_summary(db: Session, student_id: UUID) -> StudentAccountSummary:
+        """
+        Calcula los totales del estado de cuenta de un estudiante (sin el listado de facturas).
+        Incluye: total facturado, total pagado, total pendiente y número de facturas.
+        Lee la fila de student_balances junto con el estudiante y su colegio (ver
+        get_school_account_summary).
+        """
+        AccountService.begin_statement_snapshot(db)
+        row = db.execute(_STUDENT_SUMMARY, {"student_id": student_id}).first()
+        if row is not None and row.has_balance is None:
+            _log_missing_balance("student", student_id)
+            row = db.execute(_STUDENT_TOTALS, {"student_id": student_id}).first()
+        return _student_summary(student_id, row)
+    
+    @staticmethod
+    def get_student_invoices(
+        db: Session,
+        student_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> List[InvoiceSchema]:
+        """
+        Obtiene una página de facturas de un estudiante con el resumen de sus pagos (y la
+        lista completa con include_payments, ver InvoiceService.page_schemas).
+        Ordenadas por fecha de vencimiento y creación descendente (id como desempate).
+        Con cursor la página continúa después del cursor (se ignora skip).
+        No valida que el estudiante exista.
+        """
+        return AccountService._get_invoices(db, Invoice.student_id == student_id, skip, limit, cursor, include_payments)
+    
     @staticmethod
     def get_student_account_status(
-        db: Session, 
+        db: Session,
         student_id: UUID,
         skip: int = 0,
-        limit: int = 10
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
     ) -> StudentAccountStatus:
         """
         Calcula el estado de cuenta de un estudiante.
         Incluye: total facturado, total pagado, total pendiente y listado de facturas paginado.
-        Optimizado: usa student_id directamente en invoices y payments (sin joins).
+        Dos consultas (totales y página) sobre el mismo snapshot REPEATABLE READ.
         """
-        # Validar que el estudiante existe
-        student = db.query(Student).filter(Student.id == student_id).first()
-        if not student:
-            raise ValueError(f"Student with id {student_id} does not exist")
-        
-        # Query base para facturas del estudiante
-        invoices_query = db.query(Invoice).filter(Invoice.student_id == student_id)
-        
-        # Contar total de facturas
-        total_invoices = invoices_query.count()
-        
-        # Obtener facturas paginadas con sus pagos
-        invoices = invoices_query.options(
-            joinedload(Invoice.payments)
-        ).order_by(Invoice.due_date.desc(), Invoice.created_at.desc()).offset(skip).limit(limit).all()
-        
-        # Calcular totales usando agregaciones directas (evita doble conteo)
-        # Total facturado: suma directa de invoices por student_id
-        total_invoiced_result = db.query(func.sum(Invoice.total_amount)).filter(
-            Invoice.student_id == student_id
-        ).scalar()
-        total_invoiced = Decimal(total_invoiced_result) if total_invoiced_result else Decimal("0.00")
-        
-        # Total pagado: suma directa de payments por student_id (evita joins y doble conteo)
-        total_paid_result = db.query(func.sum(Payment.amount)).filter(
-            Payment.student_id == student_id
-        ).scalar()
-        total_paid = Decimal(total_paid_result) if total_paid_result else Decimal("0.00")
+        summary = AccountService.get_student_account_summary(db, student_id)
+        invoices = AccountService.get_student_invoices(
+            db, student_id, skip=skip, limit=limit + 1, cursor=cursor, include_payments=include_payments
+        )
         
-        total_pending = total_invoiced - total_paid
+        return StudentAccountStatus(
+            **summary.model_dump(),
+            **_invoice_page(invoices, skip, limit, cursor)
+        )
+    
+    @staticmethod
+    def _get_invoices(
+        db: Session,
+        criterion,
+        skip: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> List[InvoiceSchema]:
+        """
+        Página de facturas en el orden estable de los statements. Los pagos se leen con
+        una consulta IN por página (selectinload) o solo como resumen, nunca con un JOIN
+        que multiplique las filas de la página.
+        """
+        AccountService.begin_statement_snapshot(db)
+        query = _invoice_page_query(criterion, skip, limit, cursor)
+        if include_payments:
+            query = query.options(selectinload(Invoice.payments))
+        invoices = db.execute(query).scalars().all()
+        return InvoiceService.page_schemas(db, invoices, include_payments)
+
+
+class AsyncAccountService:
+    """Estados de cuenta sobre AsyncSession (camino de lectura async, ver ASYNC_DB_ENABLED)"""
+    
+    @staticmethod
+    async def begin_statement_snapshot(db: AsyncSession):
+        """Ver AccountService.begin_statement_snapshot"""
+        if not db.in_transaction():
+            await db.connection(execution_options={"isolation_level": STATEMENT_ISOLATION_LEVEL})
+    
+    @staticmethod
+    async def get_school_account_summary(db: AsyncSession, school_id: UUID) -> SchoolAccountSummary:
+        """Ver AccountService.get_school_account_summary"""
+        await AsyncAccountService.begin_statement_snapshot(db)
+        row = (await db.execute(_SCHOOL_SUMMARY, {"school_id": school_id})).first()
+        if row is not None and row.has_balance is None:
+            _log_missing_balance("school", school_id)
+            row = (await db.execute(_SCHOOL_TOTALS, {"school_id": school_id})).first()
+        return _school_summary(school_id, row)
+    
+    @staticmethod
+    async def get_school_invoices(
+        db: AsyncSession,
+        school_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> List[InvoiceSchema]:
+        """Ver AccountService.get_school_invoices"""
+        return await AsyncAccountService._get_invoices(db, Invoice.school_id == school_id, skip, limit, cursor, include_payments)
+    
+    @staticmethod
+    async def get_school_account_status(
+        db: AsyncSession,
+        school_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> SchoolAccountStatus:
+        """Ver AccountService.get_school_account_status"""
+        summary = await AsyncAccountService.get_school_account_summary(db, school_id)
+        invoices = await AsyncAccountService.get_school_invoices(
+            db, school_id, skip=skip, limit=limit + 1, cursor=cursor, include_payments=include_payments
+        )
         
-        # Convertir facturas paginadas a schemas
-        invoice_schemas = [InvoiceSchema.model_validate(invoice) for invoice in invoices]
+        return SchoolAccountStatus(
+            **summary.model_dump(),
+            **_invoice_page(invoices, skip, limit, cursor)
+        )
+    
+    @staticmethod
+    async def get_student_account_summary(db: AsyncSession, student_id: UUID) -> StudentAccountSummary:
+        """Ver AccountService.get_student_account_summary"""
+        await AsyncAccountService.begin_statement_snapshot(db)
+        row = (await db.execute(_STUDENT_SUMMARY, {"student_id": student_id})).first()
+        if row is not None and row.has_balance is None:
+            _log_missing_balance("student", student_id)
+            row = (await db.execute(_STUDENT_TOTALS, {"student_id": student_id})).first()
+        return _student_summary(student_id, row)
+    
+    @staticmethod
+    async def get_student_invoices(
+        db: AsyncSession,
+        student_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> List[InvoiceSchema]:
+        """Ver AccountService.get_student_invoices"""
+        return await AsyncAccountService._get_invoices(db, Invoice.student_id == student_id, skip, limit, cursor, include_payments)
+    
+    @staticmethod
+    async def get_student_account_status(
+        db: AsyncSession,
+        student_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> StudentAccountStatus:
+        """Ver AccountService.get_student_account_status"""
+        summary = await AsyncAccountService.get_student_account_summary(db, student_id)
+        invoices = await AsyncAccountService.get_student_invoices(
+            db, student_id, skip=skip, limit=limit + 1, cursor=cursor, include_payments=include_payments
+        )
         
         return StudentAccountStatus(
-            student_id=student.id,
-            student_name=student.full_name,
-            school_id=student.school_id,
-            school_name=student.school.name,
-            total_invoiced=total_invoiced,
-            total_paid=total_paid,
-            total_pending=total_pending,
-            invoices=invoice_schemas,
-            total_invoices=total_invoices,
-            skip=skip,
-            limit=limit
+            **summary.model_dump(),
+            **_invoice_page(invoices, skip, limit, cursor)
         )
+    
+    @staticmethod
+    async def _get_invoices(
+        db: AsyncSession,
+        criterion,
+        skip: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        include_payments: bool = False
+    ) -> List[InvoiceSchema]:
+        """Ver AccountService._get_invoices"""
+        await AsyncAccountService.begin_statement_snapshot(db)
+        query = _invoice_page_query(criterion, skip, limit, cursor)
+        if include_payments:
+            query = query.options(selectinload(Invoice.payments))
+        result = await db.execute(query)
+        return await AsyncInvoiceService.page_schemas(db, result.scalars().all(), include_payments)
+
+
+def _school_summary_query() -> Select:
+    """
+    Nombre del colegio y su fila de school_balances (has_balance es NULL si falta).
+    Sin filas si el colegio no existe.
+    """
+    return select(
+        School.name.label("school_name"),
+        SchoolBalance.school_id.label("has_balance"),
+        SchoolBalance.total_invoices,
+        SchoolBalance.total_invoiced,
+        SchoolBalance.total_paid,
+        SchoolBalance.active_students.label("total_students")
+    ).select_from(School).outerjoin(SchoolBalance, SchoolBalance.school_id == School.id).where(
+        School.id == bindparam("school_id")
+    )
+
+
+def _student_summary_query() -> Select:
+    """
+    Estudiante, nombre de su colegio y su fila de student_balances (has_balance es NULL si falta).
+    Sin filas si el estudiante no existe.
+    """
+    return select(
+        Student.first_name,
+        Student.last_name,
+        Student.school_id,
+        School.name.label("school_name"),
+        StudentBalance.student_id.label("has_balance"),
+        StudentBalance.total_invoices,
+        StudentBalance.total_invoiced,
+        StudentBalance.total_paid
+    ).select_from(Student).join(School, Student.school_id == School.id).outerjoin(
+        StudentBalance, StudentBalance.student_id == Student.id
+    ).where(Student.id == bindparam("student_id"))
+
+
+def _log_missing_balance(entity: str, entity_id: UUID):
+    logger.warning(
+        f"Sin balance para {entity} {entity_id}; calculando totales por agregación "
+        f"(ejecutar scripts/rebuild_balances.py)"
+    )
+
+
+def _school_totals_query() -> Select:
+    """
+    Nombre del colegio y totales de su statement agregando todo su historial, en una sola consulta:
+        
+        WITH invoice_totals AS (SELECT count(id), sum(total_amount) FROM invoices WHERE school_id = :id),
+             payment_totals AS (SELECT sum(amount) FROM payments WHERE school_id = :id),
+             student_totals AS (SELECT count(id) FROM students WHERE school_id = :id AND is_active)
+        SELECT schools.name, ... FROM schools JOIN invoice_totals ON true JOIN ...
+        WHERE schools.id = :id
+    
+    Cada agregado usa school_id directamente (sin joins entre tablas ni doble conteo).
+    Sin filas si el colegio no existe.
+    """
+    invoice_totals = select(
+        func.count(Invoice.id).label("total_invoices"),
+        func.sum(Invoice.total_amount).label("total_invoiced")
+    ).where(Invoice.school_id == bindparam("school_id")).cte("invoice_totals")
+    payment_totals = select(
+        func.sum(Payment.amount).label("total_paid")
+    ).where(Payment.school_id == bindparam("school_id")).cte("payment_totals")
+    student_totals = select(
+        func.count(Student.id).label("total_students")
+    ).where(Student.school_id == bindparam("school_id"), Student.is_active == True).cte("student_totals")
+    
+    return select(
+        School.name.label("school_name"),
+        invoice_totals.c.total_invoices,
+        invoice_totals.c.total_invoiced,
+        payment_totals.c.total_paid,
+        student_totals.c.total_students
+    ).select_from(School).join(invoice_totals, true()).join(payment_totals, true()).join(
+        student_totals, true()
+    ).where(School.id == bindparam("school_id"))
+
+
+def _student_totals_query() -> Select:
+    """
+    Estudiante, nombre de su colegio y totales de su statement agregando todo su historial
+    (misma forma que _school_totals_query). Sin filas si el estudiante no existe.
+    """
+    invoice_totals = select(
+        func.count(Invoice.id).label("total_invoices"),
+        func.sum(Invoice.total_amount).label("total_invoiced")
+    ).where(Invoice.student_id == bindparam("student_id")).cte("invoice_totals")
+    payment_totals = select(
+        func.sum(Payment.amount).label("total_paid")
+    ).where(Payment.student_id == bindparam("student_id")).cte("payment_totals")
+    
+    return select(
+        Student.first_name,
+        Student.last_name,
+        Student.school_id,
+        School.name.label("school_name"),
+        invoice_totals.c.total_invoices,
+        invoice_totals.c.total_invoiced,
+        payment_totals.c.total_paid
+    ).select_from(Student).join(School, Student.school_id == School.id).join(invoice_totals, true()).join(
+        payment_totals, true()
+    ).where(Student.id == bindparam("student_id"))
+
+
+# Consultas de totales construidas una sola vez con parámetros ligados (school_id /
+# student_id): se compilan una vez y se reutilizan en cada statement
+_SCHOOL_SUMMARY = _school_summary_query()
+_SCHOOL_TOTALS = _school_totals_query()
+_STUDENT_SUMMARY = _student_summary_query()
+_STUDENT_TOTALS = _student_totals_query()
+
+
+def _invoice_page_query(criterion, skip: int, limit: int, cursor: Optional[str] = None) -> Select:
+    """Página de facturas en el orden estable de los statements (vencimiento, creación, id)"""
+    return STATEMENT_KEYSET.paginate(select(Invoice).where(criterion), skip, limit, cursor)
+
+
+def _invoice_page(invoices: List[InvoiceSchema], skip: int, limit: int, cursor: Optional[str]) -> dict:
+    """Facturas y paginación del statement a partir de una página leída con limit + 1"""
+    has_next = len(invoices) > limit
+    return {
+        "invoices": invoices[:limit],
+        "skip": 0 if cursor is not None else skip,
+        "limit": limit,
+        "next_cursor": STATEMENT_KEYSET.cursor_for(invoices[limit - 1]) if has_next else None,
+    }
+
+
+def _amount(value) -> Decimal:
+    return Decimal(value) if value else Decimal("0.00")
+
+
+def _school_summary(school_id: UUID, row) -> SchoolAccountSummary:
+    """Arma el resumen de un colegio a partir de la fila de _school_summary_query."""
+    if row is None:
+        raise ValueError(f"School with id {school_id} does not exist")
+    total_invoiced = _amount(row.total_invoiced)
+    total_paid = _amount(row.total_paid)
+    return SchoolAccountSummary(
+        school_id=school_id,
+        school_name=row.school_name,
+        total_students=row.total_students,
+        total_invoiced=total_invoiced,
+        total_paid=total_paid,
+        total_pending=total_invoiced - total_paid,
+        total_invoices=row.total_invoices
+    )
+
 
+def _student_summary(student_id: UUID, row) -> StudentAccountSummary:
+    """Arma el resumen de un estudiante a partir de la fila de _student_summary_query."""
+    if row is None:
+        raise ValueError(f"Student with id {student_id} does not exist")
+    total_invoiced = _amount(row.total_invoiced)
+    total_paid = _amount(row.total_paid)
+    return StudentAccountSummary(
+        student_id=student_id,
+        student_name=f"{row.first_name} {row.last_name}",
+        school_id=row.school_id,
+        school_name=row.school_name,
+        total_invoiced=total_invoiced,
+        total_paid=total_paid,
+        total_pending=total_invoiced - total_paid,
+        total_invoices=row.total_invoices
+    )
@@ -0,0 +1,136 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from typing import List, Optional, Tuple
+from uuid import UUID
+from app.models.school import School
+from app.models.student import Student
+from app.models.invoice import Invoice
+from app.models.payment import Payment
+from app.models.balance import SchoolBalance, StudentBalance
+from app.core.cache import InvalidationBatch, invalidate_school_statement, invalidate_student_statement
+
+
+class BalanceService:
+    """Servicio para recalcular los balances de colegios y estudiantes (ver app.models.balance)"""
+    
+    @staticmethod
+    def rebuild_balances(db: Session, school_id: Optional[UUID] = None) -> Tuple[List[UUID], List[UUID]]:
+        """
+        Recalcula en bloque los balances a partir de invoices, payments y students
+        (todos, o solo los de un colegio y sus estudiantes), con un INSERT ... SELECT
+        por tabla que crea las filas faltantes y corrige las que difieren.
+        
+        Bloquea las escrituras sobre students, invoices y payments hasta el commit para
+        que los triggers no apliquen cambios sobre un recálculo en curso.
+        Invalida el cache de los statements cuyos balances cambiaron.
+        
+        Returns:
+            Tupla (IDs de colegios corregidos, IDs de estudiantes corregidos)
+        """
+        db.execute(text("LOCK TABLE students, invoices, payments IN SHARE MODE"))
+        
+        school_ids = db.execute(BalanceService._rebuild_school_balances(school_id)).scalars().all()
+        student_ids = db.execute(BalanceService._rebuild_student_balances(school_id)).scalars().all()
+        db.commit()
+        
+        batch = InvalidationBatch()
+        with batch:
+            for changed_id in school_ids:
+                invalidate_school_statement(changed_id)
+            for changed_id in student_ids:
+                invalidate_student_statement(changed_id)
+        batch.flush()
+        
+        return list(school_ids), list(student_ids)
+    
+    @staticmethod
+    def _rebuild_school_balances(school_id: Optional[UUID]):
+        """INSERT ... SELECT ... ON CONFLICT DO UPDATE de school_balances; retorna los IDs modificados"""
+        invoice_totals = select(
+            Invoice.school_id,
+            func.sum(Invoice.total_amount).label("total_invoiced"),
+            func.count(Invoice.id).label("total_invoices")
+        ).group_by(Invoice.school_id)
+        payment_totals = select(
+            Payment.school_id,
+            func.sum(Payment.amount).label("total_paid")
+        ).group_by(Payment.school_id)
+        student_totals = select(
+            Student.school_id,
+            func.count(Student.id).label("active_students")
+        ).where(Student.is_active == True).group_by(Student.school_id)
+        schools = select(School.id)
+        
+        if school_id is not None:
+            invoice_totals = invoice_totals.where(Invoice.school_id == school_id)
+            payment_totals = payment_totals.where(Payment.school_id == school_id)
+            student_totals = student_totals.where(Student.school_id == school_id)
+            schools = schools.where(School.id == school_id)
+        
+        invoice_totals = invoice_totals.subquery()
+        payment_totals = payment_totals.subquery()
+        student_totals = student_totals.subquery()
+        source = schools.add_columns(
+            func.coalesce(invoice_totals.c.total_invoiced, 0),
+            func.coalesce(payment_totals.c.total_paid, 0),
+            func.coalesce(invoice_totals.c.total_invoices, 0),
+            func.coalesce(student_totals.c.active_students, 0)
+        ).outerjoin(
+            invoice_totals, invoice_totals.c.school_id == School.id
+        ).outerjoin(
+            payment_totals, payment_totals.c.school_id == School.id
+        ).outerjoin(
+            student_totals, student_totals.c.school_id == School.id
+        )
+        
+        columns = ["total_invoiced", "total_paid", "total_invoices", "active_students"]
+        return BalanceService._upsert(SchoolBalance, SchoolBalance.school_id, columns, source)
+    
+    @staticmethod
+    def _rebuild_student_balances(school_id: Optional[UUID]):
+        """INSERT ... SELECT ... ON CONFLICT DO UPDATE de student_balances; retorna los IDs modificados"""
+        invoice_totals = select(
+            Invoice.student_id,
+            func.sum(Invoice.total_amount).label("total_invoiced"),
+            func.count(Invoice.id).label("total_invoices")
+        ).group_by(Invoice.student_id)
+        payment_totals = select(
+            Payment.student_id,
+            func.sum(Payment.amount).label("total_paid")
+        ).group_by(Payment.student_id)
+        students = select(Student.id)
+        
+        if school_id is not None:
+            students = students.where(Student.school_id == school_id)
+            # Por estudiante, no por school_id: un pago conserva el colegio con que se registró
+            invoice_totals = invoice_totals.where(Invoice.student_id.in_(students))
+            payment_totals = payment_totals.where(Payment.student_id.in_(students))
+        
+        invoice_totals = invoice_totals.subquery()
+        payment_totals = payment_totals.subquery()
+        source = students.add_columns(
+            func.coalesce(invoice_totals.c.total_invoiced, 0),
+            func.coalesce(payment_totals.c.total_paid, 0),
+            func.coalesce(invoice_totals.c.total_invoices, 0)
+        ).outerjoin(
+            invoice_totals, invoice_totals.c.student_id == Student.id
+        ).outerjoin(
+            payment_totals, payment_totals.c.student_id == Student.id
+        )
+        
+        columns = ["total_invoiced", "total_paid", "total_invoices"]
+        return BalanceService._upsert(StudentBalance, StudentBalance.student_id, columns, source)
+    
+    @staticmethod
+    def _upsert(model, key, columns: List[str], source):
+        """Inserta las filas de source y actualiza solo las que difieren (RETURNING de las afectadas)"""
+        statement = insert(model).from_select([key.key] + columns, source)
+        table = model.__table__
+        return statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: statement.excluded[column] for column in columns},
+            where=tuple_(*(table.c[column] for column in columns)).is_distinct_from(
+                tuple_(*(statement.excluded[column] for column in columns))
+            )
+        ).returning(key)
@@ -0,0 +1,197 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Numeric, String, and_, bindparam, cast, exists, func, literal, select, true
+from sqlalchemy.dialects.postgresql import insert
+from uuid import UUID
+import time
+from app.models.student import Student
+from app.models.invoice import Invoice, InvoiceStatus
+from app.schemas.billing import BillingRunCreate, BillingRunResult
+from app.core.cache import InvalidationBatch, invalidate_school_statement, invalidate_student_statement
+
+# Dígitos de la secuencia de los números de factura de una corrida ({prefijo}-{período}-000001)
+SEQUENCE_DIGITS = 6
+
+# Estudiantes activos del colegio
+_ACTIVE_STUDENTS = select(func.count()).select_from(Student).where(
+    Student.school_id == bindparam("school_id"), Student.is_active == true()
+)
+
+
+def _last_sequence(number_prefix: str):
+    """
+    Mayor secuencia ya usada con el prefijo "{prefijo}-{período}-" en el colegio, entre
+    todas sus facturas (corridas anteriores y facturas cargadas a mano con ese formato).
+    """
+    pattern = number_prefix.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    suffix = func.substring(Invoice.invoice_number, len(number_prefix) + 1)
+    return select(func.coalesce(func.max(cast(suffix, Numeric)), 0)).where(
+        Invoice.school_id == bindparam("school_id"),
+        Invoice.invoice_number.like(f"{pattern}%", escape="!"),
+        suffix.regexp_match(r"^\d+$")
+    )
+
+
+class BillingService:
+    """Servicio para las corridas de facturación recurrente"""
+    
+    @staticmethod
+    def run_billing(db: Session, school_id: UUID, run: BillingRunCreate) -> BillingRunResult:
+        """
+        Crea la factura del período para cada estudiante activo del colegio con un solo
+        INSERT ... SELECT sobre students (los balances se suman por sentencia, ver
+        app.models.balance).
+        
+        Es idempotente por período: los estudiantes que ya tienen factura del período
+        se saltean (y el índice único uq_invoice_school_period_student lo garantiza ante
+        concurrencia), así que repetir la corrida solo factura a los que falten. Las
+        corridas del mismo colegio y período se serializan con un advisory lock, y los
+        números continúan la mayor secuencia ya usada en el colegio con el mismo
+        {prefijo}-{período}- (incluidas facturas cargadas a mano), en orden de alta de
+        los estudiantes. Solo los conflictos con el índice del período se saltean
+        (skipped): si un número igual se carga en paralelo, el índice único del número
+        hace fallar la corrida en vez de dejar a ese estudiante sin factura.
+        
+        Returns:
+            Resultado con las facturas creadas y la duración de la corrida
+        
+        Raises:
+            IntegrityError: Si un número asignado ya existe en el colegio
+        """
+        started = time.perf_counter()
+        params = {"school_id": school_id}
+        db.execute(_billing_lock(school_id, run))
+        
+        active_students = db.scalar(_ACTIVE_STUDENTS, params)
+        last_sequence = int(db.scalar(_last_sequence(_number_prefix(run)), params))
+        already_billed = db.scalar(_already_billed(school_id, run))
+        created = db.execute(_billing_insert(school_id, run, last_sequence)).all()
+        db.commit()
+        
+        # Un solo round trip también fuera de un request (scripts/run_billing.py)
+        batch = InvalidationBatch()
+        with batch:
+            _invalidate_billed(school_id, created)
+        batch.flush()
+        return _billing_result(school_id, run, active_students, already_billed, created, started)
+
+
+class AsyncBillingService:
+    """Corridas de facturación sobre AsyncSession (camino async, ver ASYNC_DB_ENABLED)"""
+    
+    @staticmethod
+    async def run_billing(db: AsyncSession, school_id: UUID, run: BillingRunCreate) -> BillingRunResult:
+        """Ver BillingService.run_billing"""
+        started = time.perf_counter()
+        params = {"school_id": school_id}
+        await db.execute(_billing_lock(school_id, run))
+        
+        active_students = await db.scalar(_ACTIVE_STUDENTS, params)
+        last_sequence = int(await db.scalar(_last_sequence(_number_prefix(run)), params))
+        already_billed = await db.scalar(_already_billed(school_id, run))
+        created = (await db.execute(_billing_insert(school_id, run, last_sequence))).all()
+        await db.commit()
+        
+        # Se acumulan en el batch del request (sin bloquear el event loop)
+        _invalidate_billed(school_id, created)
+        return _billing_result(school_id, run, active_students, already_billed, created, started)
+
+
+def _number_prefix(run: BillingRunCreate) -> str:
+    """Prefijo de los números de factura de la corrida: {prefijo}-{período}-"""
+    return f"{run.invoice_number_prefix}-{run.period}-"
+
+
+def _billing_lock(school_id: UUID, run: BillingRunCreate):
+    """Advisory lock de la transacción que serializa las corridas del mismo colegio y período"""
+    return select(func.pg_advisory_xact_lock(func.hashtext(f"billing:{school_id}:{run.period}")))
+
+
+def _billed(school_id: UUID, run: BillingRunCreate):
+    """EXISTS de la factura del período del estudiante (correlacionado con Student)"""
+    return exists().where(
+        Invoice.school_id == school_id,
+        Invoice.billing_period == run.period,
+        Invoice.student_id == Student.id
+    )
+
+
+def _already_billed(school_id: UUID, run: BillingRunCreate):
+    """Estudiantes activos del colegio que ya tienen factura del período"""
+    return select(func.count()).select_from(Student).where(
+        Student.school_id == school_id, Student.is_active == true(), _billed(school_id, run)
+    )
+
+
+def _billing_insert(school_id: UUID, run: BillingRunCreate, last_sequence: int):
+    """
+    INSERT ... SELECT de las facturas del período de los estudiantes activos sin factura,
+    numeradas a partir de last_sequence en orden de alta de los estudiantes.
+    """
+    sequence = last_sequence + func.row_number().over(order_by=(Student.created_at, Student.id))
+    # lpad trunca: las secuencias de más de SEQUENCE_DIGITS dígitos se escriben completas
+    sequence_text = cast(sequence, String)
+    invoice_number = func.concat(
+        _number_prefix(run),
+        func.lpad(sequence_text, func.greatest(SEQUENCE_DIGITS, func.length(sequence_text)), "0")
+    )
+    students = select(
+        func.gen_random_uuid(),
+        invoice_number,
+        Student.school_id,
+        Student.id,
+        literal(run.total_amount, Invoice.total_amount.type),
+        literal(run.invoice_description, Invoice.description.type),
+        literal(run.issue_date, Invoice.issue_date.type),
+        literal(run.due_date, Invoice.due_date.type),
+        cast(InvoiceStatus.PENDING, Invoice.__table__.c.status.type),
+        literal(run.period, Invoice.billing_period.type)
+    ).where(and_(Student.school_id == school_id, Student.is_active == true(), ~_billed(school_id, run)))
+    
+    return (
+        insert(Invoice)
+        .from_select(
+            [
+                Invoice.id, Invoice.invoice_number, Invoice.school_id, Invoice.student_id,
+                Invoice.total_amount, Invoice.description, Invoice.issue_date, Invoice.due_date,
+                Invoice.status, Invoice.billing_period
+            ],
+            students
+        )
+        .on_conflict_do_nothing(
+            index_elements=[Invoice.school_id, Invoice.billing_period, Invoice.student_id],
+            index_where=Invoice.billing_period.isnot(None)
+        )
+        .returning(Invoice.student_id, Invoice.invoice_number)
+    )
+
+
+def _invalidate_billed(school_id: UUID, created):
+    """Invalida el statement del colegio y de cada estudiante facturado"""
+    if created:
+        invalidate_school_statement(school_id)
+        for row in created:
+            invalidate_student_statement(row.student_id)
+
+
+def _billing_result(
+    school_id: UUID,
+    run: BillingRunCreate,
+    active_students: int,
+    already_billed: int,
+    created,
+    started: float
+) -> BillingRunResult:
+    """Resultado de la corrida a partir de las filas creadas (RETURNING)"""
+    numbers = sorted(row.invoice_number for row in created)
+    return BillingRunResult(
+        school_id=school_id,
+        period=run.period,
+        active_students=active_students,
+        created=len(created),
+        already_billed=already_billed,
+        skipped=active_students - already_billed - len(created),
+        first_invoice_number=numbers[0] if numbers else None,
+        last_invoice_number=numbers[-1] if numbers else None,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+    )
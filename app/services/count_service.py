@@ -0,0 +1,83 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import Select
+from typing import Any, Dict, Optional
+import json
+from app.core.cache import get_or_compute_count
+from app.core import async_cache
+from app.core.pagination import TotalMode
+
+
+class CountService:
+    """Servicio para calcular el total de los listados paginados según total_mode"""
+    
+    @staticmethod
+    def count(
+        db: Session,
+        listing: str,
+        filters: Dict[str, Any],
+        statement: Select,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """
+        Total de filas de un listado.
+        
+        - exact: COUNT(*) con los filtros, cacheado COUNT_CACHE_TTL segundos por firma de filtros.
+        - estimate: filas estimadas por el planner (EXPLAIN, a partir de pg_class.reltuples
+          y las estadísticas de las columnas filtradas), sin recorrer la tabla.
+        - none: None (el listado deriva has_next de una fila extra).
+        
+        Args:
+            listing: Nombre del listado (parte de la clave de cache)
+            filters: Filtros aplicados (firma de la clave de cache)
+            statement: SELECT de las filas del listado con los filtros aplicados
+        """
+        if total_mode == TotalMode.NONE:
+            return None
+        if total_mode == TotalMode.ESTIMATE:
+            return _planned_rows(db.execute(_explain_query(statement)).scalar())
+        return get_or_compute_count(listing, filters, lambda: db.scalar(_count_query(statement)))
+
+
+class AsyncCountService:
+    """Totales de listados sobre AsyncSession (camino de lectura async, ver ASYNC_DB_ENABLED)"""
+    
+    @staticmethod
+    async def count(
+        db: AsyncSession,
+        listing: str,
+        filters: Dict[str, Any],
+        statement: Select,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Ver CountService.count"""
+        if total_mode == TotalMode.NONE:
+            return None
+        if total_mode == TotalMode.ESTIMATE:
+            return _planned_rows((await db.execute(_explain_query(statement))).scalar())
+        return await async_cache.get_or_compute_count(listing, filters, lambda: db.scalar(_count_query(statement)))
+
+
+def _count_query(statement: Select) -> Select:
+    """SELECT count(*) sobre las filas del listado (sin ORDER BY)"""
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+
+def _explain_query(statement: Select):
+    """
+    EXPLAIN (FORMAT JSON) del listado. Los valores de los filtros (UUIDs, booleanos,
+    enums) se renderizan como literales porque EXPLAIN no acepta parámetros ligados.
+    """
+    compiled = statement.order_by(None).compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    return text(f"EXPLAIN (FORMAT JSON) {compiled}")
+
+
+def _planned_rows(plan) -> int:
+    """Filas estimadas del nodo raíz de un plan (psycopg2 ya decodifica el JSON; asyncpg no)"""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -1,13 +1,51 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import bindparam, case, cast, column, func, insert, inspect, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import Select
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
 from decimal import Decimal
 from uuid import UUID
 from app.models.invoice import Invoice, InvoiceStatus
 from app.models.payment import Payment
 from app.models.student import Student
-from app.schemas.invoice import InvoiceCreate, InvoiceUpdate
-from app.schemas.payment import PaymentCreate
+from app.schemas.invoice import InvoiceCreate, InvoiceUpdate, InvoiceSort, InvoiceBulkError, Invoice as InvoiceSchema
+from app.schemas.payment import PaymentCreate, PaymentImportRow, PaymentImportError, PaymentSummary
+from app.services.student_service import StudentService, AsyncStudentService
+from app.core.cache import (
+    StatementWrite, invalidate_statements, invalidate_student_statement, invalidate_school_statement,
+    bump_entity_version
+)
+from app.core.async_cache import StatementWrite as AsyncStatementWrite
+from app.core.config import settings
+from app.core.pagination import Keyset, TotalMode
+from app.services.count_service import CountService, AsyncCountService
+
+# Órdenes del listado de facturas y de los pagos de una factura (ver app.core.pagination);
+# cada uno tiene índices por filtro en el modelo Invoice (migraciones 008 y 009)
+INVOICE_KEYSETS = {
+    InvoiceSort.CREATED_AT: Keyset(Invoice.created_at, Invoice.id),
+    InvoiceSort.DUE_DATE: Keyset(Invoice.due_date, Invoice.created_at, Invoice.id),
+}
+PAYMENT_KEYSET = Keyset(Payment.payment_date, Payment.id)
+
+# Consultas frecuentes construidas una sola vez con parámetros ligados: SQLAlchemy
+# memoiza su cache key y reutiliza la compilación en cada llamada, en lugar de
+# reconstruir y recorrer la consulta (ver scripts/benchmark_statement_cache.py)
+_INVOICE_WITH_PAYMENTS = select(Invoice).options(selectinload(Invoice.payments)).where(
+    Invoice.id == bindparam("invoice_id")
+)
+_INVOICE_NUMBER_TAKEN = select(Invoice.id).where(
+    Invoice.school_id == bindparam("school_id"),
+    Invoice.invoice_number == bindparam("invoice_number")
+).limit(1)
+_OTHER_INVOICE_NUMBER_TAKEN = _INVOICE_NUMBER_TAKEN.where(Invoice.id != bindparam("invoice_id"))
+
+# INSERT multi-fila de la carga masiva: un número ya tomado por otra escritura concurrente
+# no aborta el chunk, la fila simplemente no vuelve en RETURNING
+_BULK_INSERT = pg_insert(Invoice).on_conflict_do_nothing(
+    constraint="uq_invoice_school_number"
+).returning(Invoice.school_id, Invoice.invoice_number)
 
 
 class InvoiceService:
@@ -16,9 +54,7 @@ class InvoiceService:
     @staticmethod
     def get_invoice(db: Session, invoice_id: UUID) -> Optional[Invoice]:
         """Obtiene una factura por ID con sus pagos cargados"""
-        return db.query(Invoice).options(
-            joinedload(Invoice.payments)
-        ).filter(Invoice.id == invoice_id).first()
+        return db.execute(_INVOICE_WITH_PAYMENTS, {"invoice_id": invoice_id}).scalar_one_or_none()
     
     @staticmethod
     def get_invoices(
@@ -27,51 +63,53 @@ class InvoiceService:
         limit: int = 10,
         student_id: Optional[UUID] = None,
         school_id: Optional[UUID] = None,
-        status: Optional[InvoiceStatus] = None
-    ) -> List[Invoice]:
-        """Obtiene una lista de facturas con paginación y filtros, ordenadas por fecha de creación descendente.
-        Incluye los pagos asociados a cada factura."""
-        query = db.query(Invoice).options(
-            joinedload(Invoice.payments)
-        )
-        
-        if student_id is not None:
-            query = query.filter(Invoice.student_id == student_id)
-        
-        if school_id is not None:
-            query = query.join(Student).filter(Student.school_id == school_id)
-        
-        if status is not None:
-            query = query.filter(Invoice.status == status)
+        status: Optional[InvoiceStatus] = None,
+        cursor: Optional[str] = None,
+        include_payments: bool = False,
+        sort: InvoiceSort = InvoiceSort.CREATED_AT
+    ) -> List[InvoiceSchema]:
+        """Obtiene una lista de facturas con paginación y filtros, ordenadas según sort (por
+        defecto fecha de creación descendente). Cada factura incluye el resumen de sus pagos,
+        y la lista completa solo con include_payments (ver InvoiceService.page_schemas).
+        Con cursor la página continúa después del cursor (se ignora skip)."""
+        query = _invoice_list_query(student_id, school_id, status)
+        if include_payments:
+            query = query.options(selectinload(Invoice.payments))
         
-        return query.order_by(Invoice.created_at.desc()).offset(skip).limit(limit).all()
+        invoices = db.execute(INVOICE_KEYSETS[sort].paginate(query, skip, limit, cursor)).scalars().all()
+        return InvoiceService.page_schemas(db, invoices, include_payments)
+    
+    @staticmethod
+    def page_schemas(db: Session, invoices: Sequence[Invoice], include_payments: bool) -> List[InvoiceSchema]:
+        """
+        Schemas de una página de facturas. Con include_payments los pagos ya vienen
+        cargados con selectinload (una consulta IN por página) y el resumen se calcula
+        de ellos; si no, el resumen sale de una consulta agregada por página y payments
+        es null. Nunca se cargan pagos por factura.
+        """
+        if include_payments or not invoices:
+            return invoice_page_schemas(invoices)
+        summaries = db.execute(payment_summaries_query([invoice.id for invoice in invoices])).all()
+        return invoice_page_schemas(invoices, summaries)
     
     @staticmethod
     def count_invoices(
         db: Session,
         student_id: Optional[UUID] = None,
         school_id: Optional[UUID] = None,
-        status: Optional[InvoiceStatus] = None
-    ) -> int:
-        """Cuenta el total de facturas"""
-        query = db.query(Invoice)
-        
-        if student_id is not None:
-            query = query.filter(Invoice.student_id == student_id)
-        
-        if school_id is not None:
-            query = query.join(Student).filter(Student.school_id == school_id)
-        
-        if status is not None:
-            query = query.filter(Invoice.status == status)
-        
-        return query.count()
+        status: Optional[InvoiceStatus] = None,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de facturas (ver CountService.count)"""
+        query = _invoice_list_query(student_id, school_id, status)
+        filters = {"student_id": student_id, "school_id": school_id, "status": status}
+        return CountService.count(db, "invoices", filters, query, total_mode)
     
     @staticmethod
     def create_invoice(db: Session, invoice: InvoiceCreate) -> Invoice:
-        """Crea una nueva factura"""
+        """Crea una nueva factura y suma su monto a los totales cacheados"""
         # Validar que el estudiante existe
-        student = db.query(Student).filter(Student.id == invoice.student_id).first()
+        student = StudentService.get_student_snapshot(db, invoice.student_id)
         if not student:
             raise ValueError(f"Student with id {invoice.student_id} does not exist")
         
@@ -80,27 +118,82 @@ class InvoiceService:
             raise ValueError(f"School ID {invoice.school_id} does not match student's school ID {student.school_id}")
         
         # Validar que el número de factura sea único por colegio
-        existing = db.query(Invoice).filter(
-            Invoice.school_id == invoice.school_id,
-            Invoice.invoice_number == invoice.invoice_number
-        ).first()
-        if existing:
+        existing = db.scalar(
+            _INVOICE_NUMBER_TAKEN, {"school_id": invoice.school_id, "invoice_number": invoice.invoice_number}
+        )
+        if existing is not None:
             raise ValueError(f"Invoice number {invoice.invoice_number} already exists for this school")
         
-        db_invoice = Invoice(**invoice.model_dump())
-        db.add(db_invoice)
-        db.commit()
-        db.refresh(db_invoice)
+        with StatementWrite(invoice.student_id, invoice.school_id) as write:
+            db_invoice = Invoice(**invoice.model_dump())
+            db.add(db_invoice)
+            db.commit()
+            db.refresh(db_invoice)
+            write.add(total_invoiced=db_invoice.total_amount, total_invoices=1)
         
         return db_invoice
     
+    @staticmethod
+    def create_invoices_bulk(
+        db: Session,
+        invoices: Sequence[Tuple[int, InvoiceCreate]]
+    ) -> Tuple[int, List[InvoiceBulkError]]:
+        """
+        Crea facturas en bloque; cada fila se valida igual que en create_invoice, pero
+        por conjuntos y no fila por fila:
+        
+        - Estudiantes: una consulta IN por chunk trae el colegio de cada estudiante.
+        - Números de factura: duplicados dentro del lote en memoria, y contra la base
+          una consulta (school_id, invoice_number) IN (...) por chunk.
+        
+        Las filas válidas se insertan en chunks de BULK_INVOICE_CHUNK_SIZE con un INSERT
+        multi-fila y un commit por chunk (los triggers mantienen los saldos). Al final
+        se invalida una sola vez el statement de cada estudiante y colegio afectado.
+        
+        Args:
+            invoices: Filas a crear con su posición en el request
+        
+        Returns:
+            Tupla (facturas creadas, errores de las filas rechazadas)
+        """
+        chunk_size = settings.BULK_INVOICE_CHUNK_SIZE
+        
+        student_schools = {}
+        for chunk in _chunks(list({invoice.student_id for _, invoice in invoices}), chunk_size):
+            student_schools.update(db.execute(_bulk_students_query(chunk)).all())
+        
+        taken = set()
+        numbers = list({(invoice.school_id, invoice.invoice_number) for _, invoice in invoices})
+        for chunk in _chunks(numbers, chunk_size):
+            taken.update(tuple(row) for row in db.execute(_bulk_numbers_query(chunk)))
+        
+        valid, errors = _split_bulk_rows(invoices, student_schools, taken)
+        
+        created = 0
+        students = set()
+        schools = set()
+        for chunk in _chunks(valid, chunk_size):
+            inserted = set(
+                tuple(row) for row in db.execute(_BULK_INSERT, [invoice.model_dump() for _, invoice in chunk])
+            )
+            db.commit()
+            created += _collect_bulk_chunk(chunk, inserted, errors, students, schools)
+        
+        _invalidate_bulk(students, schools)
+        errors.sort(key=lambda error: error.index)
+        return created, errors
+    
     @staticmethod
     def update_invoice(
         db: Session,
         invoice_id: UUID,
         invoice_update: InvoiceUpdate
     ) -> Optional[Invoice]:
-        """Actualiza una factura existente"""
+        """
+        Actualiza una factura existente.
+        Un cambio de monto se aplica como delta a los totales cacheados; si la factura
+        cambia de estudiante o colegio, se invalidan los statements de ambos.
+        """
         db_invoice = InvoiceService.get_invoice(db, invoice_id)
         if not db_invoice:
             return None
@@ -108,17 +201,16 @@ class InvoiceService:
         # Validar número de factura único por colegio si se está actualizando
         if invoice_update.invoice_number is not None:
             school_id = invoice_update.school_id if invoice_update.school_id else db_invoice.school_id
-            existing = db.query(Invoice).filter(
-                Invoice.school_id == school_id,
-                Invoice.invoice_number == invoice_update.invoice_number,
-                Invoice.id != invoice_id
-            ).first()
-            if existing:
+            existing = db.scalar(
+                _OTHER_INVOICE_NUMBER_TAKEN,
+                {"school_id": school_id, "invoice_number": invoice_update.invoice_number, "invoice_id": invoice_id}
+            )
+            if existing is not None:
                 raise ValueError(f"Invoice number {invoice_update.invoice_number} already exists for this school")
         
         # Validar estudiante y school_id si se está actualizando
         if invoice_update.student_id is not None:
-            student = db.query(Student).filter(Student.id == invoice_update.student_id).first()
+            student = StudentService.get_student_snapshot(db, invoice_update.student_id)
             if not student:
                 raise ValueError(f"Student with id {invoice_update.student_id} does not exist")
             
@@ -132,42 +224,85 @@ class InvoiceService:
         # Verificar si se actualiza total_amount (esto puede cambiar el estado)
         total_amount_changed = 'total_amount' in update_data
         
-        for field, value in update_data.items():
-            setattr(db_invoice, field, value)
+        old_student_id, old_school_id = db_invoice.student_id, db_invoice.school_id
+        old_total_amount = db_invoice.total_amount
         
-        db.commit()
-        db.refresh(db_invoice)
+        with StatementWrite(old_student_id, old_school_id) as write:
+            for field, value in update_data.items():
+                setattr(db_invoice, field, value)
+            
+            # Solo recalcular el estado si cambió total_amount (los pagos no cambian al
+            # actualizar otros campos); se deriva en el mismo UPDATE a partir de paid_amount
+            if total_amount_changed:
+                db_invoice.status = InvoiceService._status_expression(
+                    Invoice.paid_amount, update_data['total_amount']
+                )
+            
+            db.commit()
+            db.refresh(db_invoice)
+            
+            moved = (db_invoice.student_id, db_invoice.school_id) != (old_student_id, old_school_id)
+            if moved:
+                write.invalidate()
+            else:
+                write.add(total_invoiced=db_invoice.total_amount - old_total_amount)
         
-        # Solo actualizar el estado si cambió total_amount
-        # (los pagos no cambian al actualizar otros campos de la factura)
-        if total_amount_changed:
-            InvoiceService._update_invoice_status(db, db_invoice)
+        if moved:
+            invalidate_statements(db_invoice.student_id, db_invoice.school_id)
+        bump_entity_version("invoice", invoice_id)
         
         return db_invoice
     
     @staticmethod
     def delete_invoice(db: Session, invoice_id: UUID) -> bool:
-        """Elimina una factura"""
+        """Elimina una factura (y sus pagos) y descuenta sus montos de los totales cacheados"""
         db_invoice = InvoiceService.get_invoice(db, invoice_id)
         if not db_invoice:
             return False
         
-        db.delete(db_invoice)
-        db.commit()
+        # Leer los montos antes del commit (después la instancia queda eliminada)
+        total_invoiced = db_invoice.total_amount
+        total_paid = db_invoice.paid_amount
+        with StatementWrite(db_invoice.student_id, db_invoice.school_id) as write:
+            db.delete(db_invoice)
+            db.commit()
+            write.add(total_invoiced=-total_invoiced, total_paid=-total_paid, total_invoices=-1)
+        bump_entity_version("invoice", invoice_id)
         return True
     
     @staticmethod
-    def create_payment(db: Session, invoice_id: UUID, payment: PaymentCreate, invoice: Invoice) -> Payment:
+    def create_payment(db: Session, invoice_id: UUID, payment: PaymentCreate) -> Optional[Payment]:
         """
         Crea un nuevo pago para una factura.
         
         Los campos invoice_id, school_id y student_id se obtienen automáticamente de la factura.
+        Un único UPDATE condicional suma el monto a invoices.paid_amount solo si no excede
+        el total de la factura y deriva el estado en la misma sentencia; después se inserta
+        el pago y se hace un solo commit (sin recorrer los pagos anteriores).
+        El monto se suma a los totales cacheados del estudiante y del colegio.
+        
+        Returns:
+            El pago creado, o None si la factura no existe
+        
+        Raises:
+            ValueError: Si el monto del pago excede el monto pendiente
         """
-        # Validar que el monto del pago no exceda el monto pendiente
-        total_paid = InvoiceService._get_total_paid(db, invoice_id)
-        pending = invoice.total_amount - total_paid
+        paid_amount = Invoice.paid_amount + payment.amount
+        invoice = db.execute(
+            update(Invoice)
+            .where(Invoice.id == invoice_id, paid_amount <= Invoice.total_amount)
+            .values(paid_amount=paid_amount, status=InvoiceService._status_expression(paid_amount, Invoice.total_amount))
+            .returning(Invoice.school_id, Invoice.student_id)
+            .execution_options(synchronize_session=False)
+        ).first()
         
-        if payment.amount > pending:
+        if invoice is None:
+            # La factura no existe o el pago excede el pendiente (se distingue solo en este caso)
+            db.rollback()
+            existing = db.get(Invoice, invoice_id)
+            if not existing:
+                return None
+            pending = existing.total_amount - existing.paid_amount
             raise ValueError(
                 f"Payment amount ({payment.amount}) exceeds pending amount ({pending})"
             )
@@ -178,58 +313,642 @@ class InvoiceService:
         payment_data['school_id'] = invoice.school_id
         payment_data['student_id'] = invoice.student_id
         
-        db_payment = Payment(**payment_data)
-        db.add(db_payment)
-        db.commit()
-        db.refresh(db_payment)
-        
-        # Actualizar estado de la factura
-        InvoiceService._update_invoice_status(db, invoice)
+        with StatementWrite(invoice.student_id, invoice.school_id) as write:
+            db_payment = Payment(**payment_data)
+            db.add(db_payment)
+            db.commit()
+            db.refresh(db_payment)
+            write.add(total_paid=db_payment.amount)
+        bump_entity_version("invoice", invoice_id)
         
         return db_payment
     
+    @staticmethod
+    def import_payments(
+        db: Session,
+        school_id: UUID,
+        rows: Sequence[Tuple[int, PaymentImportRow]]
+    ) -> Tuple[int, Decimal, List[PaymentImportError]]:
+        """
+        Aplica un chunk de pagos de un archivo de conciliación bancaria en una transacción.
+        
+        Cada fila se concilia con la factura del colegio cuyo número es invoice_number (o
+        payment_reference si no viene). Las facturas del chunk se leen y bloquean con
+        SELECT ... FOR UPDATE en una sola consulta, así los pagos concurrentes por
+        create_payment esperan y el pendiente calculado no cambia. No se aplican las filas
+        sin factura, las que exceden el pendiente (contando las filas anteriores del
+        archivo) ni las que repiten una referencia bancaria ya registrada en el colegio,
+        así que reimportar un archivo no duplica pagos.
+        
+        Los pagos se insertan con un INSERT multi-fila y paid_amount y el estado de todas
+        las facturas se actualizan con un solo UPDATE ... FROM (VALUES ...); un commit por
+        chunk. Se invalidan los statements de cada estudiante y del colegio.
+        
+        Args:
+            rows: Filas del chunk con su posición en el archivo
+        
+        Returns:
+            Tupla (pagos registrados, suma de los pagos, filas no aplicadas)
+        """
+        invoices = {
+            invoice.invoice_number: invoice
+            for invoice in db.execute(_import_invoices_query(school_id, rows))
+        }
+        references = {row.bank_reference for _, row in rows if row.bank_reference}
+        imported = set()
+        if references:
+            imported.update(db.scalars(_imported_references_query(school_id, references)))
+        
+        payments, applied, errors = _match_payment_rows(school_id, rows, invoices, imported)
+        if not payments:
+            db.rollback()
+            return 0, Decimal("0.00"), errors
+        
+        db.execute(insert(Payment), payments)
+        db.execute(_apply_paid_amounts(applied))
+        db.commit()
+        
+        _invalidate_imported(school_id, payments, applied)
+        return len(payments), sum(applied.values(), Decimal("0.00")), errors
+    
     @staticmethod
     def get_payments(
         db: Session,
         invoice_id: UUID,
         skip: int = 0,
-        limit: int = 10
+        limit: int = 10,
+        cursor: Optional[str] = None
     ) -> List[Payment]:
-        """Obtiene una lista de pagos de una factura con paginación, ordenados por fecha de pago descendente"""
-        # Validar que la factura existe
-        invoice = InvoiceService.get_invoice(db, invoice_id)
-        if not invoice:
+        """
+        Obtiene una lista de pagos de una factura con paginación, ordenados por fecha de pago descendente.
+        Con cursor la página continúa después del cursor (se ignora skip).
+        """
+        # Validar que la factura existe (sin cargar sus pagos)
+        if db.get(Invoice, invoice_id) is None:
             raise ValueError(f"Invoice with id {invoice_id} does not exist")
         
-        return db.query(Payment).filter(
-            Payment.invoice_id == invoice_id
-        ).order_by(Payment.payment_date.desc()).offset(skip).limit(limit).all()
+        query = db.query(Payment).filter(Payment.invoice_id == invoice_id)
+        return PAYMENT_KEYSET.paginate(query, skip, limit, cursor).all()
+    
+    @staticmethod
+    def count_payments(
+        db: Session,
+        invoice_id: UUID,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de pagos de una factura (ver CountService.count)"""
+        query = db.query(Payment).filter(Payment.invoice_id == invoice_id)
+        return CountService.count(db, "payments", {"invoice_id": invoice_id}, query.statement, total_mode)
+    
+    @staticmethod
+    def _status_expression(paid_amount, total_amount):
+        """
+        Expresión SQL del estado de una factura según lo pagado (para usar dentro del UPDATE):
+        paid si se cubrió el total, partial si hay pagos, pending si no.
+        """
+        status_type = Invoice.__table__.c.status.type
+        return case(
+            (paid_amount >= total_amount, cast(InvoiceStatus.PAID, status_type)),
+            (paid_amount > 0, cast(InvoiceStatus.PARTIAL, status_type)),
+            else_=cast(InvoiceStatus.PENDING, status_type)
+        )
+
+
+class AsyncInvoiceService:
+    """Lecturas y escrituras de Invoices sobre AsyncSession (camino async, ver ASYNC_DB_ENABLED)"""
+    
+    @staticmethod
+    async def get_invoice(db: AsyncSession, invoice_id: UUID) -> Optional[Invoice]:
+        """Obtiene una factura por ID con sus pagos cargados"""
+        return await db.scalar(_INVOICE_WITH_PAYMENTS, {"invoice_id": invoice_id})
     
     @staticmethod
-    def count_payments(db: Session, invoice_id: UUID) -> int:
-        """Cuenta el total de pagos de una factura"""
-        return db.query(Payment).filter(Payment.invoice_id == invoice_id).count()
+    async def get_invoices(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 10,
+        student_id: Optional[UUID] = None,
+        school_id: Optional[UUID] = None,
+        status: Optional[InvoiceStatus] = None,
+        cursor: Optional[str] = None,
+        include_payments: bool = False,
+        sort: InvoiceSort = InvoiceSort.CREATED_AT
+    ) -> List[InvoiceSchema]:
+        """Ver InvoiceService.get_invoices"""
+        query = _invoice_list_query(student_id, school_id, status)
+        if include_payments:
+            query = query.options(selectinload(Invoice.payments))
+        result = await db.execute(INVOICE_KEYSETS[sort].paginate(query, skip, limit, cursor))
+        return await AsyncInvoiceService.page_schemas(db, result.scalars().all(), include_payments)
     
     @staticmethod
-    def _get_total_paid(db: Session, invoice_id: UUID) -> Decimal:
-        """Calcula el total pagado de una factura (solo pagos asociados a la factura)"""
-        result = db.query(func.sum(Payment.amount)).filter(
-            Payment.invoice_id == invoice_id
-        ).scalar()
-        return Decimal(result) if result else Decimal("0.00")
+    async def page_schemas(db: AsyncSession, invoices: Sequence[Invoice], include_payments: bool) -> List[InvoiceSchema]:
+        """Ver InvoiceService.page_schemas"""
+        if include_payments or not invoices:
+            return invoice_page_schemas(invoices)
+        result = await db.execute(payment_summaries_query([invoice.id for invoice in invoices]))
+        return invoice_page_schemas(invoices, result.all())
     
     @staticmethod
-    def _update_invoice_status(db: Session, invoice: Invoice):
-        """Actualiza el estado de una factura basado en los pagos"""
-        total_paid = InvoiceService._get_total_paid(db, invoice.id)
+    async def count_invoices(
+        db: AsyncSession,
+        student_id: Optional[UUID] = None,
+        school_id: Optional[UUID] = None,
+        status: Optional[InvoiceStatus] = None,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de facturas (ver CountService.count)"""
+        query = _invoice_list_query(student_id, school_id, status)
+        filters = {"student_id": student_id, "school_id": school_id, "status": status}
+        return await AsyncCountService.count(db, "invoices", filters, query, total_mode)
+    
+    @staticmethod
+    async def get_payments(
+        db: AsyncSession,
+        invoice_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None
+    ) -> List[Payment]:
+        """
+        Obtiene una lista de pagos de una factura con paginación, ordenados por fecha de pago descendente.
+        Con cursor la página continúa después del cursor (se ignora skip).
+        """
+        # Validar que la factura existe (sin cargar sus pagos)
+        if await db.get(Invoice, invoice_id) is None:
+            raise ValueError(f"Invoice with id {invoice_id} does not exist")
         
-        if total_paid >= invoice.total_amount:
-            invoice.status = InvoiceStatus.PAID
-        elif total_paid > 0:
-            invoice.status = InvoiceStatus.PARTIAL
-        else:
-            invoice.status = InvoiceStatus.PENDING
+        query = select(Payment).where(Payment.invoice_id == invoice_id)
+        result = await db.execute(PAYMENT_KEYSET.paginate(query, skip, limit, cursor))
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def count_payments(
+        db: AsyncSession,
+        invoice_id: UUID,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de pagos de una factura (ver CountService.count)"""
+        query = select(Payment).where(Payment.invoice_id == invoice_id)
+        return await AsyncCountService.count(db, "payments", {"invoice_id": invoice_id}, query, total_mode)
+    
+    @staticmethod
+    async def create_invoice(db: AsyncSession, invoice: InvoiceCreate) -> Invoice:
+        """Ver InvoiceService.create_invoice"""
+        student = await AsyncStudentService.get_student_snapshot(db, invoice.student_id)
+        if not student:
+            raise ValueError(f"Student with id {invoice.student_id} does not exist")
         
-        db.commit()
-        db.refresh(invoice)
+        if invoice.school_id != student.school_id:
+            raise ValueError(f"School ID {invoice.school_id} does not match student's school ID {student.school_id}")
+        
+        existing = await db.scalar(
+            _INVOICE_NUMBER_TAKEN, {"school_id": invoice.school_id, "invoice_number": invoice.invoice_number}
+        )
+        if existing is not None:
+            raise ValueError(f"Invoice number {invoice.invoice_number} already exists for this school")
+        
+        async with AsyncStatementWrite(invoice.student_id, invoice.school_id) as write:
+            db_invoice = Invoice(**invoice.model_dump())
+            db.add(db_invoice)
+            await db.commit()
+            write.add(total_invoiced=db_invoice.total_amount, total_invoices=1)
+        
+        return await AsyncInvoiceService._reload_invoice(db, db_invoice.id)
+    
+    @staticmethod
+    async def create_invoices_bulk(
+        db: AsyncSession,
+        invoices: Sequence[Tuple[int, InvoiceCreate]]
+    ) -> Tuple[int, List[InvoiceBulkError]]:
+        """Ver InvoiceService.create_invoices_bulk"""
+        chunk_size = settings.BULK_INVOICE_CHUNK_SIZE
+        
+        student_schools = {}
+        for chunk in _chunks(list({invoice.student_id for _, invoice in invoices}), chunk_size):
+            student_schools.update((await db.execute(_bulk_students_query(chunk))).all())
+        
+        taken = set()
+        numbers = list({(invoice.school_id, invoice.invoice_number) for _, invoice in invoices})
+        for chunk in _chunks(numbers, chunk_size):
+            taken.update(tuple(row) for row in await db.execute(_bulk_numbers_query(chunk)))
+        
+        valid, errors = _split_bulk_rows(invoices, student_schools, taken)
+        
+        created = 0
+        students = set()
+        schools = set()
+        for chunk in _chunks(valid, chunk_size):
+            inserted = set(
+                tuple(row) for row in await db.execute(_BULK_INSERT, [invoice.model_dump() for _, invoice in chunk])
+            )
+            await db.commit()
+            created += _collect_bulk_chunk(chunk, inserted, errors, students, schools)
+        
+        _invalidate_bulk(students, schools)
+        errors.sort(key=lambda error: error.index)
+        return created, errors
+    
+    @staticmethod
+    async def update_invoice(
+        db: AsyncSession,
+        invoice_id: UUID,
+        invoice_update: InvoiceUpdate
+    ) -> Optional[Invoice]:
+        """Ver InvoiceService.update_invoice"""
+        db_invoice = await AsyncInvoiceService.get_invoice(db, invoice_id)
+        if not db_invoice:
+            return None
+        
+        if invoice_update.invoice_number is not None:
+            school_id = invoice_update.school_id if invoice_update.school_id else db_invoice.school_id
+            existing = await db.scalar(
+                _OTHER_INVOICE_NUMBER_TAKEN,
+                {"school_id": school_id, "invoice_number": invoice_update.invoice_number, "invoice_id": invoice_id}
+            )
+            if existing is not None:
+                raise ValueError(f"Invoice number {invoice_update.invoice_number} already exists for this school")
+        
+        if invoice_update.student_id is not None:
+            student = await AsyncStudentService.get_student_snapshot(db, invoice_update.student_id)
+            if not student:
+                raise ValueError(f"Student with id {invoice_update.student_id} does not exist")
+            
+            school_id = invoice_update.school_id if invoice_update.school_id else db_invoice.school_id
+            if school_id != student.school_id:
+                raise ValueError(f"School ID {school_id} does not match student's school ID {student.school_id}")
+        
+        update_data = invoice_update.model_dump(exclude_unset=True)
+        total_amount_changed = 'total_amount' in update_data
+        
+        old_student_id, old_school_id = db_invoice.student_id, db_invoice.school_id
+        old_total_amount = db_invoice.total_amount
+        
+        async with AsyncStatementWrite(old_student_id, old_school_id) as write:
+            for field, value in update_data.items():
+                setattr(db_invoice, field, value)
+            
+            if total_amount_changed:
+                db_invoice.status = InvoiceService._status_expression(
+                    Invoice.paid_amount, update_data['total_amount']
+                )
+            
+            await db.commit()
+            # refresh() dejaría payments sin cargar (lazy load al serializar): se relee
+            # con sus pagos, que además trae el status calculado en la base
+            db_invoice = await AsyncInvoiceService._reload_invoice(db, invoice_id)
+            
+            moved = (db_invoice.student_id, db_invoice.school_id) != (old_student_id, old_school_id)
+            if moved:
+                write.invalidate()
+            else:
+                write.add(total_invoiced=db_invoice.total_amount - old_total_amount)
+        
+        if moved:
+            invalidate_statements(db_invoice.student_id, db_invoice.school_id)
+        bump_entity_version("invoice", invoice_id)
+        
+        return db_invoice
+    
+    @staticmethod
+    async def delete_invoice(db: AsyncSession, invoice_id: UUID) -> bool:
+        """Ver InvoiceService.delete_invoice"""
+        db_invoice = await AsyncInvoiceService.get_invoice(db, invoice_id)
+        if not db_invoice:
+            return False
+        
+        total_invoiced = db_invoice.total_amount
+        total_paid = db_invoice.paid_amount
+        async with AsyncStatementWrite(db_invoice.student_id, db_invoice.school_id) as write:
+            await db.delete(db_invoice)
+            await db.commit()
+            write.add(total_invoiced=-total_invoiced, total_paid=-total_paid, total_invoices=-1)
+        bump_entity_version("invoice", invoice_id)
+        return True
+    
+    @staticmethod
+    async def create_payment(db: AsyncSession, invoice_id: UUID, payment: PaymentCreate) -> Optional[Payment]:
+        """Ver InvoiceService.create_payment"""
+        paid_amount = Invoice.paid_amount + payment.amount
+        invoice = (await db.execute(
+            update(Invoice)
+            .where(Invoice.id == invoice_id, paid_amount <= Invoice.total_amount)
+            .values(paid_amount=paid_amount, status=InvoiceService._status_expression(paid_amount, Invoice.total_amount))
+            .returning(Invoice.school_id, Invoice.student_id)
+            .execution_options(synchronize_session=False)
+        )).first()
+        
+        if invoice is None:
+            await db.rollback()
+            existing = await db.get(Invoice, invoice_id)
+            if not existing:
+                return None
+            pending = existing.total_amount - existing.paid_amount
+            raise ValueError(
+                f"Payment amount ({payment.amount}) exceeds pending amount ({pending})"
+            )
+        
+        payment_data = payment.model_dump()
+        payment_data['invoice_id'] = invoice_id
+        payment_data['school_id'] = invoice.school_id
+        payment_data['student_id'] = invoice.student_id
+        
+        async with AsyncStatementWrite(invoice.student_id, invoice.school_id) as write:
+            db_payment = Payment(**payment_data)
+            db.add(db_payment)
+            await db.commit()
+            await db.refresh(db_payment)
+            write.add(total_paid=db_payment.amount)
+        bump_entity_version("invoice", invoice_id)
+        
+        return db_payment
+    
+    @staticmethod
+    async def import_payments(
+        db: AsyncSession,
+        school_id: UUID,
+        rows: Sequence[Tuple[int, PaymentImportRow]]
+    ) -> Tuple[int, Decimal, List[PaymentImportError]]:
+        """Ver InvoiceService.import_payments"""
+        invoices = {
+            invoice.invoice_number: invoice
+            for invoice in await db.execute(_import_invoices_query(school_id, rows))
+        }
+        references = {row.bank_reference for _, row in rows if row.bank_reference}
+        imported = set()
+        if references:
+            imported.update(await db.scalars(_imported_references_query(school_id, references)))
+        
+        payments, applied, errors = _match_payment_rows(school_id, rows, invoices, imported)
+        if not payments:
+            await db.rollback()
+            return 0, Decimal("0.00"), errors
+        
+        await db.execute(insert(Payment), payments)
+        await db.execute(_apply_paid_amounts(applied))
+        await db.commit()
+        
+        _invalidate_imported(school_id, payments, applied)
+        return len(payments), sum(applied.values(), Decimal("0.00")), errors
+    
+    @staticmethod
+    async def _reload_invoice(db: AsyncSession, invoice_id: UUID) -> Invoice:
+        """
+        Relee una factura recién escrita con sus columnas y pagos cargados: en la sesión
+        async no hay lazy loads al serializar la respuesta.
+        """
+        return await db.scalar(
+            _INVOICE_WITH_PAYMENTS, {"invoice_id": invoice_id}, execution_options={"populate_existing": True}
+        )
+
+
+def _invoice_list_query(
+    student_id: Optional[UUID],
+    school_id: Optional[UUID],
+    status: Optional[InvoiceStatus]
+) -> Select:
+    """
+    Facturas del listado con sus filtros, sin JOIN: el colegio se filtra por
+    Invoice.school_id (denormalizado, ver migración 002), el colegio que emitió la
+    factura, igual que en los statements. Cada combinación de filtros y orden tiene
+    su índice (ver INVOICE_KEYSETS).
+    """
+    query = select(Invoice)
+    
+    if student_id is not None:
+        query = query.where(Invoice.student_id == student_id)
+    
+    if school_id is not None:
+        query = query.where(Invoice.school_id == school_id)
+    
+    if status is not None:
+        query = query.where(Invoice.status == status)
+    
+    return query
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    """Parte items en tramos de a lo sumo size elementos"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _bulk_row_error(invoice: InvoiceCreate, student_schools: dict, taken: set) -> Optional[str]:
+    """
+    Motivo por el que una fila de la carga masiva no se puede crear, o None si es válida.
+    
+    Args:
+        student_schools: Colegio de cada estudiante existente del lote
+        taken: Pares (school_id, invoice_number) ya usados en la base o por filas anteriores
+    """
+    school_id = student_schools.get(invoice.student_id)
+    if school_id is None:
+        return f"Student with id {invoice.student_id} does not exist"
+    if invoice.school_id != school_id:
+        return f"School ID {invoice.school_id} does not match student's school ID {school_id}"
+    if invoice.due_date < invoice.issue_date:
+        return "Due date must be on or after issue date"
+    if (invoice.school_id, invoice.invoice_number) in taken:
+        return f"Invoice number {invoice.invoice_number} already exists for this school"
+    return None
+
+
+def _bulk_students_query(student_ids: Sequence[UUID]) -> Select:
+    """Colegio de cada estudiante existente de un chunk de la carga masiva"""
+    return select(Student.id, Student.school_id).where(Student.id.in_(student_ids))
+
+
+def _bulk_numbers_query(numbers: Sequence[Tuple[UUID, str]]) -> Select:
+    """Pares (school_id, invoice_number) de un chunk que ya existen en la base"""
+    return select(Invoice.school_id, Invoice.invoice_number).where(
+        tuple_(Invoice.school_id, Invoice.invoice_number).in_(numbers)
+    )
+
+
+def _split_bulk_rows(
+    invoices: Sequence[Tuple[int, InvoiceCreate]],
+    student_schools: dict,
+    taken: set
+) -> Tuple[List[Tuple[int, InvoiceCreate]], List[InvoiceBulkError]]:
+    """Separa las filas válidas de la carga masiva de las rechazadas (ver _bulk_row_error)"""
+    errors = []
+    valid = []
+    for index, invoice in invoices:
+        error = _bulk_row_error(invoice, student_schools, taken)
+        if error is not None:
+            errors.append(InvoiceBulkError(index=index, invoice_number=invoice.invoice_number, detail=error))
+            continue
+        taken.add((invoice.school_id, invoice.invoice_number))
+        valid.append((index, invoice))
+    return valid, errors
 
+
+def _collect_bulk_chunk(
+    chunk: Sequence[Tuple[int, InvoiceCreate]],
+    inserted: set,
+    errors: List[InvoiceBulkError],
+    students: set,
+    schools: set
+) -> int:
+    """
+    Registra el resultado de un chunk insertado: las filas que no volvieron en RETURNING
+    (número tomado por una escritura concurrente) se agregan a errors.
+    
+    Returns:
+        Facturas creadas en el chunk
+    """
+    created = 0
+    for index, invoice in chunk:
+        if (invoice.school_id, invoice.invoice_number) not in inserted:
+            errors.append(InvoiceBulkError(
+                index=index,
+                invoice_number=invoice.invoice_number,
+                detail=f"Invoice number {invoice.invoice_number} already exists for this school"
+            ))
+            continue
+        created += 1
+        students.add(invoice.student_id)
+        schools.add(invoice.school_id)
+    return created
+
+
+def _invalidate_bulk(students: set, schools: set):
+    """Invalida una sola vez el statement de cada estudiante y colegio de la carga masiva"""
+    # Dentro de un request se aplican juntas al terminarlo (ver InvalidationBatch)
+    for student_id in students:
+        invalidate_student_statement(student_id)
+    for school_id in schools:
+        invalidate_school_statement(school_id)
+
+
+def _import_invoices_query(school_id: UUID, rows: Sequence[Tuple[int, PaymentImportRow]]) -> Select:
+    """Facturas del colegio referidas por un chunk de pagos importados, bloqueadas (FOR UPDATE)"""
+    return (
+        select(Invoice.id, Invoice.invoice_number, Invoice.student_id, Invoice.total_amount, Invoice.paid_amount)
+        .where(Invoice.school_id == school_id, Invoice.invoice_number.in_({row.invoice_key for _, row in rows}))
+        .order_by(Invoice.id)
+        .with_for_update()
+    )
+
+
+def _imported_references_query(school_id: UUID, references: set) -> Select:
+    """Referencias bancarias de un chunk ya registradas en el colegio"""
+    return select(Payment.payment_reference).where(
+        Payment.school_id == school_id, Payment.payment_reference.in_(references)
+    )
+
+
+def _match_payment_rows(
+    school_id: UUID,
+    rows: Sequence[Tuple[int, PaymentImportRow]],
+    invoices: dict,
+    imported: set
+) -> Tuple[List[dict], dict, List[PaymentImportError]]:
+    """
+    Concilia las filas de un chunk con sus facturas (ver InvoiceService.import_payments).
+    
+    Returns:
+        Tupla (pagos a insertar, monto aplicado por factura, filas no aplicadas)
+    """
+    pending = {number: invoice.total_amount - invoice.paid_amount for number, invoice in invoices.items()}
+    applied = {}
+    payments = []
+    errors = []
+    for index, row in rows:
+        invoice = invoices.get(row.invoice_key)
+        detail = None
+        if invoice is None:
+            detail = f"Invoice number {row.invoice_key} does not exist for this school"
+        elif row.bank_reference in imported:
+            detail = f"Payment reference {row.bank_reference} was already imported"
+        elif row.amount > pending[row.invoice_key]:
+            detail = f"Payment amount ({row.amount}) exceeds pending amount ({pending[row.invoice_key]})"
+        if detail is not None:
+            errors.append(PaymentImportError(
+                index=index, invoice_number=row.invoice_key, payment_reference=row.payment_reference, detail=detail
+            ))
+            continue
+        
+        pending[row.invoice_key] -= row.amount
+        if row.bank_reference:
+            imported.add(row.bank_reference)
+        applied[invoice.id] = applied.get(invoice.id, Decimal("0")) + row.amount
+        payments.append({
+            **row.model_dump(exclude={"invoice_number"}),
+            "invoice_id": invoice.id,
+            "school_id": school_id,
+            "student_id": invoice.student_id
+        })
+    return payments, applied, errors
+
+
+def _apply_paid_amounts(applied: dict):
+    """UPDATE ... FROM (VALUES ...) que suma lo aplicado a cada factura y deriva su estado"""
+    amounts = values(
+        column("id", Invoice.id.type), column("amount", Invoice.paid_amount.type), name="applied"
+    ).data(list(applied.items()))
+    paid_amount = Invoice.paid_amount + amounts.c.amount
+    return (
+        update(Invoice)
+        .where(Invoice.id == amounts.c.id)
+        .values(paid_amount=paid_amount, status=InvoiceService._status_expression(paid_amount, Invoice.total_amount))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _invalidate_imported(school_id: UUID, payments: List[dict], applied: dict):
+    """Invalida los statements y ETags afectados por un chunk de pagos importados"""
+    # Dentro de un request se aplican juntas al terminarlo (ver InvalidationBatch)
+    for student_id in {payment["student_id"] for payment in payments}:
+        invalidate_student_statement(student_id)
+    invalidate_school_statement(school_id)
+    for invoice_id in applied:
+        bump_entity_version("invoice", invoice_id)
+
+
+# Columnas de Invoice que se copian a los schemas sin tocar la relación payments
+_INVOICE_COLUMNS = [attribute.key for attribute in inspect(Invoice).column_attrs]
+
+
+def payment_summaries_query(invoice_ids: List[UUID]) -> Select:
+    """
+    Resumen de pagos de varias facturas en una consulta:
+        
+        SELECT invoice_id, count(id), sum(amount), max(payment_date)
+        FROM payments WHERE invoice_id IN (...) GROUP BY invoice_id
+    
+    Las facturas sin pagos no tienen fila.
+    """
+    return select(
+        Payment.invoice_id,
+        func.count(Payment.id).label("count"),
+        func.sum(Payment.amount).label("total_amount"),
+        func.max(Payment.payment_date).label("last_payment_date")
+    ).where(Payment.invoice_id.in_(invoice_ids)).group_by(Payment.invoice_id)
+
+
+def invoice_page_schemas(invoices: Sequence[Invoice], summaries: Optional[Sequence[Any]] = None) -> List[InvoiceSchema]:
+    """
+    Convierte una página de facturas a schemas.
+    
+    Sin summaries los pagos de las facturas deben estar cargados (selectinload); con
+    summaries (filas de payment_summaries_query) cada factura lleva solo su resumen y
+    payments es null.
+    """
+    if summaries is None:
+        return [InvoiceSchema.model_validate(invoice) for invoice in invoices]
+    
+    by_invoice = {
+        row.invoice_id: PaymentSummary(
+            count=row.count, total_amount=row.total_amount, last_payment_date=row.last_payment_date
+        )
+        for row in summaries
+    }
+    return [
+        InvoiceSchema.model_validate({
+            **{key: getattr(invoice, key) for key in _INVOICE_COLUMNS},
+            "payments": None,
+            "payment_summary": by_invoice.get(invoice.id, PaymentSummary())
+        })
+        for invoice in invoices
+    ]
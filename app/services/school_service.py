@@ -1,12 +1,33 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import bindparam, func, select, true
+from typing import List, Optional, Tuple
 from uuid import UUID
 from app.models.school import School
 from app.models.student import Student
 from app.models.invoice import Invoice, InvoiceStatus
 from app.models.payment import Payment
-from app.schemas.school import SchoolCreate, SchoolUpdate
+from app.schemas.school import SchoolCreate, SchoolUpdate, School as SchoolSchema
+from app.core.cache import (
+    get_entity_snapshot, get_versioned_entity_snapshot, invalidate_entity_snapshot,
+    invalidate_school_statement, invalidate_student_statement, bump_entity_version
+)
+from app.core import async_cache
+from app.core.pagination import Keyset, TotalMode
+from app.services.count_service import CountService, AsyncCountService
+
+# Orden de los listados de colegios (ver app.core.pagination)
+SCHOOL_KEYSET = Keyset(School.created_at, School.id)
+
+# Consultas frecuentes construidas una sola vez con parámetros ligados: SQLAlchemy
+# memoiza su cache key y reutiliza la compilación en cada llamada, en lugar de
+# reconstruir y recorrer la consulta (ver scripts/benchmark_statement_cache.py)
+_SCHOOL_BY_ID = select(School).where(School.id == bindparam("school_id"))
+_SCHOOL_STUDENT_IDS = select(Student.id).where(Student.school_id == bindparam("school_id"))
+_SCHOOL_INVOICE_IDS = select(Invoice.id).where(Invoice.school_id == bindparam("school_id"))
+_ACTIVE_STUDENT_COUNT = select(func.count()).select_from(Student).where(
+    Student.school_id == bindparam("school_id"), Student.is_active == true()
+)
 
 
 class SchoolService:
@@ -15,32 +36,57 @@ class SchoolService:
     @staticmethod
     def get_school(db: Session, school_id: UUID) -> Optional[School]:
         """Obtiene un colegio por ID"""
-        return db.query(School).filter(School.id == school_id).first()
+        return db.execute(_SCHOOL_BY_ID, {"school_id": school_id}).scalar_one_or_none()
+    
+    @staticmethod
+    def get_school_snapshot(db: Session, school_id: UUID) -> Optional[SchoolSchema]:
+        """
+        Obtiene un snapshot cacheado de un colegio por ID (sin consultar la base ante un hit).
+        Usar para validaciones y lecturas; para modificar la fila usar get_school.
+        """
+        return get_entity_snapshot(
+            "school", school_id, SchoolSchema, lambda: SchoolService.get_school(db, school_id)
+        )
+    
+    @staticmethod
+    def get_versioned_school_snapshot(db: Session, school_id: UUID) -> Tuple[Optional[SchoolSchema], Optional[str]]:
+        """Igual que get_school_snapshot, retornando también la versión del colegio (para el ETag)"""
+        return get_versioned_entity_snapshot(
+            "school", school_id, SchoolSchema, lambda: SchoolService.get_school(db, school_id)
+        )
     
     @staticmethod
     def get_schools(
         db: Session, 
         skip: int = 0, 
         limit: int = 10,
-        is_active: Optional[bool] = None
+        is_active: Optional[bool] = None,
+        cursor: Optional[str] = None
     ) -> List[School]:
-        """Obtiene una lista de colegios con paginación, ordenados por fecha de creación descendente"""
+        """
+        Obtiene una lista de colegios con paginación, ordenados por fecha de creación descendente.
+        Con cursor la página continúa después del cursor (se ignora skip).
+        """
         query = db.query(School)
         
         if is_active is not None:
             query = query.filter(School.is_active == is_active)
         
-        return query.order_by(School.created_at.desc()).offset(skip).limit(limit).all()
+        return SCHOOL_KEYSET.paginate(query, skip, limit, cursor).all()
     
     @staticmethod
-    def count_schools(db: Session, is_active: Optional[bool] = None) -> int:
-        """Cuenta el total de colegios"""
+    def count_schools(
+        db: Session,
+        is_active: Optional[bool] = None,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de colegios (ver CountService.count)"""
         query = db.query(School)
         
         if is_active is not None:
             query = query.filter(School.is_active == is_active)
         
-        return query.count()
+        return CountService.count(db, "schools", {"is_active": is_active}, query.statement, total_mode)
     
     @staticmethod
     def create_school(db: Session, school: SchoolCreate) -> School:
@@ -68,6 +114,12 @@ class SchoolService:
         
         db.commit()
         db.refresh(db_school)
+        invalidate_entity_snapshot("school", school_id)
+        if "name" in update_data:
+            # Los statements del colegio y de sus estudiantes muestran el nombre
+            invalidate_school_statement(school_id)
+            for student_id in db.scalars(_SCHOOL_STUDENT_IDS, {"school_id": school_id}):
+                invalidate_student_statement(student_id)
         return db_school
     
     @staticmethod
@@ -77,15 +129,134 @@ class SchoolService:
         if not db_school:
             return False
         
+        # Los estudiantes y sus facturas se eliminan en cascada: invalidar también sus snapshots y ETags
+        student_ids = [student.id for student in db_school.students]
+        invoice_ids = list(db.scalars(_SCHOOL_INVOICE_IDS, {"school_id": school_id}))
         db.delete(db_school)
         db.commit()
+        invalidate_entity_snapshot("school", school_id)
+        invalidate_school_statement(school_id)
+        for student_id in student_ids:
+            invalidate_entity_snapshot("student", student_id)
+            invalidate_student_statement(student_id)
+        for invoice_id in invoice_ids:
+            bump_entity_version("invoice", invoice_id)
         return True
     
     @staticmethod
     def count_students(db: Session, school_id: UUID) -> int:
         """Cuenta el número de estudiantes activos de un colegio"""
-        return db.query(Student).filter(
-            Student.school_id == school_id,
-            Student.is_active == True
-        ).count()
+        return db.scalar(_ACTIVE_STUDENT_COUNT, {"school_id": school_id})
+
 
+class AsyncSchoolService:
+    """Lecturas y escrituras de Schools sobre AsyncSession (camino async, ver ASYNC_DB_ENABLED)"""
+    
+    @staticmethod
+    async def get_school(db: AsyncSession, school_id: UUID) -> Optional[School]:
+        """Obtiene un colegio por ID"""
+        return await db.get(School, school_id)
+    
+    @staticmethod
+    async def get_school_snapshot(db: AsyncSession, school_id: UUID) -> Optional[SchoolSchema]:
+        """Ver SchoolService.get_school_snapshot"""
+        return await async_cache.get_entity_snapshot(
+            "school", school_id, SchoolSchema, lambda: AsyncSchoolService.get_school(db, school_id)
+        )
+    
+    @staticmethod
+    async def get_versioned_school_snapshot(
+        db: AsyncSession,
+        school_id: UUID
+    ) -> Tuple[Optional[SchoolSchema], Optional[str]]:
+        """Ver SchoolService.get_versioned_school_snapshot"""
+        return await async_cache.get_versioned_entity_snapshot(
+            "school", school_id, SchoolSchema, lambda: AsyncSchoolService.get_school(db, school_id)
+        )
+    
+    @staticmethod
+    async def get_schools(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 10,
+        is_active: Optional[bool] = None,
+        cursor: Optional[str] = None
+    ) -> List[School]:
+        """Ver SchoolService.get_schools"""
+        query = select(School)
+        
+        if is_active is not None:
+            query = query.where(School.is_active == is_active)
+        
+        result = await db.execute(SCHOOL_KEYSET.paginate(query, skip, limit, cursor))
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def count_schools(
+        db: AsyncSession,
+        is_active: Optional[bool] = None,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de colegios (ver CountService.count)"""
+        query = select(School)
+        
+        if is_active is not None:
+            query = query.where(School.is_active == is_active)
+        
+        return await AsyncCountService.count(db, "schools", {"is_active": is_active}, query, total_mode)
+    
+    @staticmethod
+    async def create_school(db: AsyncSession, school: SchoolCreate) -> School:
+        """Ver SchoolService.create_school"""
+        db_school = School(**school.model_dump())
+        db.add(db_school)
+        await db.commit()
+        await db.refresh(db_school)
+        return db_school
+    
+    @staticmethod
+    async def update_school(
+        db: AsyncSession,
+        school_id: UUID,
+        school_update: SchoolUpdate
+    ) -> Optional[School]:
+        """Ver SchoolService.update_school"""
+        db_school = await AsyncSchoolService.get_school(db, school_id)
+        if not db_school:
+            return None
+        
+        update_data = school_update.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(db_school, field, value)
+        
+        await db.commit()
+        await db.refresh(db_school)
+        invalidate_entity_snapshot("school", school_id)
+        if "name" in update_data:
+            # Los statements del colegio y de sus estudiantes muestran el nombre
+            invalidate_school_statement(school_id)
+            for student_id in await db.scalars(_SCHOOL_STUDENT_IDS, {"school_id": school_id}):
+                invalidate_student_statement(student_id)
+        return db_school
+    
+    @staticmethod
+    async def delete_school(db: AsyncSession, school_id: UUID) -> bool:
+        """Ver SchoolService.delete_school"""
+        db_school = await AsyncSchoolService.get_school(db, school_id)
+        if not db_school:
+            return False
+        
+        # Los IDs se consultan en lugar de recorrer db_school.students (sin lazy loads);
+        # las cascadas del ORM cargan lo que necesitan dentro de delete/commit
+        student_ids = list(await db.scalars(_SCHOOL_STUDENT_IDS, {"school_id": school_id}))
+        invoice_ids = list(await db.scalars(_SCHOOL_INVOICE_IDS, {"school_id": school_id}))
+        await db.delete(db_school)
+        await db.commit()
+        invalidate_entity_snapshot("school", school_id)
+        invalidate_school_statement(school_id)
+        for student_id in student_ids:
+            invalidate_entity_snapshot("student", student_id)
+            invalidate_student_statement(student_id)
+        for invoice_id in invoice_ids:
+            bump_entity_version("invoice", invoice_id)
+        return True
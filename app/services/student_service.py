@@ -1,14 +1,32 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import bindparam, func, select
+from typing import List, Optional, Tuple
 from decimal import Decimal
 from uuid import UUID
 from app.models.student import Student
-from app.models.school import School
 from app.models.invoice import Invoice
 from app.models.payment import Payment
-from app.schemas.student import StudentCreate, StudentUpdate
-from app.core.cache import invalidate_student_statement, invalidate_school_statement
+from app.schemas.student import StudentCreate, StudentUpdate, Student as StudentSchema
+from app.services.school_service import SchoolService, AsyncSchoolService
+from app.core.cache import (
+    get_entity_snapshot, get_versioned_entity_snapshot, invalidate_entity_snapshot,
+    invalidate_statements, invalidate_school_statement, bump_entity_version
+)
+from app.core import async_cache
+from app.core.pagination import Keyset, TotalMode
+from app.services.count_service import CountService, AsyncCountService
+
+# Orden de los listados de estudiantes (ver app.core.pagination)
+STUDENT_KEYSET = Keyset(Student.created_at, Student.id)
+
+# Consultas frecuentes construidas una sola vez con parámetros ligados: SQLAlchemy
+# memoiza su cache key y reutiliza la compilación en cada llamada, en lugar de
+# reconstruir y recorrer la consulta (ver scripts/benchmark_statement_cache.py)
+_STUDENT_BY_ID = select(Student).where(Student.id == bindparam("student_id"))
+_STUDENT_TOTAL_INVOICED = select(func.sum(Invoice.total_amount)).where(Invoice.student_id == bindparam("student_id"))
+_STUDENT_TOTAL_PAID = select(func.sum(Payment.amount)).where(Payment.student_id == bindparam("student_id"))
+_STUDENT_INVOICE_IDS = select(Invoice.id).where(Invoice.student_id == bindparam("student_id"))
 
 
 class StudentService:
@@ -17,7 +35,24 @@ class StudentService:
     @staticmethod
     def get_student(db: Session, student_id: UUID) -> Optional[Student]:
         """Obtiene un estudiante por ID"""
-        return db.query(Student).filter(Student.id == student_id).first()
+        return db.execute(_STUDENT_BY_ID, {"student_id": student_id}).scalar_one_or_none()
+    
+    @staticmethod
+    def get_student_snapshot(db: Session, student_id: UUID) -> Optional[StudentSchema]:
+        """
+        Obtiene un snapshot cacheado de un estudiante por ID (sin consultar la base ante un hit).
+        Usar para validaciones y lecturas; para modificar la fila usar get_student.
+        """
+        return get_entity_snapshot(
+            "student", student_id, StudentSchema, lambda: StudentService.get_student(db, student_id)
+        )
+    
+    @staticmethod
+    def get_versioned_student_snapshot(db: Session, student_id: UUID) -> Tuple[Optional[StudentSchema], Optional[str]]:
+        """Igual que get_student_snapshot, retornando también la versión del estudiante (para el ETag)"""
+        return get_versioned_entity_snapshot(
+            "student", student_id, StudentSchema, lambda: StudentService.get_student(db, student_id)
+        )
     
     @staticmethod
     def get_students(
@@ -25,9 +60,13 @@ class StudentService:
         skip: int = 0,
         limit: int = 10,
         school_id: Optional[UUID] = None,
-        is_active: Optional[bool] = None
+        is_active: Optional[bool] = None,
+        cursor: Optional[str] = None
     ) -> List[Student]:
-        """Obtiene una lista de estudiantes con paginación y filtros, ordenados por fecha de creación descendente"""
+        """
+        Obtiene una lista de estudiantes con paginación y filtros, ordenados por fecha de creación descendente.
+        Con cursor la página continúa después del cursor (se ignora skip).
+        """
         query = db.query(Student)
         
         if school_id is not None:
@@ -36,15 +75,16 @@ class StudentService:
         if is_active is not None:
             query = query.filter(Student.is_active == is_active)
         
-        return query.order_by(Student.created_at.desc()).offset(skip).limit(limit).all()
+        return STUDENT_KEYSET.paginate(query, skip, limit, cursor).all()
     
     @staticmethod
     def count_students(
         db: Session,
         school_id: Optional[UUID] = None,
-        is_active: Optional[bool] = None
-    ) -> int:
-        """Cuenta el total de estudiantes"""
+        is_active: Optional[bool] = None,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de estudiantes (ver CountService.count)"""
         query = db.query(Student)
         
         if school_id is not None:
@@ -53,13 +93,14 @@ class StudentService:
         if is_active is not None:
             query = query.filter(Student.is_active == is_active)
         
-        return query.count()
+        filters = {"school_id": school_id, "is_active": is_active}
+        return CountService.count(db, "students", filters, query.statement, total_mode)
     
     @staticmethod
     def create_student(db: Session, student: StudentCreate) -> Student:
         """Crea un nuevo estudiante"""
         # Validar que el colegio existe
-        school = db.query(School).filter(School.id == student.school_id).first()
+        school = SchoolService.get_school_snapshot(db, student.school_id)
         if not school:
             raise ValueError(f"School with id {student.school_id} does not exist")
         
@@ -67,6 +108,8 @@ class StudentService:
         db.add(db_student)
         db.commit()
         db.refresh(db_student)
+        # El statement del colegio cuenta sus estudiantes activos
+        invalidate_school_statement(db_student.school_id)
         return db_student
     
     @staticmethod
@@ -90,7 +133,7 @@ class StudentService:
         new_school_id = None
         
         if student_update.school_id is not None:
-            school = db.query(School).filter(School.id == student_update.school_id).first()
+            school = SchoolService.get_school_snapshot(db, student_update.school_id)
             if not school:
                 raise ValueError(f"School with id {student_update.school_id} does not exist")
             new_school_id = student_update.school_id
@@ -101,15 +144,11 @@ class StudentService:
         # Si se intenta cambiar el school_id, validar que no tenga deuda
         if school_id_changed:
             # Calcular total facturado
-            total_invoiced_result = db.query(func.sum(Invoice.total_amount)).filter(
-                Invoice.student_id == student_id
-            ).scalar()
+            total_invoiced_result = db.scalar(_STUDENT_TOTAL_INVOICED, {"student_id": student_id})
             total_invoiced = Decimal(total_invoiced_result) if total_invoiced_result else Decimal("0.00")
             
             # Calcular total pagado
-            total_paid_result = db.query(func.sum(Payment.amount)).filter(
-                Payment.student_id == student_id
-            ).scalar()
+            total_paid_result = db.scalar(_STUDENT_TOTAL_PAID, {"student_id": student_id})
             total_paid = Decimal(total_paid_result) if total_paid_result else Decimal("0.00")
             
             # Calcular deuda
@@ -121,11 +160,6 @@ class StudentService:
                     f"No se puede cambiar el colegio del estudiante. "
                     f"Tiene una deuda pendiente de ${debt:.2f} con el colegio actual."
                 )
-            
-            # Invalidar cache de ambos colegios (anterior y nuevo) y del estudiante
-            invalidate_school_statement(old_school_id)
-            invalidate_school_statement(new_school_id)
-            invalidate_student_statement(student_id)
         
         update_data = student_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
@@ -133,6 +167,14 @@ class StudentService:
         
         db.commit()
         db.refresh(db_student)
+        invalidate_entity_snapshot("student", student_id)
+        if school_id_changed:
+            # Invalidar cache de ambos colegios (anterior y nuevo) y del estudiante
+            invalidate_statements(student_id, new_school_id)
+            invalidate_school_statement(old_school_id)
+        elif update_data.keys() & {"first_name", "last_name", "is_active"}:
+            # El statement muestra el nombre del estudiante y el del colegio cuenta los activos
+            invalidate_statements(student_id, old_school_id)
         return db_student
     
     @staticmethod
@@ -142,7 +184,161 @@ class StudentService:
         if not db_student:
             return False
         
+        school_id = db_student.school_id
+        invoice_ids = [invoice.id for invoice in db_student.invoices]
         db.delete(db_student)
         db.commit()
+        invalidate_entity_snapshot("student", student_id)
+        # Sus facturas y pagos se eliminan en cascada: los totales del colegio cambian
+        invalidate_statements(student_id, school_id)
+        for invoice_id in invoice_ids:
+            bump_entity_version("invoice", invoice_id)
         return True
 
+
+class AsyncStudentService:
+    """Lecturas y escrituras de Students sobre AsyncSession (camino async, ver ASYNC_DB_ENABLED)"""
+    
+    @staticmethod
+    async def get_student(db: AsyncSession, student_id: UUID) -> Optional[Student]:
+        """Obtiene un estudiante por ID"""
+        return await db.get(Student, student_id)
+    
+    @staticmethod
+    async def get_student_snapshot(db: AsyncSession, student_id: UUID) -> Optional[StudentSchema]:
+        """Ver StudentService.get_student_snapshot"""
+        return await async_cache.get_entity_snapshot(
+            "student", student_id, StudentSchema, lambda: AsyncStudentService.get_student(db, student_id)
+        )
+    
+    @staticmethod
+    async def get_versioned_student_snapshot(
+        db: AsyncSession,
+        student_id: UUID
+    ) -> Tuple[Optional[StudentSchema], Optional[str]]:
+        """Ver StudentService.get_versioned_student_snapshot"""
+        return await async_cache.get_versioned_entity_snapshot(
+            "student", student_id, StudentSchema, lambda: AsyncStudentService.get_student(db, student_id)
+        )
+    
+    @staticmethod
+    async def get_students(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 10,
+        school_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        cursor: Optional[str] = None
+    ) -> List[Student]:
+        """Ver StudentService.get_students"""
+        query = AsyncStudentService._filter(select(Student), school_id, is_active)
+        result = await db.execute(STUDENT_KEYSET.paginate(query, skip, limit, cursor))
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def count_students(
+        db: AsyncSession,
+        school_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        total_mode: TotalMode = TotalMode.EXACT
+    ) -> Optional[int]:
+        """Cuenta el total de estudiantes (ver CountService.count)"""
+        query = AsyncStudentService._filter(select(Student), school_id, is_active)
+        filters = {"school_id": school_id, "is_active": is_active}
+        return await AsyncCountService.count(db, "students", filters, query, total_mode)
+    
+    @staticmethod
+    def _filter(query, school_id: Optional[UUID], is_active: Optional[bool]):
+        """Aplica los filtros del listado de estudiantes"""
+        if school_id is not None:
+            query = query.where(Student.school_id == school_id)
+        
+        if is_active is not None:
+            query = query.where(Student.is_active == is_active)
+        
+        return query
+    
+    @staticmethod
+    async def create_student(db: AsyncSession, student: StudentCreate) -> Student:
+        """Ver StudentService.create_student"""
+        school = await AsyncSchoolService.get_school_snapshot(db, student.school_id)
+        if not school:
+            raise ValueError(f"School with id {student.school_id} does not exist")
+        
+        db_student = Student(**student.model_dump())
+        db.add(db_student)
+        await db.commit()
+        await db.refresh(db_student)
+        # El statement del colegio cuenta sus estudiantes activos
+        invalidate_school_statement(db_student.school_id)
+        return db_student
+    
+    @staticmethod
+    async def update_student(
+        db: AsyncSession,
+        student_id: UUID,
+        student_update: StudentUpdate
+    ) -> Optional[Student]:
+        """Ver StudentService.update_student"""
+        db_student = await AsyncStudentService.get_student(db, student_id)
+        if not db_student:
+            return None
+        
+        old_school_id = db_student.school_id
+        new_school_id = None
+        
+        if student_update.school_id is not None:
+            school = await AsyncSchoolService.get_school_snapshot(db, student_update.school_id)
+            if not school:
+                raise ValueError(f"School with id {student_update.school_id} does not exist")
+            new_school_id = student_update.school_id
+        
+        school_id_changed = new_school_id is not None and new_school_id != old_school_id
+        
+        # Si se intenta cambiar el school_id, validar que no tenga deuda
+        if school_id_changed:
+            total_invoiced_result = await db.scalar(_STUDENT_TOTAL_INVOICED, {"student_id": student_id})
+            total_invoiced = Decimal(total_invoiced_result) if total_invoiced_result else Decimal("0.00")
+            total_paid_result = await db.scalar(_STUDENT_TOTAL_PAID, {"student_id": student_id})
+            total_paid = Decimal(total_paid_result) if total_paid_result else Decimal("0.00")
+            debt = total_invoiced - total_paid
+            if debt > 0:
+                raise ValueError(
+                    f"No se puede cambiar el colegio del estudiante. "
+                    f"Tiene una deuda pendiente de ${debt:.2f} con el colegio actual."
+                )
+        
+        update_data = student_update.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(db_student, field, value)
+        
+        await db.commit()
+        await db.refresh(db_student)
+        invalidate_entity_snapshot("student", student_id)
+        if school_id_changed:
+            # Invalidar cache de ambos colegios (anterior y nuevo) y del estudiante
+            invalidate_statements(student_id, new_school_id)
+            invalidate_school_statement(old_school_id)
+        elif update_data.keys() & {"first_name", "last_name", "is_active"}:
+            # El statement muestra el nombre del estudiante y el del colegio cuenta los activos
+            invalidate_statements(student_id, old_school_id)
+        return db_student
+    
+    @staticmethod
+    async def delete_student(db: AsyncSession, student_id: UUID) -> bool:
+        """Ver StudentService.delete_student"""
+        db_student = await AsyncStudentService.get_student(db, student_id)
+        if not db_student:
+            return False
+        
+        # Los IDs se consultan en lugar de recorrer db_student.invoices (sin lazy loads)
+        school_id = db_student.school_id
+        invoice_ids = list(await db.scalars(_STUDENT_INVOICE_IDS, {"student_id": student_id}))
+        await db.delete(db_student)
+        await db.commit()
+        invalidate_entity_snapshot("student", student_id)
+        # Sus facturas y pagos se eliminan en cascada: los totales del colegio cambian
+        invalidate_statements(student_id, school_id)
+        for invoice_id in invoice_ids:
+            bump_entity_version("invoice", invoice_id)
+        return True
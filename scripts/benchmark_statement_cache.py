@@ -0,0 +1,144 @@
+"""
+Micro-benchmark del costo por llamada de las consultas frecuentes de los servicios:
+la forma anterior (db.query(...).filter(...) construida en cada llamada) contra las
+sentencias construidas una sola vez con parámetros ligados.
+
+Sin --execute mide solo el trabajo de Python previo a la base de datos (construir la
+consulta y calcular su cache key, que es lo que SQLAlchemy usa para encontrar la
+compilación cacheada), así que no requiere PostgreSQL. Con --execute mide las llamadas
+completas contra DATABASE_URL usando filas existentes.
+Ejecutar con: python scripts/benchmark_statement_cache.py [--iterations N] [--execute]
+"""
+import sys
+import argparse
+import time
+import uuid
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+from app.models.school import School
+from app.models.student import Student
+from app.models.invoice import Invoice
+from app.models.payment import Payment
+from app.services import account_service, invoice_service, school_service, student_service
+from app.services.school_service import SchoolService
+from app.services.student_service import StudentService
+from app.services.invoice_service import InvoiceService
+from app.services.account_service import AccountService
+
+
+def _per_call_us(function, iterations: int) -> float:
+    """Microsegundos por llamada (después de una llamada de calentamiento)"""
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def _report(name: str, before: float, after: float):
+    print(f"{name:<28} {before:>10.1f} µs {after:>10.1f} µs {before / after:>8.1f}x")
+
+
+def benchmark_statement_preparation(iterations: int):
+    """Construcción de la consulta + cache key, sin base de datos"""
+    db = Session()
+    entity_id = uuid.uuid4()
+    cases = [
+        (
+            "get_school",
+            lambda: db.query(School).filter(School.id == entity_id).limit(1).statement,
+            school_service._SCHOOL_BY_ID
+        ),
+        (
+            "get_student",
+            lambda: db.query(Student).filter(Student.id == entity_id).limit(1).statement,
+            student_service._STUDENT_BY_ID
+        ),
+        (
+            "get_invoice",
+            lambda: db.query(Invoice).options(selectinload(Invoice.payments)).filter(
+                Invoice.id == entity_id
+            ).limit(1).statement,
+            invoice_service._INVOICE_WITH_PAYMENTS
+        ),
+        (
+            "student total paid",
+            lambda: db.query(func.sum(Payment.amount)).filter(Payment.student_id == entity_id).statement,
+            student_service._STUDENT_TOTAL_PAID
+        ),
+        (
+            "school statement summary",
+            account_service._school_summary_query,
+            account_service._SCHOOL_SUMMARY
+        ),
+    ]
+    
+    print(f"Preparación de la consulta ({iterations} iteraciones): antes / después")
+    for name, build, prebuilt in cases:
+        # _generate_cache_key es lo que Session.execute calcula en cada llamada
+        before = _per_call_us(lambda: build()._generate_cache_key(), iterations)
+        after = _per_call_us(lambda: prebuilt._generate_cache_key(), iterations)
+        _report(name, before, after)
+    db.close()
+
+
+def benchmark_execution(iterations: int):
+    """Llamadas completas contra DATABASE_URL"""
+    from app.core.database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        invoice = db.scalar(select(Invoice).limit(1))
+        if invoice is None:
+            print("❌ No hay facturas: cargar datos con scripts/load_sample_data.py")
+            return
+        school_id, student_id, invoice_id = invoice.school_id, invoice.student_id, invoice.id
+        cases = [
+            (
+                "get_school",
+                lambda: db.query(School).filter(School.id == school_id).first(),
+                lambda: SchoolService.get_school(db, school_id)
+            ),
+            (
+                "get_student",
+                lambda: db.query(Student).filter(Student.id == student_id).first(),
+                lambda: StudentService.get_student(db, student_id)
+            ),
+            (
+                "get_invoice",
+                lambda: db.query(Invoice).options(selectinload(Invoice.payments)).filter(
+                    Invoice.id == invoice_id
+                ).first(),
+                lambda: InvoiceService.get_invoice(db, invoice_id)
+            ),
+            (
+                "school statement summary",
+                lambda: db.execute(account_service._school_summary_query(), {"school_id": school_id}).first(),
+                lambda: AccountService.get_school_account_summary(db, school_id)
+            ),
+        ]
+        
+        print(f"Llamadas completas ({iterations} iteraciones): antes / después")
+        for name, before_call, after_call in cases:
+            # Sin identity map entre llamadas: cada una carga la fila de nuevo
+            before = _per_call_us(lambda: (before_call(), db.expunge_all()), iterations)
+            after = _per_call_us(lambda: (after_call(), db.expunge_all()), iterations)
+            _report(name, before, after)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el costo por llamada de las consultas frecuentes de los servicios")
+    parser.add_argument("--iterations", type=int, default=5000, help="Llamadas por caso")
+    parser.add_argument("--execute", action="store_true", help="Medir también las llamadas completas contra DATABASE_URL")
+    args = parser.parse_args()
+    benchmark_statement_preparation(args.iterations)
+    if args.execute:
+        print()
+        benchmark_execution(max(args.iterations // 10, 1))
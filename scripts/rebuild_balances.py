@@ -0,0 +1,41 @@
+"""
+Script para recalcular los balances de colegios y estudiantes (school_balances y student_balances).
+Los triggers los mantienen en cada escritura; este script los reconstruye en bloque
+(por ejemplo, después de una carga masiva con los triggers deshabilitados o si se detecta un desvío).
+Ejecutar con: python scripts/rebuild_balances.py [--school-id UUID]
+"""
+import sys
+import argparse
+from pathlib import Path
+from uuid import UUID
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.services.balance_service import BalanceService
+
+
+def rebuild_balances(school_id: UUID = None):
+    """Recalcula los balances (todos o los de un colegio) e informa cuántos se corrigieron"""
+    db: Session = SessionLocal()
+    
+    try:
+        print("Recalculando balances..." if school_id is None else f"Recalculando balances del colegio {school_id}...")
+        school_ids, student_ids = BalanceService.rebuild_balances(db, school_id=school_id)
+        print(f"✅ Balances de colegios creados o corregidos: {len(school_ids)}")
+        print(f"✅ Balances de estudiantes creados o corregidos: {len(student_ids)}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error recalculando balances: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula los balances de colegios y estudiantes")
+    parser.add_argument("--school-id", type=UUID, default=None, help="Recalcular solo este colegio y sus estudiantes")
+    args = parser.parse_args()
+    rebuild_balances(args.school_id)
@@ -0,0 +1,77 @@
+"""
+Script para generar las facturas mensuales de los estudiantes activos (corrida de facturación).
+Cada colegio se factura con un solo INSERT ... SELECT; repetir la corrida de un período
+solo factura a los estudiantes que falten (ver BillingService.run_billing).
+Ejecutar con: python scripts/run_billing.py --period 2026-11 --amount 150000 [--school-id UUID] [--due-day 10]
+"""
+import sys
+import argparse
+import time
+from decimal import Decimal
+from pathlib import Path
+from uuid import UUID
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.models.school import School
+from app.schemas.billing import BillingRunCreate
+from app.services.billing_service import BillingService
+
+
+def run_billing(run: BillingRunCreate, school_id: UUID = None):
+    """Factura el período en un colegio o en todos los colegios activos e informa los tiempos"""
+    db: Session = SessionLocal()
+    started = time.perf_counter()
+    
+    try:
+        if school_id is not None:
+            school_ids = [school_id]
+        else:
+            school_ids = db.scalars(select(School.id).where(School.is_active.is_(True)).order_by(School.id)).all()
+        
+        total_created = 0
+        print(f"Facturando el período {run.period} en {len(school_ids)} colegio(s)...")
+        for current_id in school_ids:
+            result = BillingService.run_billing(db, current_id, run)
+            total_created += result.created
+            numbers = f" ({result.first_invoice_number} .. {result.last_invoice_number})" if result.created else ""
+            print(
+                f"  {current_id}: {result.created} facturas creadas{numbers}, "
+                f"{result.already_billed} ya facturadas y {result.skipped} salteadas de {result.active_students} activos, "
+                f"{result.elapsed_ms:.1f} ms"
+            )
+        
+        elapsed = time.perf_counter() - started
+        print(f"✅ Facturas creadas: {total_created} en {elapsed:.2f} s")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error en la corrida de facturación: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera las facturas mensuales de los estudiantes activos")
+    parser.add_argument("--period", required=True, help="Período a facturar (YYYY-MM)")
+    parser.add_argument("--amount", type=Decimal, required=True, help="Monto de la factura de cada estudiante")
+    parser.add_argument("--school-id", type=UUID, default=None, help="Facturar solo este colegio (por defecto, todos los activos)")
+    parser.add_argument("--due-day", type=int, default=10, help="Día de vencimiento dentro del período")
+    parser.add_argument("--description", default="Mensualidad {period}", help="Descripción; {period} se reemplaza por el período")
+    parser.add_argument("--prefix", default="INV", help="Prefijo de los números de factura")
+    args = parser.parse_args()
+    
+    run_billing(
+        BillingRunCreate(
+            period=args.period,
+            total_amount=args.amount,
+            due_day=args.due_day,
+            description=args.description,
+            invoice_number_prefix=args.prefix
+        ),
+        args.school_id
+    )
@@ -1,15 +1,21 @@
 import pytest
 import os
+from fastapi import APIRouter
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
-from app.core.database import Base, get_db
+from app.api.routes import async_api_router
+from app.core import async_cache, cache, database
+from app.core.cache_backends import MemoryCacheBackend
+from app.core.config import settings
+from app.core.database import Base, get_db, get_read_db, get_statement_db
 from app.main import app
 
 # Base de datos de prueba
 # Desde el contenedor Docker, usar "db" como hostname
 TEST_DB_NAME = "mattilda_test_db"
 SQLALCHEMY_DATABASE_URL = f"postgresql://mattilda:mattilda123@db:5432/{TEST_DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://mattilda:mattilda123@db:5432/{TEST_DB_NAME}"
 # URL para conectar a postgres (base de datos por defecto) para crear la BD de tests
 ADMIN_DATABASE_URL = "postgresql://mattilda:mattilda123@db:5432/postgres"
 
@@ -46,9 +52,21 @@ def db():
         Base.metadata.drop_all(bind=engine)
 
 
-@pytest.fixture(scope="function")
-def client(db):
-    """Crea un cliente de prueba"""
+# Rutas async montadas como con ASYNC_DB_ENABLED (bajo /api/v1, antes que las síncronas)
+_async_routes = APIRouter()
+_async_routes.include_router(async_api_router, prefix="/api/v1")
+ASYNC_ROUTES = _async_routes.routes
+
+
+@pytest.fixture(scope="function", params=["sync", "async"])
+def client(request, db, monkeypatch):
+    """
+    Crea un cliente de prueba. Cada test corre dos veces: con los routers síncronos
+    (sobre la sesión db) y con los routers async, que abren sus AsyncSession con las
+    dependencies reales sobre la base de tests. En el camino async la misma base hace
+    de réplica, así que también se usan get_async_read_db y la sesión de statements
+    que elige entre primario y réplica (ConsistentReadSession).
+    """
     def override_get_db():
         try:
             yield db
@@ -56,7 +74,32 @@ def client(db):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
-    with TestClient(app) as test_client:
-        yield test_client
-    app.dependency_overrides.clear()
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_statement_db] = override_get_db
+    if request.param == "async":
+        monkeypatch.setattr(settings, "ASYNC_DATABASE_URL", ASYNC_DATABASE_URL)
+        monkeypatch.setattr(settings, "READ_REPLICA_URL", SQLALCHEMY_DATABASE_URL)
+        monkeypatch.setattr(settings, "READ_REPLICA_ASYNC_URL", ASYNC_DATABASE_URL)
+        # La posición del primario que retornan las escrituras se lee de la base de tests
+        monkeypatch.setattr(database, "engine", engine)
+        # Cada TestClient corre en su propio event loop: backend async nuevo por test
+        monkeypatch.setattr(async_cache, "_async_backend_source", None)
+        app.router.routes[:0] = ASYNC_ROUTES
+    try:
+        # El shutdown de la app cierra los engines async creados durante el test
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        if request.param == "async":
+            del app.router.routes[:len(ASYNC_ROUTES)]
+        app.dependency_overrides.clear()
+
 
+@pytest.fixture
+def memory_backend():
+    """Usa un backend de cache en memoria durante el test y restaura el anterior"""
+    previous = cache.get_cache_backend()
+    backend = MemoryCacheBackend(max_entries=100)
+    cache.set_cache_backend(backend)
+    yield backend
+    cache.set_cache_backend(previous)
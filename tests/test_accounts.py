@@ -1,5 +1,11 @@
 import pytest
 from datetime import datetime, timedelta, date
+from decimal import Decimal
+from uuid import UUID, uuid4
+from sqlalchemy import update
+from app.models.balance import SchoolBalance, StudentBalance
+from app.services.account_service import AccountService
+from app.services.balance_service import BalanceService
 
 
 def test_school_account_status(client, db):
@@ -95,3 +101,144 @@ def test_student_account_status(client, db):
     assert data["total_invoices"] == 1
     assert len(data["invoices"]) <= data["limit"]
 
+
+
+def test_student_statement_cache_invalidation(client, db):
+    """Test que el statement cacheado se invalida al registrar facturas y pagos"""
+    school_response = client.post("/api/v1/schools/", json={"name": "Colegio Cache", "is_active": True})
+    school_id = school_response.json()["id"]
+    student_response = client.post("/api/v1/students/", json={
+        "first_name": "Ana",
+        "last_name": "Cache",
+        "school_id": school_id,
+        "is_active": True
+    })
+    student_id = student_response.json()["id"]
+    
+    due_date = (date.today() + timedelta(days=30)).isoformat()
+    invoice_data = {
+        "invoice_number": "INV-CACHE-001",
+        "school_id": school_id,
+        "student_id": student_id,
+        "total_amount": "400.00",
+        "issue_date": date.today().isoformat(),
+        "due_date": due_date,
+        "status": "pending"
+    }
+    invoice_id = client.post("/api/v1/invoices/", json=invoice_data).json()["id"]
+    
+    # Primera lectura: se calcula y se guarda en cache
+    response = client.get(f"/api/v1/students/{student_id}/statement")
+    assert float(response.json()["total_pending"]) == 400.00
+    
+    # Un pago debe invalidar el statement cacheado (nueva generación)
+    client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "150.00"})
+    response = client.get(f"/api/v1/students/{student_id}/statement")
+    assert float(response.json()["total_paid"]) == 150.00
+    assert float(response.json()["total_pending"]) == 250.00
+    
+    # Una nueva factura también invalida el statement del colegio
+    invoice_data["invoice_number"] = "INV-CACHE-002"
+    client.post("/api/v1/invoices/", json=invoice_data)
+    response = client.get(f"/api/v1/schools/{school_id}/statement")
+    assert float(response.json()["total_invoiced"]) == 800.00
+    assert response.json()["total_invoices"] == 2
+    
+    # Actualizar el monto y eliminar una factura ajusta los totales cacheados
+    client.put(f"/api/v1/invoices/{invoice_id}", json={"total_amount": "500.00"})
+    response = client.get(f"/api/v1/schools/{school_id}/statement")
+    assert float(response.json()["total_invoiced"]) == 900.00
+    
+    client.delete(f"/api/v1/invoices/{invoice_id}")
+    response = client.get(f"/api/v1/students/{student_id}/statement")
+    data = response.json()
+    assert float(data["total_invoiced"]) == 400.00
+    assert float(data["total_paid"]) == 0.00
+    assert data["total_invoices"] == 1
+    assert len(data["invoices"]) == 1
+
+
+def test_account_status_single_snapshot(client, db):
+    """Test que el estado de cuenta calculado por el servicio arma totales, encabezado y página"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Snapshot", "is_active": True}).json()["id"]
+    student_id = client.post("/api/v1/students/", json={
+        "first_name": "Ana",
+        "last_name": "Gómez",
+        "school_id": school_id,
+        "is_active": True
+    }).json()["id"]
+    due_date = (date.today() + timedelta(days=30)).isoformat()
+    for i in range(3):
+        invoice_id = client.post("/api/v1/invoices/", json={
+            "invoice_number": f"INV-SNAP-{i}",
+            "school_id": school_id,
+            "student_id": student_id,
+            "total_amount": "100.00",
+            "due_date": due_date
+        }).json()["id"]
+    client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "40.00"})
+    
+    status = AccountService.get_student_account_status(db, UUID(student_id), skip=1, limit=1)
+    assert status.student_name == "Ana Gómez"
+    assert status.school_name == "Colegio Snapshot"
+    assert status.total_invoiced == Decimal("300.00")
+    assert status.total_paid == Decimal("40.00")
+    assert status.total_pending == Decimal("260.00")
+    assert status.total_invoices == 3
+    assert len(status.invoices) == 1
+    
+    school_status = AccountService.get_school_account_status(db, UUID(school_id))
+    assert school_status.total_students == 1
+    assert school_status.total_paid == Decimal("40.00")
+    assert len(school_status.invoices) == 3
+    
+    with pytest.raises(ValueError):
+        AccountService.get_school_account_summary(db, uuid4())
+
+
+def test_balances_follow_writes_and_rebuild(client, db):
+    """Test que los triggers mantienen los balances y que el rebuild corrige desvíos"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Balances", "is_active": True}).json()["id"]
+    student_ids = [
+        client.post("/api/v1/students/", json={
+            "first_name": f"Estudiante {i}",
+            "last_name": "Balance",
+            "school_id": school_id,
+            "is_active": True
+        }).json()["id"]
+        for i in range(2)
+    ]
+    due_date = (date.today() + timedelta(days=30)).isoformat()
+    invoice_id = client.post("/api/v1/invoices/", json={
+        "invoice_number": "INV-BAL-1",
+        "school_id": school_id,
+        "student_id": student_ids[0],
+        "total_amount": "100.00",
+        "due_date": due_date
+    }).json()["id"]
+    client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "40.00"})
+    client.put(f"/api/v1/invoices/{invoice_id}", json={"total_amount": "150.00"})
+    client.put(f"/api/v1/students/{student_ids[1]}", json={"is_active": False})
+    
+    db.expire_all()
+    school_balance = db.get(SchoolBalance, UUID(school_id))
+    assert school_balance.total_invoiced == Decimal("150.00")
+    assert school_balance.total_paid == Decimal("40.00")
+    assert school_balance.total_invoices == 1
+    assert school_balance.active_students == 1
+    student_balance = db.get(StudentBalance, UUID(student_ids[0]))
+    assert student_balance.total_invoiced == Decimal("150.00")
+    assert student_balance.total_paid == Decimal("40.00")
+    
+    # Un desvío (ej: carga masiva sin triggers) se corrige con el rebuild
+    db.execute(update(SchoolBalance).values(total_paid=0))
+    db.commit()
+    school_ids, changed_students = BalanceService.rebuild_balances(db, school_id=UUID(school_id))
+    assert school_ids == [UUID(school_id)]
+    assert changed_students == []
+    assert BalanceService.rebuild_balances(db) == ([], [])
+    
+    summary = AccountService.get_school_account_summary(db, UUID(school_id))
+    assert summary.total_paid == Decimal("40.00")
+    assert summary.total_pending == Decimal("110.00")
+
@@ -0,0 +1,632 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from pydantic import BaseModel
+from app.core import async_cache, cache
+from app.core.cache import (
+    CachedBody, LocalCache, InMemoryInvalidationBroker, InvalidationBatch, StatementWrite,
+    get_or_compute_statement, get_or_compute_statement_page, get_or_compute_statement_cursor_page,
+    get_cache_stats, get_entity_snapshot, get_or_compute_count, invalidate_entity_snapshot
+)
+from app.core.cache_backends import CircuitBreaker, MemoryCacheBackend
+from app.core.config import settings
+from app.core.etag import etag_matches
+from app.core.pagination import InvalidCursorError
+from app.schemas.school import School as SchoolSchema
+from app.services.account_service import STATEMENT_KEYSET
+
+
+class FakeClock:
+    """Reloj controlable para probar expiraciones sin esperar"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_cache_lru_eviction():
+    """Test que el cache local desaloja la entrada menos usada al superar su tamaño"""
+    cache = LocalCache(max_entries=2, ttl=60)
+    cache.set("a", 1, tag="school:1")
+    cache.set("b", 2, tag="school:1")
+
+    # "a" pasa a ser la más reciente
+    assert cache.get("a") == 1
+    cache.set("c", 3, tag="school:2")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+
+
+def test_local_cache_ttl_expiration():
+    """Test que las entradas del cache local expiran por TTL"""
+    clock = FakeClock()
+    cache = LocalCache(max_entries=10, ttl=5, clock=clock)
+    cache.set("a", 1, tag="school:1")
+
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_local_cache_rejects_values_invalidated_while_loading():
+    """Test que no se guarda un valor leído antes de una invalidación"""
+    cache = LocalCache(max_entries=10, ttl=60)
+    mark = cache.invalidation_mark()
+    cache.invalidate_tag("student:1")
+
+    cache.set("student:1:statement:skip:0:limit:10", "viejo", tag="student:1", invalidation_mark=mark)
+    assert cache.get("student:1:statement:skip:0:limit:10") is None
+
+
+def test_invalidation_broadcast_between_workers():
+    """Test que una invalidación publicada vacía el cache local de todos los workers"""
+    broker = InMemoryInvalidationBroker()
+    worker_a = LocalCache(max_entries=10, ttl=60)
+    worker_b = LocalCache(max_entries=10, ttl=60)
+    broker.subscribe(worker_a.invalidate_tag)
+    broker.subscribe(worker_b.invalidate_tag)
+
+    for worker in (worker_a, worker_b):
+        worker.set("school:1:statement:skip:0:limit:10", "statement", tag="school:1")
+        worker.set("school:2:statement:skip:0:limit:10", "otro", tag="school:2")
+
+    broker.publish("school:1")
+
+    for worker in (worker_a, worker_b):
+        assert worker.get("school:1:statement:skip:0:limit:10") is None
+        assert worker.get("school:2:statement:skip:0:limit:10") == "otro"
+
+
+def test_single_flight_coalesces_concurrent_misses():
+    """Test que varios misses concurrentes del mismo statement ejecutan un solo recálculo"""
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"total_invoiced": "100.00"}
+
+    school_id = uuid.uuid4()
+    coalesced_before = get_cache_stats()["single_flight"]["coalesced"]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [
+            pool.submit(get_or_compute_statement, "school", school_id, "skip:0:limit:10", compute)
+            for _ in range(4)
+        ]
+        # Esperar a que los otros tres requests estén esperando al primero
+        deadline = time.monotonic() + 5
+        while get_cache_stats()["single_flight"]["coalesced"] - coalesced_before < 3:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert all(json.loads(result.json_bytes()) == {"total_invoiced": "100.00"} for result in results)
+
+
+class FakeBackgroundTasks:
+    """Registra las tareas en background en lugar de ejecutarlas"""
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, function, *args):
+        self.tasks.append((function, args))
+
+
+def _age_cache(monkeypatch, seconds: float):
+    """Hace que los valores guardados hasta ahora tengan la antigüedad indicada"""
+    class FakeTime:
+        def __getattr__(self, name):
+            return getattr(time, name)
+
+        def time(self):
+            return time.time() + seconds
+
+    monkeypatch.setattr(cache, "time", FakeTime())
+
+
+def test_stale_while_revalidate_schedules_one_refresh(memory_backend, monkeypatch):
+    """Test que un valor dentro de la ventana SWR se sirve y se refresca una vez en background"""
+    school_id = uuid.uuid4()
+    get_or_compute_statement("school", school_id, "summary:test", lambda: {"version": 1})
+    _age_cache(monkeypatch, settings.STATEMENT_CACHE_SOFT_TTL + settings.STATEMENT_CACHE_STALE_WHILE_REVALIDATE / 2)
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"version": 2}
+
+    stale_before = get_cache_stats()["stale"]["stale_while_revalidate"]
+    background_tasks = FakeBackgroundTasks()
+    served = get_or_compute_statement("school", school_id, "summary:test", compute, background_tasks)
+
+    assert json.loads(served.json_bytes()) == {"version": 1}
+    assert calls == []
+    assert len(background_tasks.tasks) == 1
+    assert get_cache_stats()["stale"]["stale_while_revalidate"] == stale_before + 1
+
+    function, args = background_tasks.tasks[0]
+    function(*args)
+    monkeypatch.undo()
+    assert len(calls) == 1
+    cached, _ = cache.get_cached_statement("school", school_id, "summary:test")
+    assert json.loads(cached.json_bytes()) == {"version": 2}
+
+
+def test_stale_if_error_serves_expired_value(memory_backend, monkeypatch):
+    """Test que pasada la ventana SWR, si el recálculo falla se sirve el valor vencido"""
+    school_id = uuid.uuid4()
+    get_or_compute_statement("school", school_id, "summary:test", lambda: {"version": 1})
+    _age_cache(monkeypatch, settings.STATEMENT_CACHE_SOFT_TTL + settings.STATEMENT_CACHE_STALE_WHILE_REVALIDATE + 1)
+
+    def compute():
+        raise RuntimeError("base de datos caída")
+
+    stale_before = get_cache_stats()["stale"]["stale_if_error"]
+    served = get_or_compute_statement("school", school_id, "summary:test", compute, FakeBackgroundTasks())
+
+    assert json.loads(served.json_bytes()) == {"version": 1}
+    assert get_cache_stats()["stale"]["stale_if_error"] == stale_before + 1
+
+
+def test_miss_with_failing_compute_propagates(memory_backend):
+    """Test que sin valor cacheado el error del recálculo se propaga"""
+    def compute():
+        raise RuntimeError("base de datos caída")
+
+    with pytest.raises(RuntimeError):
+        get_or_compute_statement("school", uuid.uuid4(), "summary:test", compute, FakeBackgroundTasks())
+
+
+def test_background_refresh_without_lock_does_not_strand_waiters(memory_backend, monkeypatch):
+    """Test que un refresh en background no queda registrado como recálculo si otro worker tiene el lock"""
+    school_id = uuid.uuid4()
+    get_or_compute_statement("school", school_id, "summary:test", lambda: {"version": 1})
+    _, token = cache.get_cached_statement("school", school_id, "summary:test")
+    flight_key = f"{cache._statement_prefix('school', school_id)}{token.generation}:summary:test"
+
+    # Otro worker tiene el lock; un request que se uniera al refresh mientras se intenta
+    # tomarlo se quedaría sin resultado
+    registered_while_locking = []
+
+    def lock_taken_by_other_worker(backend, lock_key):
+        registered_while_locking.append(flight_key in cache._inflight)
+        return None
+
+    monkeypatch.setattr(cache, "_acquire_recompute_lock", lock_taken_by_other_worker)
+    calls = []
+    cache._refresh_statement("school", school_id, "summary:test", lambda: calls.append(1), token)
+
+    assert registered_while_locking == [False]
+    assert calls == []
+    assert flight_key not in cache._inflight
+
+
+class FakeInvoice(BaseModel):
+    number: int
+
+
+def test_statement_page_is_sliced_from_invoice_blocks():
+    """Test que una página que cruza bloques se arma recortando los bloques que la cubren"""
+    block_size = settings.STATEMENT_PAGE_BLOCK_SIZE
+    invoices = [FakeInvoice(number=i) for i in range(block_size * 3)]
+    requested_blocks = []
+
+    def compute_invoices(offset, size):
+        requested_blocks.append((offset, size))
+        return invoices[offset:offset + size]
+
+    skip = block_size - 2
+    body = get_or_compute_statement_page(
+        "school", uuid.uuid4(), skip, 5,
+        lambda: {"total_invoiced": "100.00", "total_invoices": len(invoices)},
+        compute_invoices
+    )
+
+    statement = json.loads(body.json_bytes())
+    assert statement["total_invoices"] == len(invoices)
+    assert [invoice["number"] for invoice in statement["invoices"]] == list(range(skip, skip + 5))
+    assert statement["skip"] == skip
+    assert statement["limit"] == 5
+    assert requested_blocks == [(0, block_size), (block_size, block_size)]
+
+
+class FakeStatementInvoice(BaseModel):
+    id: uuid.UUID
+    due_date: date
+    created_at: datetime
+
+
+def test_statement_pages_continue_from_cursor(memory_backend):
+    """Test que las páginas del statement traen next_cursor y la página por cursor continúa desde él"""
+    block_size = settings.STATEMENT_PAGE_BLOCK_SIZE
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    invoices = sorted(
+        (
+            FakeStatementInvoice(id=uuid.uuid4(), due_date=date(2026, 1, 1) + timedelta(days=i // 3), created_at=created_at)
+            for i in range(block_size + 3)
+        ),
+        key=lambda invoice: (invoice.due_date, invoice.created_at, invoice.id),
+        reverse=True
+    )
+    summary_calls = []
+
+    def compute_summary():
+        summary_calls.append(1)
+        return {"total_invoiced": "100.00", "total_invoices": len(invoices)}
+
+    def compute_invoices_after(cursor, size):
+        after = tuple(STATEMENT_KEYSET.decode(cursor))
+        return [
+            invoice for invoice in invoices
+            if (invoice.due_date, invoice.created_at, invoice.id) < after
+        ][:size]
+
+    school_id = uuid.uuid4()
+    # La última página de un bloque lee una fila del siguiente para saber si hay más
+    skip = block_size - 5
+    body = get_or_compute_statement_page(
+        "school", school_id, skip, 5, compute_summary,
+        lambda offset, size: invoices[offset:offset + size], keyset=STATEMENT_KEYSET
+    )
+    statement = json.loads(body.json_bytes())
+    assert [invoice["id"] for invoice in statement["invoices"]] == [str(invoice.id) for invoice in invoices[skip:block_size]]
+    last = invoices[block_size - 1]
+    assert STATEMENT_KEYSET.decode(statement["next_cursor"]) == [last.due_date, last.created_at, last.id]
+
+    body = get_or_compute_statement_cursor_page(
+        "school", school_id, statement["next_cursor"], 5, compute_summary, compute_invoices_after, STATEMENT_KEYSET
+    )
+    statement = json.loads(body.json_bytes())
+    assert [invoice["id"] for invoice in statement["invoices"]] == [str(invoice.id) for invoice in invoices[block_size:]]
+    assert statement["skip"] == 0
+    assert statement["next_cursor"] is None
+    assert body.etag is None
+    # Los totales salen de la misma entrada de cache que la paginación por offset
+    assert len(summary_calls) == 1
+
+    with pytest.raises(InvalidCursorError):
+        get_or_compute_statement_cursor_page(
+            "school", school_id, "no-es-un-cursor", 5, compute_summary, compute_invoices_after, STATEMENT_KEYSET
+        )
+
+
+def test_cached_body_serves_gzip_as_is():
+    """Test que un cuerpo comprimido se envía sin descomprimir a clientes que aceptan gzip"""
+    statement = {"invoices": [{"invoice_number": f"INV-{i}", "total_amount": "100.00"} for i in range(200)]}
+    body = CachedBody.from_value(statement)
+    assert body.compressed
+
+    response = body.as_response("gzip, deflate")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.body == body.content
+    assert json.loads(gzip.decompress(response.body)) == statement
+
+    response = body.as_response("")
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"] == "application/json"
+    assert json.loads(response.body) == statement
+
+
+def test_circuit_breaker_opens_and_probes_with_backoff():
+    """Test que el circuit breaker se abre tras varios fallos y sondea con backoff exponencial"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, failure_window=10, backoff_base=1, backoff_max=4, clock=clock)
+
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    # Vence el backoff: un solo request sondea
+    clock.now = 1.0
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+    # El sondeo falla: el backoff se duplica
+    breaker.record_failure()
+    clock.now = 2.5
+    assert not breaker.allow_request()
+    clock.now = 3.0
+    assert breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_circuit_breaker_ignores_old_failures():
+    """Test que los fallos fuera de la ventana no abren el circuito"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, failure_window=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 6.0
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_memory_backend_is_bounded_and_expires():
+    """Test que el backend en memoria desaloja por LRU y respeta el TTL de cada clave"""
+    clock = FakeClock()
+    backend = MemoryCacheBackend(max_entries=2, clock=clock)
+    backend.set("a", b"1", ttl=5)
+    backend.set("b", b"2")
+    assert backend.get("a") == b"1"
+    backend.set("c", b"3")
+
+    assert backend.mget(["a", "b", "c"]) == [b"1", None, b"3"]
+    assert backend.stats()["evictions"] == 1
+    assert not backend.set("a", b"otro", nx=True)
+
+    clock.now = 5.0
+    assert backend.get("a") is None
+
+
+def test_statement_totals_apply_write_deltas(memory_backend):
+    """Test que una escritura aplica su delta a los totales cacheados sin recalcularlos"""
+    student_id, school_id = uuid.uuid4(), uuid.uuid4()
+    totals = {"total_invoiced": "100.00", "total_paid": "0.00", "total_pending": "100.00", "total_invoices": 1}
+    calls = []
+
+    def compute_summary():
+        calls.append(1)
+        return dict(totals)
+
+    get_or_compute_statement("student", student_id, "summary", compute_summary)
+    with StatementWrite(student_id, school_id) as write:
+        write.add(total_paid="30.50")
+
+    statement = json.loads(get_or_compute_statement("student", student_id, "summary", compute_summary).json_bytes())
+    assert len(calls) == 1
+    assert statement["total_paid"] == "30.50"
+    assert statement["total_pending"] == "69.50"
+
+
+def test_statement_totals_not_stored_during_write(memory_backend):
+    """Test que no se guardan totales calculados mientras hay una escritura en curso"""
+    student_id, school_id = uuid.uuid4(), uuid.uuid4()
+    summary = {"total_invoiced": "100.00", "total_paid": "0.00", "total_invoices": 1}
+
+    with StatementWrite(student_id, school_id) as write:
+        # Esta lectura puede ver o no el commit: su resultado no debe cachearse
+        get_or_compute_statement("student", student_id, "summary", lambda: summary)
+        write.add(total_paid="10.00")
+
+    cached, _ = cache.get_cached_statement("student", student_id, "summary")
+    assert cached is None
+
+
+def test_entity_snapshot_is_cached_until_invalidated(memory_backend):
+    """Test que el snapshot de una entidad se lee de la base solo tras una invalidación"""
+    school_id = uuid.uuid4()
+    rows = [{"id": school_id, "name": "Colegio A", "created_at": "2024-01-01T00:00:00"}]
+    loads = []
+
+    def load():
+        loads.append(1)
+        return rows[-1]
+
+    assert get_entity_snapshot("school", school_id, SchoolSchema, load).name == "Colegio A"
+    assert get_entity_snapshot("school", school_id, SchoolSchema, load).name == "Colegio A"
+    assert len(loads) == 1
+
+    rows.append({**rows[0], "name": "Colegio B"})
+    invalidate_entity_snapshot("school", school_id)
+    assert get_entity_snapshot("school", school_id, SchoolSchema, load).name == "Colegio B"
+    assert len(loads) == 2
+
+
+def test_exact_count_is_cached_per_filter_signature(memory_backend):
+    """Test que el total exacto se cuenta una vez por combinación de filtros"""
+    counts = []
+
+    def compute(total):
+        def count():
+            counts.append(total)
+            return total
+        return count
+
+    assert get_or_compute_count("students", {"school_id": None, "is_active": True}, compute(7)) == 7
+    assert get_or_compute_count("students", {"is_active": True, "school_id": None}, compute(99)) == 7
+    assert get_or_compute_count("students", {"school_id": None, "is_active": False}, compute(3)) == 3
+    assert get_or_compute_count("schools", {"is_active": True}, compute(2)) == 2
+    assert counts == [7, 3, 2]
+
+
+def test_entity_snapshot_read_before_write_is_not_served(memory_backend):
+    """Test que un snapshot leído de la base antes de una escritura no queda cacheado"""
+    school_id = uuid.uuid4()
+    row = {"id": school_id, "name": "Viejo", "created_at": "2024-01-01T00:00:00"}
+
+    def load_then_write():
+        # La escritura (y su invalidación) ocurre mientras se leía la fila vieja
+        invalidate_entity_snapshot("school", school_id)
+        return row
+
+    get_entity_snapshot("school", school_id, SchoolSchema, load_then_write)
+    calls = []
+    get_entity_snapshot("school", school_id, SchoolSchema, lambda: calls.append(1) or row)
+    assert calls == [1]
+
+
+def test_invalidation_batch_defers_and_coalesces(memory_backend):
+    """Test que las invalidaciones de un request se aplican juntas al terminarlo"""
+    student_id, school_id = uuid.uuid4(), uuid.uuid4()
+    summary = {"total_invoiced": "100.00", "total_paid": "0.00", "total_invoices": 1}
+    get_or_compute_statement("school", school_id, "summary", lambda: summary)
+    get_or_compute_statement("school", school_id, "skip:0:limit:10", lambda: {"invoices": []})
+    applied = []
+    apply_invalidations = memory_backend.apply_invalidations
+
+    def record(*args):
+        applied.append(args)
+        apply_invalidations(*args)
+
+    memory_backend.apply_invalidations = record
+    batch = InvalidationBatch()
+    with batch:
+        with StatementWrite(student_id, school_id) as write:
+            write.add(total_paid="40.00")
+        cache.invalidate_school_statement(school_id)
+        cache.invalidate_school_statement(school_id)
+        # Nada se aplica hasta terminar el request
+        cached, _ = cache.get_cached_statement("school", school_id, "skip:0:limit:10")
+        assert cached is not None
+    batch.flush()
+
+    assert len(applied) == 1
+    writes, generations, versions = applied[0][:3]
+    assert len(writes) == 2 and len(generations) == 1 and versions == []
+    cached, _ = cache.get_cached_statement("school", school_id, "skip:0:limit:10")
+    assert cached is None
+
+
+def test_statement_etag_follows_generation(memory_backend):
+    """Test que el ETag de un statement coincide con el vigente hasta la siguiente escritura"""
+    school_id = uuid.uuid4()
+    body = get_or_compute_statement_page(
+        "school", school_id, 0, 10, lambda: {"total_invoiced": "0.00", "total_invoices": 0}, lambda offset, size: []
+    )
+    assert body.etag == cache.get_statement_etag("school", school_id, 0, 10)
+    assert body.etag != cache.get_statement_etag("school", school_id, 10, 10)
+    gzip_etag = body.etag[:-1] + '-gzip"'
+    assert etag_matches(f'"otro", W/{gzip_etag}', body.etag) == gzip_etag
+
+    with StatementWrite(uuid.uuid4(), school_id) as write:
+        write.add(total_invoiced="10.00", total_invoices=1)
+    assert etag_matches(body.etag, cache.get_statement_etag("school", school_id, 0, 10)) is None
+
+
+def test_async_statement_write_applies_deltas(memory_backend):
+    """Test que la escritura async registra la escritura en curso y aplica su delta a los totales"""
+    student_id, school_id = uuid.uuid4(), uuid.uuid4()
+    totals = {"total_invoiced": "100.00", "total_paid": "0.00", "total_pending": "100.00", "total_invoices": 1}
+    calls = []
+
+    def compute_summary():
+        calls.append(1)
+        return dict(totals)
+
+    async def write_payment():
+        async with async_cache.StatementWrite(student_id, school_id) as write:
+            # Durante la escritura no se guardan totales calculados
+            get_or_compute_statement("school", school_id, "summary", compute_summary)
+            write.add(total_paid="30.50")
+
+    get_or_compute_statement("student", student_id, "summary", compute_summary)
+    asyncio.run(write_payment())
+
+    statement = json.loads(get_or_compute_statement("student", student_id, "summary", compute_summary).json_bytes())
+    assert len(calls) == 2
+    assert statement["total_paid"] == "30.50"
+    assert statement["total_pending"] == "69.50"
+    cached, _ = cache.get_cached_statement("school", school_id, "summary")
+    assert cached is None
+
+
+def test_async_single_flight_cancellation(memory_backend):
+    """Test que cancelar a quien espera un recálculo no lo repite, y que si desiste el dueño se recalcula"""
+    calls = []
+    release = None
+
+    async def compute():
+        calls.append(1)
+        await release.wait()
+        return {"version": len(calls)}
+
+    async def read(school_id):
+        return await async_cache.get_or_compute_statement_page(
+            "school", school_id, 0, 10, compute, lambda offset, size: asyncio.sleep(0, [])
+        )
+
+    async def cancel_waiter():
+        nonlocal release
+        release = asyncio.Event()
+        school_id = uuid.uuid4()
+        owner = asyncio.create_task(read(school_id))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(read(school_id))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        try:
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(waiter, timeout=2)
+        finally:
+            release.set()
+        await asyncio.wait_for(owner, timeout=2)
+
+    asyncio.run(cancel_waiter())
+    assert calls == [1]
+
+    async def cancel_owner():
+        nonlocal release
+        release = asyncio.Event()
+        school_id = uuid.uuid4()
+        owner = asyncio.create_task(read(school_id))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(read(school_id))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.wait_for(waiter, timeout=2)
+
+    calls.clear()
+    body = asyncio.run(cancel_owner())
+    assert calls == [1, 1]
+    assert json.loads(body.json_bytes())["version"] == 2
+
+
+def test_async_statement_page_shares_cache_with_sync_path(memory_backend):
+    """Test que el camino async coalesce recálculos y comparte el cache con el síncrono"""
+    school_id = uuid.uuid4()
+    calls = []
+
+    async def compute_summary():
+        calls.append("summary")
+        await asyncio.sleep(0.01)
+        return {"total_invoiced": "10.00", "total_invoices": 1}
+
+    async def compute_invoices(offset, size):
+        calls.append("invoices")
+        await asyncio.sleep(0.01)
+        return []
+
+    async def read_page():
+        return await async_cache.get_or_compute_statement_page(
+            "school", school_id, 0, 10, compute_summary, compute_invoices
+        )
+
+    async def read_concurrently():
+        return await asyncio.gather(read_page(), read_page())
+
+    first, second = asyncio.run(read_concurrently())
+    assert calls == ["summary", "invoices"]
+    assert first.content == second.content
+
+    body = get_or_compute_statement_page(
+        "school", school_id, 0, 10, lambda: pytest.fail("recalculado"), lambda offset, size: pytest.fail("recalculado")
+    )
+    assert json.loads(body.json_bytes())["total_invoiced"] == "10.00"
+    assert body.etag == asyncio.run(async_cache.get_statement_etag("school", school_id, 0, 10))
@@ -0,0 +1,206 @@
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+import uuid
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+import app.main as main
+from app.api.routes import schools as school_routes
+from app.core import database
+from app.core.config import settings
+from app.core.database import (
+    DB_POSITION_COOKIE, DB_POSITION_HEADER, ConsistentReadSession, get_db, get_read_db, get_read_position
+)
+from app.schemas.school import School as SchoolSchema
+
+
+class FakeConnection:
+    """Conexión que responde siempre el mismo escalar (o falla) y registra las consultas"""
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def scalar(self, statement, params=None):
+        self.engine.calls.append(params)
+        if isinstance(self.engine.result, Exception):
+            raise self.engine.result
+        return self.engine.result
+
+
+class FakeEngine:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeSession:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _request(headers=None):
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw_headers})
+
+
+def _session_factory(dependency, request):
+    """Nombre de la sesión que eligió la dependency para el request (y verifica que la cierra)"""
+    generator = dependency(request)
+    db = next(generator)
+    generator.close()
+    assert db.closed
+    return db.name
+
+
+def _with_replica(monkeypatch, caught_up):
+    """Simula una réplica configurada y registra las posiciones consultadas"""
+    positions = []
+
+    def replica_caught_up(position):
+        positions.append(position)
+        return caught_up
+
+    monkeypatch.setattr(settings, "READ_REPLICA_URL", "postgresql://replica/db")
+    monkeypatch.setattr(database, "_replica_caught_up", replica_caught_up)
+    monkeypatch.setattr(database, "ReadSessionLocal", lambda: FakeSession("replica"))
+    monkeypatch.setattr(database, "SessionLocal", lambda: FakeSession("primary"))
+    return positions
+
+
+def test_read_position_from_header_or_cookie():
+    """Test que la posición del cliente se lee del header o la cookie y se valida"""
+    assert get_read_position(_request({DB_POSITION_HEADER: "0/16B3748"})) == "0/16B3748"
+    assert get_read_position(_request({"Cookie": f"{DB_POSITION_COOKIE}=1A/FF"})) == "1A/FF"
+    assert get_read_position(_request({DB_POSITION_HEADER: "0/1; DROP TABLE"})) is None
+    assert get_read_position(_request()) is None
+
+
+def test_get_read_db_uses_replica_without_position(monkeypatch):
+    """Test que sin posición del cliente las lecturas van a la réplica sin consultarla"""
+    positions = _with_replica(monkeypatch, caught_up=False)
+
+    assert _session_factory(get_read_db, _request()) == "replica"
+    assert positions == []
+
+
+def test_get_read_db_uses_primary_until_replica_catches_up(monkeypatch):
+    """Test read-your-writes: con una posición que la réplica no aplicó se lee del primario"""
+    positions = _with_replica(monkeypatch, caught_up=False)
+    request = _request({DB_POSITION_HEADER: "0/16B3748"})
+
+    assert _session_factory(get_read_db, request) == "primary"
+    assert positions == ["0/16B3748"]
+
+    monkeypatch.setattr(database, "_replica_caught_up", lambda position: True)
+    assert _session_factory(get_read_db, request) == "replica"
+
+
+def test_get_read_db_without_replica_ignores_position(monkeypatch):
+    """Test que sin réplica configurada no se consulta la posición"""
+    positions = _with_replica(monkeypatch, caught_up=False)
+    monkeypatch.setattr(settings, "READ_REPLICA_URL", None)
+
+    assert _session_factory(get_read_db, _request({DB_POSITION_HEADER: "0/1"})) == "replica"
+    assert positions == []
+
+
+def test_replica_caught_up(monkeypatch):
+    """Test que la posición se compara en la réplica y un error se trata como atrasada"""
+    replica = FakeEngine(True)
+    monkeypatch.setattr(database, "read_engine", replica)
+    assert database._replica_caught_up("0/10") is True
+    assert replica.calls == [{"position": "0/10"}]
+
+    replica.result = False
+    assert database._replica_caught_up("0/10") is False
+
+    replica.result = ConnectionError("réplica caída")
+    assert database._replica_caught_up("0/10") is False
+
+
+def test_consistent_session_uses_replica_only_when_caught_up():
+    """Test que la sesión de statements lee de la réplica solo si aplicó la posición actual del primario"""
+    primary = FakeEngine("0/2000")
+    replica = FakeEngine(True)
+    session = ConsistentReadSession(primary_bind=primary, replica_bind=replica)
+
+    assert session.get_bind() is replica
+    assert replica.calls == [{"position": "0/2000"}]
+    # La elección se hace una vez por sesión
+    assert session.get_bind() is replica
+    assert len(primary.calls) == 1
+
+    replica.result = False
+    assert ConsistentReadSession(primary_bind=primary, replica_bind=replica).get_bind() is primary
+
+    replica.result = ConnectionError("réplica caída")
+    assert ConsistentReadSession(primary_bind=primary, replica_bind=replica).get_bind() is primary
+
+
+def _school_client(monkeypatch, replica_url, position="0/3000"):
+    """Cliente sin base de datos: el alta del colegio y la posición del primario se simulan"""
+    school = SchoolSchema(
+        id=uuid.uuid4(), name="Colegio", is_active=True, created_at=datetime.now(timezone.utc)
+    )
+    monkeypatch.setattr(settings, "READ_REPLICA_URL", replica_url)
+    monkeypatch.setattr(main, "get_primary_position", lambda: position)
+    monkeypatch.setattr(school_routes.SchoolService, "create_school", lambda db, data: school)
+    monkeypatch.setitem(main.app.dependency_overrides, get_db, lambda: None)
+    return TestClient(main.app)
+
+
+def test_write_response_carries_primary_position(monkeypatch):
+    """Test que una escritura exitosa retorna la posición del primario en header y cookie"""
+    client = _school_client(monkeypatch, "postgresql://replica/db")
+
+    response = client.post("/api/v1/schools/", json={"name": "Colegio"})
+    assert response.status_code == 201
+    assert response.headers[DB_POSITION_HEADER] == "0/3000"
+    cookie = SimpleCookie(response.headers["set-cookie"])[DB_POSITION_COOKIE]
+    assert cookie.value == "0/3000"
+    assert cookie["httponly"]
+    assert cookie["max-age"] == str(settings.READ_YOUR_WRITES_TTL)
+    # La cookie vuelve en las lecturas siguientes y se reconoce como posición
+    assert get_read_position(_request({"Cookie": response.headers["set-cookie"].split(";")[0]})) == "0/3000"
+
+
+def test_position_not_added_to_reads_errors_or_without_replica(monkeypatch):
+    """Test que la posición no se agrega a lecturas, escrituras fallidas ni sin réplica"""
+    client = _school_client(monkeypatch, "postgresql://replica/db")
+
+    response = client.get("/health")
+    assert DB_POSITION_HEADER not in response.headers
+
+    response = client.post("/api/v1/schools/", json={})
+    assert response.status_code == 422
+    assert DB_POSITION_HEADER not in response.headers
+    assert "set-cookie" not in response.headers
+
+    client = _school_client(monkeypatch, None)
+    response = client.post("/api/v1/schools/", json={"name": "Colegio"})
+    assert response.status_code == 201
+    assert DB_POSITION_HEADER not in response.headers
+
+
+def test_position_omitted_when_primary_unavailable(monkeypatch):
+    """Test que si no se puede leer la posición del primario la escritura responde igual"""
+    client = _school_client(monkeypatch, "postgresql://replica/db")
+
+    def failing_position():
+        raise ConnectionError("primario caído")
+
+    monkeypatch.setattr(main, "get_primary_position", failing_position)
+    response = client.post("/api/v1/schools/", json={"name": "Colegio"})
+    assert response.status_code == 201
+    assert DB_POSITION_HEADER not in response.headers
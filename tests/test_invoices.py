@@ -1,3 +1,4 @@
+import json
 import pytest
 from datetime import datetime, timedelta, date
 from decimal import Decimal
@@ -45,6 +46,38 @@ def test_create_invoice(client, db):
     assert len(data["payments"]) == 0
 
 
+def test_get_invoice_etag(client, db, memory_backend):
+    """Test que el ETag de una factura se crea solo si existe y cambia al registrar un pago"""
+    missing_id = "00000000-0000-0000-0000-000000000001"
+    response = client.get(f"/api/v1/invoices/{missing_id}")
+    assert response.status_code == 404
+    assert memory_backend.get(f"invoice:{missing_id}:version") is None
+    
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio ETag", "is_active": True}).json()["id"]
+    student_id = client.post("/api/v1/students/", json={
+        "first_name": "Ana", "last_name": "Gómez", "school_id": school_id, "is_active": True
+    }).json()["id"]
+    invoice_id = client.post("/api/v1/invoices/", json={
+        "invoice_number": "INV-ETAG",
+        "school_id": school_id,
+        "student_id": student_id,
+        "total_amount": "1000.00",
+        "issue_date": date.today().isoformat(),
+        "due_date": (date.today() + timedelta(days=30)).isoformat()
+    }).json()["id"]
+    
+    # La primera lectura crea la versión; desde la siguiente la respuesta lleva ETag
+    client.get(f"/api/v1/invoices/{invoice_id}")
+    etag = client.get(f"/api/v1/invoices/{invoice_id}").headers["etag"]
+    response = client.get(f"/api/v1/invoices/{invoice_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    
+    client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "100.00"})
+    response = client.get(f"/api/v1/invoices/{invoice_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
 def test_create_payment(client, db):
     """Test para crear un pago"""
     # Crear colegio, estudiante y factura
@@ -111,6 +144,146 @@ def test_create_payment(client, db):
     assert float(payments_data["items"][0]["amount"]) == 300.00
 
 
+def test_update_and_delete_invoice(client, db):
+    """Test que editar una factura retorna sus pagos y eliminarla actualiza el statement"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True}).json()["id"]
+    student_id = client.post("/api/v1/students/", json={
+        "first_name": "Juan", "last_name": "Pérez", "school_id": school_id, "is_active": True
+    }).json()["id"]
+    invoice_id = client.post("/api/v1/invoices/", json={
+        "invoice_number": "INV-001",
+        "school_id": school_id,
+        "student_id": student_id,
+        "total_amount": "100.00",
+        "due_date": (date.today() + timedelta(days=30)).isoformat()
+    }).json()["id"]
+    client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "100.00"})
+    
+    # Al subir el monto la factura pagada vuelve a quedar parcial, y la respuesta trae sus pagos
+    response = client.put(f"/api/v1/invoices/{invoice_id}", json={"total_amount": "150.00"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "partial"
+    assert len(data["payments"]) == 1
+    statement = client.get(f"/api/v1/students/{student_id}/statement").json()
+    assert float(statement["total_pending"]) == 50.00
+    
+    response = client.delete(f"/api/v1/invoices/{invoice_id}")
+    assert response.status_code == 204
+    assert client.get(f"/api/v1/invoices/{invoice_id}").status_code == 404
+    assert client.get(f"/api/v1/invoices/{invoice_id}/payments").status_code == 404
+    statement = client.get(f"/api/v1/students/{student_id}/statement").json()
+    assert float(statement["total_invoiced"]) == 0.00
+    assert statement["total_invoices"] == 0
+    assert client.delete(f"/api/v1/invoices/{invoice_id}").status_code == 404
+
+
+def test_payment_updates_paid_amount_and_status(client, db):
+    """Test para el paid_amount denormalizado y el estado derivado al registrar pagos"""
+    school_response = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True})
+    school_id = school_response.json()["id"]
+    
+    student_data = {
+        "first_name": "Juan",
+        "last_name": "Pérez",
+        "school_id": school_id,
+        "is_active": True
+    }
+    student_response = client.post("/api/v1/students/", json=student_data)
+    student_id = student_response.json()["id"]
+    
+    invoice_data = {
+        "invoice_number": "INV-PAID-001",
+        "school_id": school_id,
+        "student_id": student_id,
+        "total_amount": "500.00",
+        "issue_date": date.today().isoformat(),
+        "due_date": (date.today() + timedelta(days=30)).isoformat(),
+        "status": "pending"
+    }
+    invoice_response = client.post("/api/v1/invoices/", json=invoice_data)
+    invoice_id = invoice_response.json()["id"]
+    assert Decimal(invoice_response.json()["paid_amount"]) == Decimal("0.00")
+    
+    # Pago parcial
+    response = client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "200.00", "payment_method": "cash"})
+    assert response.status_code == 201
+    data = client.get(f"/api/v1/invoices/{invoice_id}").json()
+    assert Decimal(data["paid_amount"]) == Decimal("200.00")
+    assert data["status"] == "partial"
+    
+    # Un pago que excede el pendiente se rechaza sin modificar la factura
+    response = client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "300.01", "payment_method": "cash"})
+    assert response.status_code == 400
+    assert "300.00" in response.json()["detail"]
+    
+    # Pago del resto
+    response = client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "300.00", "payment_method": "cash"})
+    assert response.status_code == 201
+    data = client.get(f"/api/v1/invoices/{invoice_id}").json()
+    assert Decimal(data["paid_amount"]) == Decimal("500.00")
+    assert data["status"] == "paid"
+    
+    # Subir el total recalcula el estado a partir de paid_amount
+    response = client.put(f"/api/v1/invoices/{invoice_id}", json={"total_amount": "800.00"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "partial"
+    
+    # Factura inexistente
+    response = client.post(
+        "/api/v1/invoices/00000000-0000-0000-0000-000000000000/payments",
+        json={"amount": "10.00", "payment_method": "cash"}
+    )
+    assert response.status_code == 404
+
+
+def test_invoice_lists_return_payment_summary(client, db):
+    """Test del resumen de pagos en listados y statements, con la lista completa solo con include=payments"""
+    school_response = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True})
+    school_id = school_response.json()["id"]
+    
+    student_data = {
+        "first_name": "Juan",
+        "last_name": "Pérez",
+        "school_id": school_id,
+        "is_active": True
+    }
+    student_response = client.post("/api/v1/students/", json=student_data)
+    student_id = student_response.json()["id"]
+    
+    invoice_data = {
+        "invoice_number": "INV-SUM-001",
+        "school_id": school_id,
+        "student_id": student_id,
+        "total_amount": "500.00",
+        "issue_date": date.today().isoformat(),
+        "due_date": (date.today() + timedelta(days=30)).isoformat(),
+        "status": "pending"
+    }
+    invoice_id = client.post("/api/v1/invoices/", json=invoice_data).json()["id"]
+    for amount in ("100.00", "150.00"):
+        client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": amount, "payment_method": "cash"})
+    
+    # Por defecto: solo el resumen
+    invoice = client.get(f"/api/v1/invoices/?student_id={student_id}").json()["items"][0]
+    assert invoice["payments"] is None
+    assert invoice["payment_summary"]["count"] == 2
+    assert Decimal(invoice["payment_summary"]["total_amount"]) == Decimal("250.00")
+    assert invoice["payment_summary"]["last_payment_date"] is not None
+    
+    statement_invoice = client.get(f"/api/v1/students/{student_id}/statement").json()["invoices"][0]
+    assert statement_invoice["payments"] is None
+    assert statement_invoice["payment_summary"]["count"] == 2
+    
+    # include=payments agrega la lista completa
+    invoice = client.get(f"/api/v1/invoices/?student_id={student_id}&include=payments").json()["items"][0]
+    assert len(invoice["payments"]) == 2
+    assert invoice["payment_summary"]["count"] == 2
+    
+    statement_invoice = client.get(f"/api/v1/students/{student_id}/statement?include=payments").json()["invoices"][0]
+    assert len(statement_invoice["payments"]) == 2
+
+
 def test_account_status(client, db):
     """Test para obtener estado de cuenta de estudiante"""
     # Crear colegio y estudiante
@@ -267,3 +440,153 @@ def test_get_invoices_pagination(client, db):
     assert data["has_next"] == True
     assert data["has_previous"] == False
 
+
+
+def test_get_invoices_sorted_by_due_date(client, db):
+    """Test para listar facturas de un colegio ordenadas por vencimiento, recorriendo con cursor"""
+    school_response = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True})
+    school_id = school_response.json()["id"]
+    
+    student_data = {
+        "first_name": "Juan",
+        "last_name": "Pérez",
+        "school_id": school_id,
+        "is_active": True
+    }
+    student_response = client.post("/api/v1/students/", json=student_data)
+    student_id = student_response.json()["id"]
+    
+    for days in (30, 10, 20):
+        invoice_data = {
+            "invoice_number": f"INV-DUE-{days}",
+            "school_id": school_id,
+            "student_id": student_id,
+            "total_amount": "100.00",
+            "issue_date": date.today().isoformat(),
+            "due_date": (date.today() + timedelta(days=days)).isoformat(),
+            "status": "pending"
+        }
+        client.post("/api/v1/invoices/", json=invoice_data)
+    
+    data = client.get(f"/api/v1/invoices/?school_id={school_id}&sort=due_date&limit=2").json()
+    assert [invoice["invoice_number"] for invoice in data["items"]] == ["INV-DUE-30", "INV-DUE-20"]
+    assert data["total"] == 3
+    
+    data = client.get(f"/api/v1/invoices/?school_id={school_id}&sort=due_date&limit=2&cursor={data['next_cursor']}").json()
+    assert [invoice["invoice_number"] for invoice in data["items"]] == ["INV-DUE-10"]
+    assert data["has_next"] == False
+    
+    # El cursor de un orden no sirve para otro
+    first_page = client.get(f"/api/v1/invoices/?school_id={school_id}&limit=1").json()
+    response = client.get(f"/api/v1/invoices/?school_id={school_id}&sort=due_date&cursor={first_page['next_cursor']}")
+    assert response.status_code == 400
+
+
+def test_create_invoices_bulk(client, db):
+    """Test de la carga masiva de facturas (array JSON y NDJSON) con errores por fila"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True}).json()["id"]
+    other_school_id = client.post("/api/v1/schools/", json={"name": "Otro Colegio", "is_active": True}).json()["id"]
+    student_data = {
+        "first_name": "Juan",
+        "last_name": "Pérez",
+        "school_id": school_id,
+        "is_active": True
+    }
+    student_id = client.post("/api/v1/students/", json=student_data).json()["id"]
+    
+    def invoice(number, **overrides):
+        return {
+            "invoice_number": number,
+            "school_id": school_id,
+            "student_id": student_id,
+            "total_amount": "100.00",
+            "issue_date": date.today().isoformat(),
+            "due_date": (date.today() + timedelta(days=30)).isoformat(),
+            **overrides
+        }
+    
+    rows = [
+        invoice("BULK-001"),
+        invoice("BULK-002"),
+        invoice("BULK-001"),  # Duplicada dentro del lote
+        invoice("BULK-003", school_id=other_school_id),  # Colegio distinto al del estudiante
+        invoice("BULK-004", total_amount="0"),  # Falla la validación del schema
+    ]
+    response = client.post("/api/v1/invoices/bulk", json=rows)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 2
+    assert data["failed"] == 3
+    assert [error["index"] for error in data["errors"]] == [2, 3, 4]
+    
+    # NDJSON: las líneas inválidas se informan y BULK-001 ya existe en la base
+    body = "\n".join([json.dumps(invoice("BULK-005")), "{no es json", json.dumps(invoice("BULK-001"))])
+    response = client.post(
+        "/api/v1/invoices/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 1
+    assert [error["index"] for error in data["errors"]] == [1, 2]
+    
+    listing = client.get(f"/api/v1/invoices/?student_id={student_id}").json()
+    assert listing["total"] == 3
+    
+    assert client.post("/api/v1/invoices/bulk", json={"invoice_number": "X"}).status_code == 400
+
+
+def test_import_payments(client, db):
+    """Test de la importación de pagos de conciliación bancaria (CSV y NDJSON)"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True}).json()["id"]
+    student_data = {
+        "first_name": "Juan",
+        "last_name": "Pérez",
+        "school_id": school_id,
+        "is_active": True
+    }
+    student_id = client.post("/api/v1/students/", json=student_data).json()["id"]
+    for number in ("IMP-001", "IMP-002"):
+        client.post("/api/v1/invoices/", json={
+            "invoice_number": number,
+            "school_id": school_id,
+            "student_id": student_id,
+            "total_amount": "100.00",
+            "issue_date": date.today().isoformat(),
+            "due_date": (date.today() + timedelta(days=30)).isoformat()
+        })
+    
+    body = "\n".join([
+        "invoice_number,payment_reference,amount",
+        "IMP-001,TX-1,100.00",
+        ",IMP-002,40.00",  # Sin invoice_number: la referencia es el número de factura
+        "IMP-999,TX-2,10.00",  # Factura inexistente
+        "IMP-002,TX-3,80.00",  # Excede el pendiente
+    ])
+    response = client.post(
+        f"/api/v1/invoices/payments/import?school_id={school_id}", content=body, headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["rows"] == 4
+    assert data["matched"] == 2
+    assert Decimal(data["total_amount"]) == Decimal("140.00")
+    assert [row["index"] for row in data["unmatched_rows"]] == [2, 3]
+    
+    invoices = {
+        invoice["invoice_number"]: invoice
+        for invoice in client.get(f"/api/v1/invoices/?student_id={student_id}").json()["items"]
+    }
+    assert invoices["IMP-001"]["status"] == "paid"
+    assert invoices["IMP-002"]["status"] == "partial"
+    assert Decimal(invoices["IMP-002"]["paid_amount"]) == Decimal("40.00")
+    
+    # Reimportar una referencia bancaria no duplica el pago
+    row = {"invoice_number": "IMP-001", "payment_reference": "TX-1", "amount": "100.00"}
+    response = client.post(
+        f"/api/v1/invoices/payments/import?school_id={school_id}",
+        content=json.dumps(row),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.json()["matched"] == 0
+    assert response.json()["unmatched"] == 1
+    assert "already imported" in response.json()["unmatched_rows"][0]["detail"]
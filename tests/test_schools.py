@@ -1,5 +1,6 @@
 import pytest
 import uuid
+from datetime import date, timedelta
 from app.models.school import School
 from app.schemas.school import SchoolCreate
 
@@ -44,6 +45,24 @@ def test_get_school(client, db):
     assert data["name"] == school_data["name"]
 
 
+def test_get_school_etag(client, db, memory_backend):
+    """Test que GET de un colegio responde 304 mientras no cambia y 200 después de editarlo"""
+    create_response = client.post("/api/v1/schools/", json={"name": "Colegio ETag", "is_active": True})
+    school_id = create_response.json()["id"]
+    
+    response = client.get(f"/api/v1/schools/{school_id}")
+    etag = response.headers["etag"]
+    
+    response = client.get(f"/api/v1/schools/{school_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    
+    client.put(f"/api/v1/schools/{school_id}", json={"name": "Colegio Renombrado"})
+    response = client.get(f"/api/v1/schools/{school_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Colegio Renombrado"
+    assert response.headers["etag"] != etag
+
+
 def test_get_schools(client, db):
     """Test para listar colegios con paginación"""
     # Crear algunos colegios
@@ -73,6 +92,57 @@ def test_get_schools(client, db):
     assert data["has_previous"] == False
 
 
+def test_get_schools_cursor_pagination(client, db):
+    """Test para recorrer el listado de colegios con cursor en lugar de skip"""
+    for i in range(5):
+        client.post("/api/v1/schools/", json={"name": f"Colegio {i}", "is_active": True})
+    
+    expected = [school["id"] for school in client.get("/api/v1/schools/?skip=0&limit=10").json()["items"]]
+    
+    # Recorrer de a 2 con el next_cursor de cada página
+    seen = []
+    response = client.get("/api/v1/schools/?limit=2")
+    data = response.json()
+    assert data["has_previous"] == False
+    while True:
+        seen.extend(school["id"] for school in data["items"])
+        if not data["has_next"]:
+            break
+        response = client.get(f"/api/v1/schools/?limit=2&cursor={data['next_cursor']}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["has_previous"] == True
+        assert data["skip"] == 0
+    
+    assert seen == expected
+    assert data["next_cursor"] is None
+    
+    # Cursor inválido
+    response = client.get("/api/v1/schools/?limit=2&cursor=no-es-un-cursor")
+    assert response.status_code == 400
+
+
+def test_get_schools_total_mode(client, db):
+    """Test de los modos de total del listado de colegios"""
+    for i in range(3):
+        client.post("/api/v1/schools/", json={"name": f"Colegio {i}", "is_active": True})
+    
+    data = client.get("/api/v1/schools/?limit=2&total_mode=none").json()
+    assert data["total"] is None
+    assert data["total_mode"] == "none"
+    assert len(data["items"]) == 2
+    assert data["has_next"] == True
+    
+    data = client.get("/api/v1/schools/?limit=2&total_mode=exact").json()
+    assert data["total"] == 3
+    
+    data = client.get("/api/v1/schools/?limit=2&total_mode=estimate").json()
+    assert isinstance(data["total"], int)
+    
+    response = client.get("/api/v1/schools/?total_mode=otro")
+    assert response.status_code == 422
+
+
 def test_update_school(client, db):
     """Test para actualizar un colegio"""
     # Crear un colegio
@@ -110,9 +180,118 @@ def test_delete_school(client, db):
     assert get_response.status_code == 404
 
 
+def test_delete_school_with_students(client, db):
+    """Test que eliminar un colegio elimina en cascada sus estudiantes, facturas y pagos"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio a Eliminar", "is_active": True}).json()["id"]
+    student_id = client.post("/api/v1/students/", json={
+        "first_name": "Juan", "last_name": "Pérez", "school_id": school_id, "is_active": True
+    }).json()["id"]
+    invoice_id = client.post("/api/v1/invoices/", json={
+        "invoice_number": "INV-DEL-1",
+        "school_id": school_id,
+        "student_id": student_id,
+        "total_amount": "100.00",
+        "due_date": (date.today() + timedelta(days=30)).isoformat()
+    }).json()["id"]
+    client.post(f"/api/v1/invoices/{invoice_id}/payments", json={"amount": "40.00"})
+    # Cachear el statement antes de eliminar
+    assert client.get(f"/api/v1/students/{student_id}/statement").status_code == 200
+    
+    response = client.delete(f"/api/v1/schools/{school_id}")
+    assert response.status_code == 204
+    
+    assert client.get(f"/api/v1/schools/{school_id}").status_code == 404
+    assert client.get(f"/api/v1/students/{student_id}").status_code == 404
+    assert client.get(f"/api/v1/invoices/{invoice_id}").status_code == 404
+    assert client.get(f"/api/v1/students/{student_id}/statement").status_code == 404
+    assert client.delete(f"/api/v1/schools/{school_id}").status_code == 404
+
+
 def test_invalid_uuid_format(client, db):
     """Test para verificar que se rechazan UUIDs inválidos"""
     # Intentar obtener con un ID inválido
     response = client.get("/api/v1/schools/invalid-uuid")
     assert response.status_code == 422  # Unprocessable Entity - error de validación
 
+
+
+def test_billing_run(client, db):
+    """Test de la corrida de facturación mensual: una factura por estudiante activo, idempotente por período"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True}).json()["id"]
+    for index, is_active in enumerate([True, True, False]):
+        client.post("/api/v1/students/", json={
+            "first_name": f"Estudiante {index}",
+            "last_name": "Test",
+            "school_id": school_id,
+            "is_active": is_active
+        })
+    
+    run = {"period": "2026-11", "total_amount": "150.00"}
+    response = client.post(f"/api/v1/schools/{school_id}/billing-runs", json=run)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["active_students"] == 2
+    assert data["created"] == 2
+    assert data["first_invoice_number"] == "INV-2026-11-000001"
+    assert data["last_invoice_number"] == "INV-2026-11-000002"
+    
+    # Repetir el período no duplica facturas; un estudiante nuevo continúa la secuencia
+    client.post("/api/v1/students/", json={
+        "first_name": "Estudiante Nuevo",
+        "last_name": "Test",
+        "school_id": school_id,
+        "is_active": True
+    })
+    data = client.post(f"/api/v1/schools/{school_id}/billing-runs", json=run).json()
+    assert data["created"] == 1
+    assert data["already_billed"] == 2
+    assert data["skipped"] == 0
+    assert data["first_invoice_number"] == "INV-2026-11-000003"
+    
+    statement = client.get(f"/api/v1/schools/{school_id}/statement").json()
+    assert statement["total_invoices"] == 3
+    assert float(statement["total_invoiced"]) == 450.00
+    
+    assert client.post(f"/api/v1/schools/{uuid.uuid4()}/billing-runs", json=run).status_code == 404
+    assert client.post(f"/api/v1/schools/{school_id}/billing-runs", json={**run, "period": "2026-13"}).status_code == 422
+
+
+def test_billing_run_continues_after_manual_invoice_numbers(client, db):
+    """Test que la corrida no reutiliza números del período cargados a mano en el colegio"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True}).json()["id"]
+    student_ids = [
+        client.post("/api/v1/students/", json={
+            "first_name": f"Estudiante {index}",
+            "last_name": "Test",
+            "school_id": school_id,
+            "is_active": True
+        }).json()["id"]
+        for index in range(2)
+    ]
+    
+    # Factura manual (sin billing_period) con un número del formato de la corrida
+    response = client.post("/api/v1/invoices/", json={
+        "invoice_number": "INV-2026-11-000001",
+        "school_id": school_id,
+        "student_id": student_ids[0],
+        "total_amount": "80.00",
+        "description": "Matrícula",
+        "issue_date": "2026-11-01",
+        "due_date": "2026-11-10",
+        "status": "pending"
+    })
+    assert response.status_code == 201
+    
+    response = client.post(f"/api/v1/schools/{school_id}/billing-runs", json={"period": "2026-11", "total_amount": "150.00"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["active_students"] == 2
+    assert data["created"] == 2
+    assert data["already_billed"] == 0
+    assert data["skipped"] == 0
+    assert data["first_invoice_number"] == "INV-2026-11-000002"
+    assert data["last_invoice_number"] == "INV-2026-11-000003"
+    
+    statement = client.get(f"/api/v1/schools/{school_id}/statement").json()
+    assert statement["total_invoices"] == 3
+    assert float(statement["total_invoiced"]) == 380.00
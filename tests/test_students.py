@@ -49,6 +49,43 @@ def test_get_student(client, db):
     assert data["first_name"] == student_data["first_name"]
 
 
+def test_delete_student(client, db):
+    """Test que eliminar un estudiante elimina sus facturas y pagos y actualiza el statement del colegio"""
+    school_id = client.post("/api/v1/schools/", json={"name": "Colegio Test", "is_active": True}).json()["id"]
+    student_ids = [
+        client.post("/api/v1/students/", json={
+            "first_name": f"Estudiante {i}", "last_name": "Test", "school_id": school_id, "is_active": True
+        }).json()["id"]
+        for i in range(2)
+    ]
+    due_date = (date.today() + timedelta(days=30)).isoformat()
+    invoice_ids = [
+        client.post("/api/v1/invoices/", json={
+            "invoice_number": f"INV-{i}",
+            "school_id": school_id,
+            "student_id": student_id,
+            "total_amount": "100.00",
+            "due_date": due_date
+        }).json()["id"]
+        for i, student_id in enumerate(student_ids)
+    ]
+    client.post(f"/api/v1/invoices/{invoice_ids[0]}/payments", json={"amount": "30.00"})
+    statement = client.get(f"/api/v1/schools/{school_id}/statement").json()
+    assert float(statement["total_invoiced"]) == 200.00
+    
+    response = client.delete(f"/api/v1/students/{student_ids[0]}")
+    assert response.status_code == 204
+    
+    assert client.get(f"/api/v1/students/{student_ids[0]}").status_code == 404
+    assert client.get(f"/api/v1/invoices/{invoice_ids[0]}").status_code == 404
+    assert client.get(f"/api/v1/invoices/{invoice_ids[1]}").status_code == 200
+    statement = client.get(f"/api/v1/schools/{school_id}/statement").json()
+    assert float(statement["total_invoiced"]) == 100.00
+    assert float(statement["total_paid"]) == 0.00
+    assert statement["total_invoices"] == 1
+    assert client.delete(f"/api/v1/students/{student_ids[0]}").status_code == 404
+
+
 def test_get_students_by_school(client, db):
     """Test para filtrar estudiantes por colegio"""
     # Crear colegio